@@ -0,0 +1,83 @@
+"""
+Per-invoice PDF rendering latency.
+
+Compares rendering with the stylesheet inlined in the HTML, which WeasyPrint parses on every
+call together with a fresh font configuration, against the pre-parsed stylesheet and shared
+font configuration used by ``generate.create_pdf_invoice``. Each run starts with cold caches,
+so the one-time setup cost is included and amortized over the number of invoices.
+
+Usage:
+    uv run python benchmarks/render_invoice.py
+"""
+
+import time
+from importlib.resources import files
+
+from weasyprint import HTML
+
+from invoice_ocr import generate as gen
+from invoice_ocr.schema import Address, Company, Invoice, InvoiceItem
+
+INVOICE_COUNTS = (1, 10, 1000)
+
+ADDRESS = Address(
+    address_line1="789 Elm St",
+    address_line2="Apt 5B",
+    city="Toronto",
+    province="ON",
+    postal_code="M5A 1A1",
+)
+
+INVOICE = Invoice(
+    invoice_number="INV-1000",
+    supplier=Company(
+        company_id="SUPP1",
+        company_name="Supplier Company",
+        address_billing=ADDRESS,
+        phone_number="+1-555-123-4567",
+        email="billing@supplier.com",
+        website="https://supplier.com",
+    ),
+    customer=Company(
+        company_id="CUST1",
+        company_name="Customer Company",
+        address_billing=ADDRESS,
+        phone_number="+1-555-765-4321",
+        email="ap@customer.com",
+        website="https://customer.com",
+    ),
+    line_items=[
+        InvoiceItem(item_sku=f"ITEM{i}", item_info=f"Item {i}", quantity=i + 1, unit_price=9.99)
+        for i in range(10)
+    ],
+)
+
+
+def create_pdf_invoice_inline(invoice: Invoice) -> bytes:
+    """Renders an invoice the way it was done before the stylesheet was shared."""
+    css = files("invoice_ocr").joinpath("invoice.css").read_text()
+    html = gen.render_html_invoice(invoice).replace("</head>", f"<style>{css}</style></head>")
+    return HTML(string=html).write_pdf()
+
+
+def main() -> None:
+    renderers = {
+        "inline": create_pdf_invoice_inline,
+        "shared": gen.create_pdf_invoice,
+    }
+
+    for count in INVOICE_COUNTS:
+        for name, render in renderers.items():
+            gen.get_invoice_stylesheet.cache_clear()
+            gen.get_font_config.cache_clear()
+
+            start = time.perf_counter()
+            for _ in range(count):
+                render(INVOICE)
+            elapsed = time.perf_counter() - start
+
+            print(f"{name:>6} {count:>5} invoice(s): {elapsed / count * 1000:8.2f} ms/invoice")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Company and invoice item search latency over synthetic rows.
+
+Copies the ``companies``, ``postal_addresses`` and ``invoice_items`` tables into a scratch
+schema, with their indexes but without the defaults that share the application sequences. Fills
+them with synthetic rows and times ``db.QUERY_FIND_COMPANIES`` and ``db.QUERY_FIND_INVOICE_ITEMS``
+without and then with the trigram search indexes. The scratch schema is dropped afterwards, so
+the benchmark never touches the application tables.
+
+Usage:
+    uv run python benchmarks/search.py [ROWS]
+"""
+
+import statistics
+import sys
+import time
+
+import psycopg
+from psycopg import sql
+
+from invoice_ocr import db
+
+ROWS = 1_000_000
+SCHEMA = "benchmark_search"
+REPEATS = 5
+LIMIT = 20
+
+QUERIES = ("Acme", "555-0142", "3f2a9c", "zzzz")
+
+QUERY_FILL_COMPANIES = """
+    INSERT INTO companies (id, company_id, company_name, phone_number, email, website)
+    SELECT i,
+           upper(lpad(to_hex(i), 5, '0')),
+           initcap(substr(md5(i::text), 1, 6)) || ' ' || (ARRAY['Acme', 'Global', 'Northern'])[i %% 3 + 1],
+           '+1-555-' || lpad((i %% 10000)::text, 4, '0'),
+           'contact@' || substr(md5(i::text), 7, 8) || '.com',
+           'https://' || substr(md5(i::text), 7, 8) || '.com'
+    FROM generate_series(1, %(rows)s) AS i;
+"""
+
+QUERY_FILL_INVOICE_ITEMS = """
+    INSERT INTO invoice_items (id, item_sku, item_info, quantity, unit_price, created_at)
+    SELECT i,
+           upper(lpad(to_hex(i), 5, '0')),
+           (ARRAY['Acme', 'Steel', 'Copper'])[i %% 3 + 1] || ' part ' || substr(md5(i::text), 1, 10),
+           i %% 100 + 1,
+           (i %% 100000) / 100.0,
+           now() - i * interval '1 second'
+    FROM generate_series(1, %(rows)s) AS i;
+"""
+
+QUERY_SEARCH_INDEXES = """
+    SELECT indexname, indexdef FROM pg_indexes
+    WHERE schemaname = %(schema)s AND indexdef LIKE '%%gin_trgm_ops%%';
+"""
+
+
+def time_search(cur: psycopg.Cursor, query: sql.Composable | str, search: str) -> list[float]:
+    """Returns the latencies in milliseconds of repeated searches."""
+    params = db.search_params(query=search, limit=LIMIT, offset=0)
+    latencies = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        cur.execute(query=query, params=params)
+        cur.fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(cur: psycopg.Cursor, label: str) -> None:
+    """Prints the median and worst search latency for every query."""
+    searches = {"company": db.QUERY_FIND_COMPANIES, "invoice-item": db.QUERY_FIND_INVOICE_ITEMS}
+    for name, query in searches.items():
+        for search in QUERIES:
+            latencies = time_search(cur, query, search)
+            print(
+                f"{label:>8} {name:>12} {search!r:>12}: "
+                f"p50 {statistics.median(latencies):9.2f} ms  max {max(latencies):9.2f} ms"
+            )
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    schema = sql.Identifier(SCHEMA)
+
+    with psycopg.connect(db.POSTGRES_CONNINFO, autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(schema))
+        cur.execute(sql.SQL("CREATE SCHEMA {}").format(schema))
+        cur.execute(sql.SQL("SET search_path TO {}, public").format(schema))
+        try:
+            for table in ("postal_addresses", "companies", "invoice_items"):
+                cur.execute(
+                    sql.SQL(
+                        "CREATE TABLE {} (LIKE public.{} INCLUDING ALL EXCLUDING DEFAULTS)"
+                    ).format(sql.Identifier(table), sql.Identifier(table))
+                )
+
+            cur.execute(QUERY_SEARCH_INDEXES, {"schema": SCHEMA})
+            indexes = cur.fetchall()
+            for index, _ in indexes:
+                cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(index)))
+
+            start = time.perf_counter()
+            cur.execute(QUERY_FILL_COMPANIES, {"rows": rows})
+            cur.execute(QUERY_FILL_INVOICE_ITEMS, {"rows": rows})
+            cur.execute("ANALYZE companies, invoice_items")
+            print(f"Filled {rows} rows per table in {time.perf_counter() - start:.1f} s")
+
+            report(cur, "seqscan")
+
+            start = time.perf_counter()
+            for _, indexdef in indexes:
+                cur.execute(indexdef)
+            cur.execute("ANALYZE companies, invoice_items")
+            print(f"Built the trigram indexes in {time.perf_counter() - start:.1f} s")
+
+            report(cur, "trigram")
+
+        finally:
+            cur.execute(sql.SQL("DROP SCHEMA {} CASCADE").format(schema))
+
+
+if __name__ == "__main__":
+    main()
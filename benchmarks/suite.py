@@ -0,0 +1,315 @@
+"""
+Benchmark suite of the render, database and generation hot paths.
+
+Reports the throughput and the p50 and p99 latency of:
+- Model validation of companies and invoices
+- ``generate.create_pdf_invoice``, skipped when WeasyPrint cannot load its system libraries
+- Offline generation with ``synthetic.generate_companies``, its ``synthetic.company_rows`` and
+  ``synthetic.invoice_item_rows`` bulk path, and ``generate.create_companies`` against an
+  instant local model, which measures the agent pipeline overhead
+- ``db.get_company``, ``db.get_random_companies_batch``, ``db.find_company`` and
+  ``db.find_invoice_item`` over synthetic tables of every requested size
+
+Database benchmarks copy the ``postal_addresses``, ``companies`` and ``invoice_items`` tables,
+with their indexes, into a scratch schema placed first on the ``search_path`` of the
+application pool, so the ``db`` functions run unchanged and the application tables are never
+touched. The scratch schema is dropped afterwards. Start the local Postgres container with
+``make docker-start db-schema`` first.
+
+Results can be stored as a JSON baseline, and later runs compared against it. The comparison
+exits with status 1 when a p50 latency regressed by more than the tolerance.
+
+Usage:
+    uv run python benchmarks/suite.py [--rows 1000 100000 1000000] [--save [FILE]] [--compare [FILE]]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+SCHEMA = "benchmark_suite"
+
+# The application pool reads PGOPTIONS when it connects, so set it before importing db
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA},public"
+
+import logfire
+import psycopg
+from psycopg import sql
+
+from invoice_ocr import db, synthetic
+from invoice_ocr import generate as gen
+from invoice_ocr.schema import Company, Invoice
+
+ROWS = (1_000, 100_000, 1_000_000)
+BASELINE = Path(__file__).with_name("baseline.json")
+TOLERANCE = 0.2
+"""Relative p50 slowdown over the baseline reported as a regression"""
+
+ID_EXPRESSION = """
+    chr(65 + (i / 175760) %% 26) || chr(65 + (i / 6760) %% 26) || chr(65 + (i / 260) %% 26)
+    || chr(65 + (i / 10) %% 26) || (i %% 10)
+"""
+"""SQL of the i-th ``^[A-Z]{4}[0-9]$`` company ID or item SKU, see ``benchmark_id``"""
+
+QUERY_FILL_POSTAL_ADDRESSES = """
+    INSERT INTO postal_addresses (id, address_line1, address_line2, city, province, postal_code, country)
+    SELECT i, i || ' Main St', '', 'Toronto', 'ON', 'M5A 1A1', 'Canada'
+    FROM generate_series(1, %(rows)s) AS i;
+"""
+
+QUERY_FILL_COMPANIES = f"""
+    INSERT INTO companies (id, company_id, company_name, address_billing, phone_number, email, website)
+    SELECT i,
+           {ID_EXPRESSION},
+           initcap(substr(md5(i::text), 1, 6)) || ' ' || (ARRAY['Acme', 'Global', 'Northern'])[i %% 3 + 1],
+           i,
+           '+1-555-' || lpad((i %% 10000)::text, 4, '0'),
+           'contact@' || substr(md5(i::text), 7, 8) || '.com',
+           'https://' || substr(md5(i::text), 7, 8) || '.com'
+    FROM generate_series(1, %(rows)s) AS i;
+"""
+
+QUERY_FILL_INVOICE_ITEMS = f"""
+    INSERT INTO invoice_items (id, item_sku, item_info, quantity, unit_price, created_at)
+    SELECT i,
+           {ID_EXPRESSION},
+           (ARRAY['Acme', 'Steel', 'Copper'])[i %% 3 + 1] || ' part ' || substr(md5(i::text), 1, 10),
+           i %% 100 + 1,
+           (i %% 100000) / 100.0,
+           now() - i * interval '1 second'
+    FROM generate_series(1, %(rows)s) AS i;
+"""
+
+
+def benchmark_id(i: int) -> str:
+    """Returns the i-th company ID or item SKU of the synthetic tables."""
+    letters = "".join(chr(65 + i // (10 * 26**power) % 26) for power in (3, 2, 1, 0))
+    return f"{letters}{i % 10}"
+
+
+def measure(
+    name: str, run: Callable[[], object], repeats: int, items: int = 1, warmup: int = 1
+) -> dict:
+    """Times ``repeats`` calls of ``run`` after ``warmup`` untimed calls.
+
+    Args:
+        name: Benchmark name, unique within a run.
+        run: The operation to time.
+        repeats: Number of timed calls.
+        items: Number of items each call processes, for the throughput.
+        warmup: Number of untimed calls filling the caches first.
+
+    Returns:
+        dict: The name, the p50 and p99 latency in milliseconds and the items per second.
+    """
+    for _ in range(warmup):
+        run()
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    result = {
+        "name": name,
+        "p50_ms": round(statistics.median(latencies), 4),
+        "p99_ms": round(percentiles[98], 4),
+        "items_per_s": round(items * repeats / (sum(latencies) / 1000), 1),
+    }
+    print(
+        f"{name:<40} p50 {result['p50_ms']:10.3f} ms  p99 {result['p99_ms']:10.3f} ms  "
+        f"{result['items_per_s']:12.1f} items/s"
+    )
+    return result
+
+
+def bench_models() -> list[dict]:
+    companies = [company.model_dump() for company in synthetic.generate_companies(1000, seed=1)]
+    invoice = Invoice(
+        invoice_number="INV-1000",
+        supplier=companies[0],
+        customer=companies[1],
+        line_items=[item.model_dump() for item in synthetic.generate_invoice_items(10, seed=1)],
+    ).model_dump()
+
+    return [
+        measure(
+            "validate 1000 companies",
+            lambda: [Company.model_validate(company) for company in companies],
+            repeats=50,
+            items=len(companies),
+        ),
+        measure("validate invoice", lambda: Invoice.model_validate(invoice), repeats=1000),
+    ]
+
+
+def bench_render() -> list[dict]:
+    try:
+        import weasyprint  # noqa: F401
+    except OSError as error:
+        print(f"Skipping render benchmarks, WeasyPrint is not usable: {error}".splitlines()[0])
+        return []
+
+    companies = list(synthetic.generate_companies(2, seed=1))
+    invoice = Invoice(
+        invoice_number="INV-1000",
+        supplier=companies[0],
+        customer=companies[1],
+        line_items=list(synthetic.generate_invoice_items(10, seed=1)),
+    )
+    return [measure("create_pdf_invoice", lambda: gen.create_pdf_invoice(invoice), repeats=50)]
+
+
+def bench_generation() -> list[dict]:
+    from pydantic_ai.messages import ModelResponse, ToolCallPart
+    from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+    companies = iter(synthetic.generate_companies(1_000_000, seed=2))
+
+    def respond(messages: list, info: AgentInfo) -> ModelResponse:
+        args = next(companies).model_dump()
+        return ModelResponse(parts=[ToolCallPart.from_raw_args(info.result_tools[0].name, args)])
+
+    def create_companies() -> list[Company]:
+        deps = gen.CompanyDeps(company_ids=set())
+        with gen.get_company_agent().override(model=FunctionModel(respond)):
+            return asyncio.run(gen.create_companies(quantity=100, concurrency=8, deps=deps))
+
+    return [
+        measure(
+            "synthetic.generate_companies 10000",
+            lambda: list(synthetic.generate_companies(10_000, seed=3)),
+            repeats=10,
+            items=10_000,
+        ),
+        measure(
+            "synthetic.company_rows 10000",
+            lambda: list(synthetic.company_rows(10_000, seed=3)),
+            repeats=10,
+            items=10_000,
+        ),
+        measure(
+            "synthetic.invoice_item_rows 10000",
+            lambda: list(synthetic.invoice_item_rows(10_000, seed=3)),
+            repeats=10,
+            items=10_000,
+        ),
+        measure("create_companies 100 (stub model)", create_companies, repeats=10, items=100),
+    ]
+
+
+def fill_tables(rows: int) -> None:
+    """Recreates the scratch schema with ``rows`` companies and invoice items."""
+    schema = sql.Identifier(SCHEMA)
+    with psycopg.connect(db.POSTGRES_CONNINFO, autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(schema))
+        cur.execute(sql.SQL("CREATE SCHEMA {}").format(schema))
+        for table in ("postal_addresses", "companies", "invoice_items"):
+            cur.execute(
+                sql.SQL(
+                    "CREATE TABLE {}.{} (LIKE public.{} INCLUDING ALL EXCLUDING DEFAULTS)"
+                ).format(schema, sql.Identifier(table), sql.Identifier(table))
+            )
+
+        start = time.perf_counter()
+        for query in (QUERY_FILL_POSTAL_ADDRESSES, QUERY_FILL_COMPANIES, QUERY_FILL_INVOICE_ITEMS):
+            cur.execute(query, {"rows": rows})
+        cur.execute("ANALYZE postal_addresses, companies, invoice_items")
+        print(f"Filled {rows} rows per table in {time.perf_counter() - start:.1f} s")
+
+
+def drop_tables() -> None:
+    with psycopg.connect(db.POSTGRES_CONNINFO, autocommit=True) as conn:
+        conn.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(SCHEMA)))
+
+
+def bench_db(rows: int) -> list[dict]:
+    fill_tables(rows)
+    company_id = benchmark_id(rows // 2)
+    return [
+        measure(f"get_company @{rows}", lambda: db.get_company(company_id), repeats=200),
+        measure(
+            f"get_random_companies_batch 100x2 @{rows}",
+            lambda: db.get_random_companies_batch(limits=[2] * 100),
+            repeats=50,
+            items=100,
+        ),
+        measure(f"find_company 'Acme' @{rows}", lambda: db.find_company("Acme", 20), repeats=50),
+        measure(
+            f"find_company '555-0142' @{rows}",
+            lambda: db.find_company("555-0142", 20),
+            repeats=50,
+        ),
+        measure(
+            f"find_invoice_item 'Steel' @{rows}",
+            lambda: db.find_invoice_item("Steel", 20),
+            repeats=50,
+        ),
+    ]
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Prints the p50 change of every benchmark in the baseline and returns the regressions."""
+    baseline_by_name = {result["name"]: result for result in baseline}
+    regressions = []
+
+    print(f"\nCompared with the baseline, tolerance {tolerance:.0%}:")
+    for result in results:
+        base = baseline_by_name.get(result["name"])
+        if base is None:
+            continue
+        change = result["p50_ms"] / base["p50_ms"] - 1
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(result["name"])
+        print(f"{result['name']:<40} p50 {change:+8.1%}{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=list(ROWS))
+    parser.add_argument(
+        "--save", type=Path, nargs="?", const=BASELINE, help=f"Write a baseline ({BASELINE.name})"
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        nargs="?",
+        const=BASELINE,
+        help=f"Compare with a baseline ({BASELINE.name})",
+    )
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    # Console logging of every db call would dominate the measurements
+    logfire.configure(send_to_logfire=False, console=False)
+    results = [*bench_models(), *bench_render(), *bench_generation()]
+    try:
+        for rows in args.rows:
+            results.extend(bench_db(rows))
+    finally:
+        db.close_pool()
+        drop_tables()
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved the baseline to {args.save}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,293 @@
+"""
+Command line interface of the invoice OCR system.
+
+Only argparse and the settings are imported at startup. Each command imports the database,
+generation and logging modules it needs when it runs, so ``--help`` and argument errors return
+immediately.
+"""
+
 import argparse
+import csv
+import os
+from collections.abc import Iterator
 from pathlib import Path
-from random import randint
+from typing import TYPE_CHECKING
+
+from .settings import BULK_BATCH_SIZE, PYDANTIC_AI_CONCURRENCY, RASTERIZE_BATCH_SIZE
+
+if TYPE_CHECKING:
+    from .schema import Company, InvoiceItem
+
+
+def read_records(path: Path, record_type: str) -> Iterator["Company | InvoiceItem"]:
+    """Reads companies or invoice items from a JSONL or CSV file, skipping invalid rows.
+
+    JSONL lines use the model JSON schema. CSV company columns use the flat names of
+    ``db.QUERY_COMPANIES`` (``billing_city``, ``shipping_city``, ...).
+    """
+    import logfire
+
+    from . import db
+    from .schema import Company, InvoiceItem
+
+    model = Company if record_type == "company" else InvoiceItem
+
+    with path.open(newline="") as file:
+        if path.suffix == ".csv":
+            rows = enumerate(csv.DictReader(file), start=2)
+            parse = db.company_from_row if model is Company else model.model_validate
+        else:
+            rows = ((line, row) for line, row in enumerate(file, start=1) if row.strip())
+            parse = model.model_validate_json
+
+        for line, row in rows:
+            try:
+                yield parse(row)
+            except Exception as error:
+                logfire.error(f"Skipping invalid record {path}:{line}: {error}")
+
+
+def generate_invoices(args: argparse.Namespace) -> None:
+    """Generates synthetic invoice PDFs from random companies and invoice items."""
+    import logfire
+
+    from . import generate as gen
+    from .archive import InvoiceWriter
+
+    if args.shard_size and args.archive is None:
+        logfire.error("--shard-size needs --archive")
+        return
+
+    # Invoices are sampled and stored batch by batch as the renderer consumes them, so
+    # memory does not grow with the number of invoices
+    invoices = gen.sample_invoices(count=args.num_invoices, seed=args.seed)
+
+    try:
+        writer = InvoiceWriter(
+            output_dir=args.output_dir,
+            archive_format=args.archive,
+            shard_size=args.shard_size,
+            label_format=None if args.labels == "none" else args.labels,
+        )
+    except FileExistsError as error:
+        logfire.error(str(error))
+        return
+
+    count = 0
+    with writer:
+        for location in gen.write_pdf_invoices(
+            invoices=invoices, writer=writer, workers=args.workers
+        ):
+            count += 1
+            logfire.info("Generated invoice PDF: {location}", location=location)
+
+    if count < args.num_invoices:
+        logfire.error("Generated {count}/{total} invoice(s)", count=count, total=args.num_invoices)
+        return
+
+    logfire.info("Successfully generated {count} invoice(s)", count=count)
+
+
+def import_records(args: argparse.Namespace) -> None:
+    """Bulk imports companies or invoice items from a JSONL or CSV file."""
+    import logfire
+
+    from . import db
+
+    records = read_records(path=args.path, record_type=args.type)
+    if args.type == "company":
+        record_ids = db.add_companies(companies=records, batch_size=args.batch_size)
+    else:
+        record_ids = db.add_invoice_items(invoice_items=records, batch_size=args.batch_size)
+
+    logfire.info(
+        f"Imported {len(record_ids) - record_ids.count(None)}/{len(record_ids)} "
+        f"records from {args.path}"
+    )
+
+
+def ingest_files(args: argparse.Namespace) -> None:
+    """Records the new invoice PDFs and images of a directory in the invoices table."""
+    import logfire
+
+    from .ingest import ingest_files
+
+    file_ids = ingest_files(root=args.path, batch_size=args.batch_size, workers=args.workers)
+
+    logfire.info(
+        f"Ingested {len(file_ids) - file_ids.count(None)} new files, "
+        f"skipped {file_ids.count(None)} of {len(file_ids)} from {args.path}"
+    )
+
 
-import logfire
+def rasterize_invoices(args: argparse.Namespace) -> None:
+    """Stores a WebP preview for every ingested invoice file that has none."""
+    import logfire
+
+    from .rasterize import rasterize_invoices
+
+    stored, failed = rasterize_invoices(batch_size=args.batch_size, workers=args.workers)
+
+    logfire.info(f"Stored {stored} invoice previews, {failed} failed")
+
+
+def extract_invoices(args: argparse.Namespace) -> None:
+    """Extracts a structured invoice from every ingested invoice file not extracted yet."""
+    import asyncio
+
+    import logfire
+
+    from .extract import extract_invoices, stub_model
+
+    stored, failed = asyncio.run(
+        extract_invoices(
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            workers=args.workers,
+            model=stub_model() if args.stub_model else None,
+        )
+    )
+    report_llm_cache()
+
+    logfire.info(f"Extracted {stored} invoices, {failed} failed")
+
+
+def report_llm_cache() -> None:
+    """Logs the LLM cache hits and misses of the command, if the cache is enabled."""
+    import logfire
+
+    from .llm_cache import get_llm_cache
+
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        logfire.info(
+            f"LLM cache {llm_cache.path}: {llm_cache.hits} hits, {llm_cache.misses} misses"
+        )
+
+
+def create_companies(args: argparse.Namespace) -> None:
+    """Generates companies with concurrent LLM requests, or offline, and adds them to the DB."""
+    import logfire
+
+    from . import db
+
+    if args.offline:
+        from . import synthetic
+
+        # Rows go straight into COPY, without building a Company model per record
+        company_ids = db.add_company_rows(
+            companies=synthetic.company_rows(
+                quantity=args.num_companies, seed=args.seed, taken_ids=db.get_company_ids()
+            )
+        )
+    else:
+        import asyncio
+
+        from . import generate as gen
+
+        companies = asyncio.run(
+            gen.create_companies(quantity=args.num_companies, concurrency=args.concurrency)
+        )
+        report_llm_cache()
+        company_ids = db.add_companies(companies=companies)
+
+    created = len(company_ids) - company_ids.count(None)
+    if created < args.num_companies:
+        logfire.error(
+            f"Failed to create {args.num_companies - created}/{args.num_companies} companies"
+        )
+
+
+def create_invoice_items(args: argparse.Namespace) -> None:
+    """Generates invoice items with the LLM, or offline, and adds them to the database."""
+    import logfire
+
+    from . import db
+
+    if args.offline:
+        from . import synthetic
+
+        item_ids = db.add_invoice_item_rows(
+            invoice_items=synthetic.invoice_item_rows(
+                quantity=args.num_items, seed=args.seed, taken_skus=db.get_invoice_item_skus()
+            )
+        )
+    else:
+        from . import generate as gen
+
+        invoice_items = gen.create_invoice_items(quantity=args.num_items)
+        report_llm_cache()
+        item_ids = db.add_invoice_items(invoice_items=invoice_items)
+    if None in item_ids:
+        logfire.error(f"Failed to create {item_ids.count(None)}/{len(item_ids)} invoice items")
 
-from . import db
-from . import generate as gen
-from .schema import Invoice
+
+def purge_addresses(args: argparse.Namespace) -> None:
+    """Deletes postal addresses not referenced by any company."""
+    from . import db
+
+    db.purge_orphan_addresses(batch_size=args.batch_size, dry_run=args.dry_run)
+
+
+def close_database() -> None:
+    """Logs the connection pool statistics and closes the pool, if the command opened it."""
+    import logfire
+
+    from . import db, telemetry
+
+    stats = db.get_pool_stats()
+    if stats:
+        logfire.info("PostgreSQL Pool statistics", **stats)
+        telemetry.record_pool_stats(stats)
+    db.close_pool()
+
+
+def add_offline_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the options of the offline generator to a company or invoice-item command."""
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Generate records locally with a seeded generator instead of the LLM",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed of the offline generator (default: random)",
+    )
+
+
+def add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the archive and label options of the invoice command."""
+    parser.add_argument(
+        "-a",
+        "--archive",
+        choices=["tar", "zip"],
+        default=None,
+        help="Stream the PDFs into tar or zip archives instead of separate files",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=0,
+        help="Invoices per archive with --archive, 0 for a single archive (default: 0)",
+    )
+    parser.add_argument(
+        "--labels",
+        choices=["parquet", "jsonl", "none"],
+        default="parquet",
+        help="Format of the ground-truth label tables, JSONL without pyarrow (default: parquet)",
+    )
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Invoice OCR CLI tools")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-stage timing summary at the end of the run",
+    )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # Generate invoices command
@@ -29,6 +306,21 @@ def main() -> None:
         default=Path("data"),
         help="Output directory for PDF files (default: ./data)",
     )
+    gen_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of parallel PDF rendering processes (default: 1)",
+    )
+    gen_parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for reproducible invoice contents, not numbers (default: random)",
+    )
+    add_output_arguments(gen_parser)
 
     # Create companies command
     company_parser = subparsers.add_parser("company", help="Create synthetic companies")
@@ -39,6 +331,14 @@ def main() -> None:
         default=1,
         help="Number of companies to create (default: 1)",
     )
+    company_parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=PYDANTIC_AI_CONCURRENCY,
+        help=f"Maximum LLM requests in flight (default: {PYDANTIC_AI_CONCURRENCY})",
+    )
+    add_offline_arguments(company_parser)
 
     # Create invoice items command
     items_parser = subparsers.add_parser("invoice-item", help="Create synthetic invoice items")
@@ -49,48 +349,150 @@ def main() -> None:
         default=5,
         help="Number of invoice items to create (default: 5)",
     )
+    add_offline_arguments(items_parser)
 
-    args = parser.parse_args()
+    # Bulk import command
+    import_parser = subparsers.add_parser(
+        "import", help="Bulk import companies or invoice items from JSONL or CSV"
+    )
+    import_parser.add_argument(
+        "path",
+        type=Path,
+        help="JSONL (.jsonl) or CSV (.csv) file to import",
+    )
+    import_parser.add_argument(
+        "-t",
+        "--type",
+        choices=["company", "invoice-item"],
+        required=True,
+        help="Type of records in the file",
+    )
+    import_parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=BULK_BATCH_SIZE,
+        help=f"Records per transaction (default: {BULK_BATCH_SIZE})",
+    )
 
-    if args.command == "invoice":
-        # Create output directory if it doesn't exist
-        args.output_dir.mkdir(parents=True, exist_ok=True)
+    # Ingest invoice documents command
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Record new invoice PDFs and images, deduplicated by SHA-256"
+    )
+    ingest_parser.add_argument(
+        "path",
+        type=Path,
+        help="Directory to walk, or a single file",
+    )
+    ingest_parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=BULK_BATCH_SIZE,
+        help=f"Files per lookup and transaction (default: {BULK_BATCH_SIZE})",
+    )
+    ingest_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of hashing threads (default: 4)",
+    )
 
-        for i in range(args.num_invoices):
-            companies = db.get_random_companies(limit=2)
-            invoice_items = db.get_random_invoice_items(limit=randint(1, 10))
+    # Rasterize invoice previews command
+    rasterize_parser = subparsers.add_parser(
+        "rasterize", help="Render WebP previews of ingested invoices that have none"
+    )
+    rasterize_parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=RASTERIZE_BATCH_SIZE,
+        help=f"Invoice files rendered and stored per batch (default: {RASTERIZE_BATCH_SIZE})",
+    )
+    rasterize_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of parallel rendering processes (default: number of CPUs)",
+    )
 
-            invoice = Invoice(
-                invoice_number=f"INV-{randint(1000, 9999)}",
-                supplier=companies[0],
-                customer=companies[1],
-                line_items=invoice_items,
-            )
+    # Extract invoices command
+    extract_parser = subparsers.add_parser(
+        "extract", help="Extract structured invoices from ingested invoice files"
+    )
+    extract_parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Invoice files read and extractions stored per batch (default: 100)",
+    )
+    extract_parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=PYDANTIC_AI_CONCURRENCY,
+        help=f"Maximum LLM requests in flight (default: {PYDANTIC_AI_CONCURRENCY})",
+    )
+    extract_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of parallel text extraction processes (default: 1)",
+    )
+    extract_parser.add_argument(
+        "--stub-model",
+        action="store_true",
+        help="Use a local stub model instead of PYDANTIC_AI_MODEL, for testing",
+    )
 
-            pdf_bytes = gen.create_pdf_invoice(invoice)
-            pdf_path = args.output_dir / f"{invoice.invoice_number}.pdf"
-            pdf_path.write_bytes(pdf_bytes)
+    # Purge orphaned addresses command
+    purge_parser = subparsers.add_parser(
+        "purge-addresses", help="Delete postal addresses not referenced by any company"
+    )
+    purge_parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=BULK_BATCH_SIZE,
+        help=f"Addresses deleted per transaction (default: {BULK_BATCH_SIZE})",
+    )
+    purge_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only count orphaned addresses",
+    )
 
-            logfire.info(f"Generated invoice PDF: {pdf_path}")
+    args = parser.parse_args()
 
-        logfire.info(f"Successfully generated {args.num_invoices} invoice(s)")
+    commands = {
+        "invoice": generate_invoices,
+        "company": create_companies,
+        "invoice-item": create_invoice_items,
+        "import": import_records,
+        "ingest": ingest_files,
+        "rasterize": rasterize_invoices,
+        "extract": extract_invoices,
+        "purge-addresses": purge_addresses,
+    }
 
-    elif args.command == "company":
-        for i in range(args.num_companies):
-            company = gen.create_company()
-            company_id = db.add_company(company=company)
-            if not company_id:
-                logfire.error(f"Failed to create company {i + 1}/{args.num_companies}")
+    if args.command not in commands:
+        parser.print_help()
+        return
 
-    elif args.command == "invoice-item":
-        invoice_items = gen.create_invoice_items(quantity=args.num_items)
-        for invoice_item in invoice_items:
-            item_id = db.add_invoice_item(invoice_item=invoice_item)
-            if not item_id:
-                logfire.error(f"Failed to create invoice item {args.num_items}")
+    from . import telemetry
 
-    else:
-        parser.print_help()
+    telemetry.enable_profile(args.profile)
+    try:
+        with telemetry.stage("command", command=args.command):
+            commands[args.command](args)
+    finally:
+        close_database()
+        if args.profile:
+            print(telemetry.format_profile())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+"""
+Streaming output of rendered invoice PDFs.
+
+``InvoiceWriter`` writes PDFs as soon as they are rendered, either as separate files or into
+tar or zip archives, and appends the ground truth of every PDF to a JSONL manifest. Nothing
+is buffered beyond the PDF being written, so memory stays flat however many invoices a run
+generates.
+
+A writer refuses an output directory that already holds the manifest, archives or label
+tables of an earlier run, instead of overwriting them.
+
+Archives can be sharded: with ``shard_size`` set, a new archive is started every
+``shard_size`` invoices (``invoices-00000.tar``, ``invoices-00001.tar``, ...), so large
+datasets can be transferred and processed in parallel pieces.
+
+Each manifest line holds:
+- ``file``: name of the PDF, in the output directory or in its archive
+- ``archive``: name of the archive in the output directory, or null for separate files
+- ``size`` and ``sha256``: size and SHA-256 of the PDF, the key of ``invoices.file_sha256``
+  once the PDF is ingested
+- ``invoice``: the ``schema.Invoice`` rendered in the PDF, as JSON
+
+With ``label_format`` set, the same ground truth is also written as columnar label tables
+for training, see ``labels``.
+"""
+
+import hashlib
+import json
+import tarfile
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from io import BytesIO
+from pathlib import Path
+from typing import IO
+
+from .labels import LABEL_FORMATS, LABEL_TABLES, LabelWriter, get_label_writer
+from .schema import Invoice
+
+ARCHIVE_FORMATS = ("tar", "zip")
+
+MANIFEST_NAME = "manifest.jsonl"
+
+ARCHIVE_STEM = "invoices"
+
+
+class PdfSink(ABC):
+    """Destination of the PDFs of a directory or of one archive."""
+
+    @abstractmethod
+    def add(self, name: str, data: bytes) -> None:
+        """Writes a PDF named ``name``."""
+
+    def close(self) -> None:
+        """Finishes writing. The sink cannot be used anymore."""
+
+
+class DirectorySink(PdfSink):
+    """Writes every PDF as a separate file of a directory."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def add(self, name: str, data: bytes) -> None:
+        (self.root / name).write_bytes(data)
+
+
+class TarSink(PdfSink):
+    """Appends PDFs to an uncompressed tar archive, written sequentially."""
+
+    def __init__(self, path: Path):
+        self.tar = tarfile.open(path, mode="w", format=tarfile.PAX_FORMAT)  # noqa: SIM115
+
+    def add(self, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.tar.addfile(info, BytesIO(data))
+
+    def close(self) -> None:
+        self.tar.close()
+
+
+class ZipSink(PdfSink):
+    """Appends PDFs to a zip archive, stored without compression.
+
+    PDF streams are already compressed, deflating them again costs CPU for little gain.
+    """
+
+    def __init__(self, path: Path):
+        self.zip = zipfile.ZipFile(path, mode="w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes) -> None:
+        info = zipfile.ZipInfo(filename=name, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, data)
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+def previous_outputs(output_dir: Path) -> list[Path]:
+    """Returns the manifest, archives and label tables an earlier run left in a directory."""
+    names = [MANIFEST_NAME, *(f"{table}.{fmt}" for table in LABEL_TABLES for fmt in LABEL_FORMATS)]
+    paths = [output_dir / name for name in names if (output_dir / name).exists()]
+    for archive_format in ARCHIVE_FORMATS:
+        paths.extend(sorted(output_dir.glob(f"{ARCHIVE_STEM}*.{archive_format}")))
+    return paths
+
+
+class InvoiceWriter:
+    """Writes rendered invoices and their manifest to an output directory.
+
+    Use as a context manager, so the last archive and the manifest are closed.
+
+    Args:
+        output_dir: Directory of the PDFs or archives and of ``manifest.jsonl``. Created if
+            missing.
+        archive_format: ``tar`` or ``zip`` to write archives, None to write separate files.
+        shard_size: Invoices per archive. A single ``invoices.<format>`` archive when 0.
+        label_format: ``parquet`` or ``jsonl`` to also write label tables, see
+            ``labels.get_label_writer``. None to only write the manifest.
+
+    Raises:
+        ValueError: If the archive or label format is unknown, or shards are asked without
+            archives.
+        FileExistsError: If the output directory holds the output of an earlier run, see
+            ``previous_outputs``.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        archive_format: str | None = None,
+        shard_size: int = 0,
+        label_format: str | None = None,
+    ):
+        if archive_format is not None and archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format: {archive_format}")
+        if shard_size and archive_format is None:
+            raise ValueError("Sharding needs an archive format")
+
+        if previous := previous_outputs(output_dir):
+            raise FileExistsError(
+                f"{output_dir} holds the output of an earlier run ({previous[0].name}), "
+                "choose another output directory"
+            )
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir = output_dir
+        self.archive_format = archive_format
+        self.shard_size = shard_size
+        self.count = 0
+        self.archive: str | None = None
+        self.sink: PdfSink | None = None
+        self.manifest: IO[str] = (output_dir / MANIFEST_NAME).open("w")
+        self.labels: LabelWriter | None = None
+        if label_format is not None:
+            try:
+                self.labels = get_label_writer(output_dir=output_dir, label_format=label_format)
+            except BaseException:
+                self.manifest.close()
+                raise
+
+    def __enter__(self) -> "InvoiceWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def archive_name(self) -> str | None:
+        """Returns the name of the archive of the next invoice, None for separate files."""
+        if self.archive_format is None:
+            return None
+        if not self.shard_size:
+            return f"{ARCHIVE_STEM}.{self.archive_format}"
+        return f"{ARCHIVE_STEM}-{self.count // self.shard_size:05d}.{self.archive_format}"
+
+    def open_sink(self, archive: str | None) -> PdfSink:
+        if archive is None:
+            return DirectorySink(self.output_dir)
+        if self.archive_format == "tar":
+            return TarSink(self.output_dir / archive)
+        return ZipSink(self.output_dir / archive)
+
+    def write(self, invoice: Invoice, pdf_bytes: bytes) -> str:
+        """Writes the PDF of an invoice and appends its manifest line and labels.
+
+        Returns:
+            str: The path of the PDF, or ``<archive path>:<file>`` in an archive.
+        """
+        archive = self.archive_name()
+        if self.sink is None or archive != self.archive:
+            if self.sink is not None:
+                self.sink.close()
+            self.sink = self.open_sink(archive)
+            self.archive = archive
+
+        name = f"{invoice.invoice_number}.pdf"
+        self.sink.add(name, pdf_bytes)
+        self.count += 1
+
+        entry = {
+            "file": name,
+            "archive": archive,
+            "size": len(pdf_bytes),
+            "sha256": hashlib.sha256(pdf_bytes).hexdigest(),
+            "invoice": invoice.model_dump(mode="json"),
+        }
+        self.manifest.write(json.dumps(entry) + "\n")
+        if self.labels is not None:
+            self.labels.write(invoice=invoice, file=name, archive=archive)
+
+        if archive is None:
+            return str(self.output_dir / name)
+        return f"{self.output_dir / archive}:{name}"
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+        if self.labels is not None:
+            self.labels.close()
+        self.manifest.close()
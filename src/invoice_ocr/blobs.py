@@ -0,0 +1,173 @@
+"""
+Content-addressed storage of invoice blobs, such as WebP previews.
+
+Blobs are keyed by the hex SHA-256 of their content, so storing the same bytes twice is a
+no-op and a key never goes stale. Database rows only keep the key, so metadata queries and
+row updates never drag blob bytes through the buffer cache, and blobs are fetched on demand.
+
+The backend is chosen by the ``BLOB_STORE`` setting:
+- ``postgres``: the ``blobs`` table, in the same database as the metadata
+- ``local``: files under ``BLOB_STORE_PATH``, fanned out by the first characters of the key
+- ``gcs``: objects under ``BLOB_STORE_PREFIX`` in the Google Cloud Storage ``BLOB_STORE_BUCKET``
+"""
+
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from contextlib import suppress
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .settings import BLOB_STORE, BLOB_STORE_BUCKET, BLOB_STORE_PATH, BLOB_STORE_PREFIX
+
+if TYPE_CHECKING:
+    from google.cloud import storage
+
+
+def blob_key(content: bytes) -> str:
+    """Returns the content address of a blob, its hex SHA-256 digest."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class BlobStore(ABC):
+    """Content-addressed blob storage backend."""
+
+    def put(self, content: bytes) -> str:
+        """Stores a blob and returns its key."""
+        return self.put_many([content])[0]
+
+    @abstractmethod
+    def put_many(self, contents: Iterable[bytes]) -> list[str]:
+        """Stores many blobs and returns their keys in order. Known blobs are not rewritten."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Returns the content of a blob, or None if the key is unknown."""
+
+
+class PostgresBlobStore(BlobStore):
+    """Blobs in the ``blobs`` table, written with one statement per ``put_many``."""
+
+    def put_many(self, contents: Iterable[bytes]) -> list[str]:
+        from . import db
+
+        contents = list(contents)
+        keys = [blob_key(content) for content in contents]
+        if keys:
+            db.add_blobs(dict(zip(keys, contents, strict=True)))
+        return keys
+
+    def get(self, key: str) -> bytes | None:
+        from . import db
+
+        return db.get_blob(key)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs in files named ``<root>/<key[:2]>/<key[2:4]>/<key>``.
+
+    Files are written to a temporary name and renamed, so readers never see a partial blob.
+
+    Args:
+        root: Directory of the store, created on first write.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def put_many(self, contents: Iterable[bytes]) -> list[str]:
+        keys = []
+        for content in contents:
+            key = blob_key(content)
+            path = self.path(key)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+                    file.write(content)
+                os.replace(file.name, path)
+            keys.append(key)
+        return keys
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+
+class GCSBlobStore(BlobStore):
+    """Blobs in Google Cloud Storage objects named ``<prefix><key>``.
+
+    Uploads are create-only, ``if_generation_match=0``, so a known blob costs one request and
+    is never rewritten.
+
+    Args:
+        bucket: Bucket name.
+        prefix: Object name prefix.
+        client: Storage client. Built from the application default credentials when None.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", client: "storage.Client | None" = None):
+        if client is None:
+            from google.cloud import storage
+
+            from .settings import google_credentials
+
+            credentials, project = google_credentials()
+            client = storage.Client(project=project, credentials=credentials)
+        self.bucket = client.bucket(bucket)
+        self.prefix = prefix
+
+    def put_many(self, contents: Iterable[bytes]) -> list[str]:
+        from google.api_core.exceptions import PreconditionFailed
+
+        keys = []
+        for content in contents:
+            key = blob_key(content)
+            # A failed precondition means the blob is already stored
+            with suppress(PreconditionFailed):
+                self.bucket.blob(self.prefix + key).upload_from_string(
+                    content, if_generation_match=0
+                )
+            keys.append(key)
+        return keys
+
+    def get(self, key: str) -> bytes | None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(self.prefix + key).download_as_bytes()
+        except NotFound:
+            return None
+
+
+@cache
+def get_blob_store() -> BlobStore:
+    """Returns the blob store configured by ``BLOB_STORE``, built on first use.
+
+    Raises:
+        ValueError: If ``BLOB_STORE`` is unknown, or ``gcs`` without ``BLOB_STORE_BUCKET``.
+    """
+    if BLOB_STORE == "postgres":
+        return PostgresBlobStore()
+    if BLOB_STORE == "local":
+        return LocalBlobStore(root=Path(BLOB_STORE_PATH))
+    if BLOB_STORE == "gcs":
+        if not BLOB_STORE_BUCKET:
+            raise ValueError("BLOB_STORE_BUCKET is required by the gcs blob store")
+        return GCSBlobStore(bucket=BLOB_STORE_BUCKET, prefix=BLOB_STORE_PREFIX)
+    raise ValueError(f"Unknown BLOB_STORE {BLOB_STORE!r}, expected postgres, local or gcs")
+
+
+def get_invoice_preview(invoice_file_id: int) -> bytes | None:
+    """Returns the WebP preview of an invoice file, or None if it has none yet."""
+    from . import db
+
+    key = db.get_invoice_webp_sha256(invoice_file_id)
+    return get_blob_store().get(key) if key else None
@@ -10,52 +10,285 @@ database operations. Database credentials and connection settings are loaded fro
 variables through the settings module.
 """
 
-import sys
+from collections.abc import Generator, Iterable
+from decimal import Decimal
+from itertools import batched
+from random import Random
+from threading import Lock
 from typing import TypeVar
 
 import logfire
+from psycopg import AsyncCursor, Cursor, sql
 from psycopg.errors import UniqueViolation
 from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
-from .schema import Address, Company, Invoice, InvoiceItem
+from .schema import Address, Company, Invoice, InvoiceFile, InvoiceItem
 from .settings import (
+    BULK_BATCH_SIZE,
     POSTGRES_DB,
     POSTGRES_HOST,
     POSTGRES_PASSWORD,
+    POSTGRES_POOL_MAX_IDLE,
+    POSTGRES_POOL_MAX_LIFETIME,
+    POSTGRES_POOL_MAX_SIZE,
+    POSTGRES_POOL_MIN_SIZE,
+    POSTGRES_POOL_TIMEOUT,
     POSTGRES_PORT,
     POSTGRES_USER,
+    configure_logfire,
 )
+from .telemetry import stage
+
+configure_logfire()
 
 SqlId = TypeVar(name="SqlId", bound=int)
 """SQL primary key (id)"""
 
-try:
-    POSTGRES_POOL = ConnectionPool(
-        conninfo=f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}",
-        open=True,
-        min_size=2,
-        max_size=10,
-        max_idle=300,
-        max_lifetime=300,
+POSTGRES_CONNINFO = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+"""PostgreSQL connection string shared by the sync and async pools"""
+
+POSTGRES_POOL_SETTINGS = {
+    "min_size": POSTGRES_POOL_MIN_SIZE,
+    "max_size": POSTGRES_POOL_MAX_SIZE,
+    "max_idle": POSTGRES_POOL_MAX_IDLE,
+    "max_lifetime": POSTGRES_POOL_MAX_LIFETIME,
+    "timeout": POSTGRES_POOL_TIMEOUT,
+}
+"""Connection pool sizing shared by the sync and async pools, see ``settings``"""
+
+_POSTGRES_POOL: ConnectionPool | None = None
+_POSTGRES_POOL_LOCK = Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the PostgreSQL connection pool, opening it on first use.
+
+    The pool is not created at import time, so commands that do not touch the database
+    never connect to it.
+
+    Raises:
+        PoolTimeout: If the pool cannot open ``min_size`` connections within the timeout.
+    """
+    global _POSTGRES_POOL  # noqa: PLW0603
+
+    with _POSTGRES_POOL_LOCK:
+        if _POSTGRES_POOL is None:
+            pool = ConnectionPool(conninfo=POSTGRES_CONNINFO, open=False, **POSTGRES_POOL_SETTINGS)
+            try:
+                pool.open(wait=True, timeout=POSTGRES_POOL_TIMEOUT)
+            except Exception as error:
+                logfire.error(f"PostageSQL Pool is not ready: {error}")
+                pool.close()
+                raise
+            logfire.info(f"PostageSQL Pool: {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+            _POSTGRES_POOL = pool
+
+    return _POSTGRES_POOL
+
+
+def close_pool() -> None:
+    """Closes the connection pool if it was opened. The next database call opens a new one."""
+    global _POSTGRES_POOL
+
+    with _POSTGRES_POOL_LOCK:
+        if _POSTGRES_POOL is not None:
+            pool, _POSTGRES_POOL = _POSTGRES_POOL, None
+            pool.close()
+
+
+def pool_stats(pool: ConnectionPool | AsyncConnectionPool | None) -> dict[str, float]:
+    """Returns the statistics of a connection pool, for sizing it to the worker count.
+
+    Includes the psycopg_pool counters (``pool_size``, ``pool_available``,
+    ``requests_waiting``, ``requests_num``, ``requests_wait_ms``, ``usage_ms``, ...) and the
+    average connection checkout latency as ``requests_wait_ms_avg``.
+
+    Args:
+        pool: The pool, or None if it was never opened.
+
+    Returns:
+        dict[str, float]: The pool statistics, empty if the pool was never opened.
+    """
+    if pool is None:
+        return {}
+
+    stats: dict[str, float] = pool.get_stats()
+    requests = stats.get("requests_num", 0)
+    stats["requests_wait_ms_avg"] = stats.get("requests_wait_ms", 0) / requests if requests else 0
+    return stats
+
+
+def get_pool_stats() -> dict[str, float]:
+    """Returns the statistics of the connection pool. See ``pool_stats``."""
+    return pool_stats(_POSTGRES_POOL)
+
+
+SAMPLE_ATTEMPTS = 5
+"""Rounds of random id probing before sampling falls back to a full id scan"""
+
+
+SampleQuery = tuple[sql.Composable | str, dict | None]
+"""Query and parameters ``_sample_rows`` asks its caller to execute"""
+
+
+def _extend_samples(
+    rows: list[dict], samples: list[list[dict]], candidates: list[list[int]]
+) -> None:
+    """Appends the fetched rows of each sample's candidate ids, in candidate order."""
+    rows_by_id = {row["id"]: row for row in rows}
+
+    for sample, sample_ids in zip(samples, candidates, strict=True):
+        sample.extend(rows_by_id[row_id] for row_id in sample_ids if row_id in rows_by_id)
+
+
+def _candidate_ids(candidates: list[list[int]]) -> dict:
+    """Query parameters fetching every candidate id once."""
+    return {"ids": sorted({row_id for sample_ids in candidates for row_id in sample_ids})}
+
+
+def _sample_rows(
+    table: str, query: str, limits: list[int], seed: int | None = None
+) -> Generator[SampleQuery, list[dict], list[list[dict]]]:
+    """Draws distinct random rows for each sample size in ``limits`` without sorting the table.
+
+    Random ids between min(id) and max(id) of ``table`` are fetched with ``query``, which
+    must select ``id`` and filter on ``id = ANY(%(ids)s)``, so every round is a single
+    primary key lookup proportional to the number of rows sampled. Ids that fall into gaps
+    are redrawn. Samples still short after ``SAMPLE_ATTEMPTS`` rounds (tiny or sparse
+    tables) are completed from the full id list.
+
+    Each sample draws from its own random stream derived from ``seed``, so the redraws of
+    one sample never shift the others: the first sample of ``limits=[1, 1]`` is the sample
+    of ``limits=[1]`` with the same seed.
+
+    The generator yields each query to run and expects the fetched rows (``dict_row``) to
+    be sent back, so the sync and async database modules share the sampling logic. See
+    ``_run_sample``.
+
+    Args:
+        table: Table to sample, with a serial ``id`` primary key.
+        query: Query returning the rows to sample for a list of ids.
+        limits: Number of rows to draw for each sample.
+        seed: Random seed. The same seed and table contents give the same samples.
+
+    Returns:
+        list[list[dict]]: One list of rows per entry in ``limits``.
+    """
+    rng = Random(seed)
+    rngs = [Random(rng.random()) for _ in limits]
+    samples: list[list[dict]] = [[] for _ in limits]
+    tried: list[set[int]] = [set() for _ in limits]
+
+    bounds = yield (
+        sql.SQL("SELECT min(id) AS min_id, max(id) AS max_id FROM {};").format(
+            sql.Identifier(table)
+        ),
+        None,
     )
-    POSTGRES_POOL.wait()
-    logfire.info(
-        f"PostageSQL Pool: postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    if bounds[0]["min_id"] is None:
+        return samples
+    id_range = range(bounds[0]["min_id"], bounds[0]["max_id"] + 1)
+
+    for _ in range(SAMPLE_ATTEMPTS):
+        candidates: list[list[int]] = []
+        for limit, sample, sample_tried, sample_rng in zip(
+            limits, samples, tried, rngs, strict=True
+        ):
+            draws = min(limit - len(sample), len(id_range) - len(sample_tried))
+            ids = []
+            while len(ids) < draws:
+                row_id = sample_rng.choice(id_range)
+                if row_id not in sample_tried:
+                    sample_tried.add(row_id)
+                    ids.append(row_id)
+            candidates.append(ids)
+
+        if not any(candidates):
+            break
+
+        rows = yield (query, _candidate_ids(candidates))
+        _extend_samples(rows=rows, samples=samples, candidates=candidates)
+
+    if all(len(sample) >= limit for limit, sample in zip(limits, samples, strict=True)):
+        return samples
+
+    rows = yield (sql.SQL("SELECT id FROM {} ORDER BY id;").format(sql.Identifier(table)), None)
+    all_ids = [row["id"] for row in rows]
+
+    candidates = []
+    for limit, sample, sample_rng in zip(limits, samples, rngs, strict=True):
+        picked = {row["id"] for row in sample}
+        remaining = [row_id for row_id in all_ids if row_id not in picked]
+        candidates.append(sample_rng.sample(remaining, min(limit - len(sample), len(remaining))))
+
+    rows = yield (query, _candidate_ids(candidates))
+    _extend_samples(rows=rows, samples=samples, candidates=candidates)
+
+    return samples
+
+
+def _run_sample(
+    cur: Cursor[dict], sample: Generator[SampleQuery, list[dict], list[list[dict]]]
+) -> list[list[dict]]:
+    """Executes the queries of a ``_sample_rows`` generator and returns its samples."""
+    try:
+        query, params = next(sample)
+        while True:
+            cur.execute(query=query, params=params)
+            query, params = sample.send(cur.fetchall())
+    except StopIteration as stop:
+        return stop.value
+
+
+QUERY_ADD_COMPANY = """
+    WITH billing AS (
+        INSERT INTO postal_addresses (address_line1, address_line2, city, province, postal_code, country)
+        VALUES (%(billing_address_line1)s, %(billing_address_line2)s, %(billing_city)s, %(billing_province)s, %(billing_postal_code)s, %(billing_country)s)
+        RETURNING id
+    ), shipping AS (
+        INSERT INTO postal_addresses (address_line1, address_line2, city, province, postal_code, country)
+        SELECT %(shipping_address_line1)s, %(shipping_address_line2)s, %(shipping_city)s, %(shipping_province)s, %(shipping_postal_code)s, %(shipping_country)s
+        WHERE %(has_shipping)s
+        RETURNING id
     )
-except Exception as error:
-    logfire.error(f"PostageSQL Pool is not ready: {error}")
-    sys.exit(1)
+    INSERT INTO companies (company_id, company_name, address_billing, address_shipping, phone_number, email, website)
+    VALUES (%(company_id)s, %(company_name)s, (SELECT id FROM billing), (SELECT id FROM shipping), %(phone_number)s, %(email)s, %(website)s)
+    RETURNING id;
+"""
+"""Company with its addresses in one atomic statement, see ``company_params``"""
+
+
+def company_params(company: Company) -> dict:
+    """Builds the ``QUERY_ADD_COMPANY`` parameters of a company."""
+    params = {
+        "company_id": company.company_id,
+        "company_name": company.company_name,
+        "phone_number": company.phone_number,
+        "email": company.email,
+        "website": company.website,
+        "has_shipping": company.address_shipping is not None,
+    }
+    for prefix, address in (
+        ("billing", company.address_billing),
+        ("shipping", company.address_shipping),
+    ):
+        for field in Address.model_fields:
+            params[f"{prefix}_{field}"] = getattr(address, field, None)
+    return params
 
 
 def add_company(company: Company) -> SqlId | None:
     """Adds a new company to the database with its billing and optional shipping address.
 
-    This function inserts a company's details into the database, including:
+    This function inserts a company's details into the database in a single statement:
     - Inserting billing address into postal_addresses table
     - Optionally inserting shipping address into postal_addresses table
     - Inserting company details into companies table with address references
 
+    The addresses are inserted by data-modifying CTEs of the company INSERT, so either all
+    rows are written or none are, and a duplicate company ID leaves no orphaned addresses.
+
     Args:
         company (Company): A Company object containing company details including:
             - company_id (str): Unique identifier for the company
@@ -71,61 +304,21 @@ def add_company(company: Company) -> SqlId | None:
         None if insertion fails due to:
         - Duplicate company ID
         - Database insertion errors
-
-    Raises:
-        UniqueViolation: If a company with the same company_id already exists
-        Exception: For any other database-related errors during insertion
     """
 
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            query_address = """
-                INSERT INTO postal_addresses (address_line1, address_line2, city, province, postal_code, country)
-                VALUES (%(address_line1)s, %(address_line2)s, %(city)s, %(province)s, %(postal_code)s, %(country)s)
-                RETURNING id;
-            """
-            address_billing = company.address_billing.model_dump()
-            cur.execute(query=query_address, params=address_billing)
-            address_billing_id = cur.fetchone()["id"]
-        except Exception as error:
-            logfire.error(f"Failed to insert billing address: {error}")
-            return None
-
-        try:
-            if company.address_shipping:
-                address_shipping = company.address_shipping.model_dump()
-                cur.execute(query=query_address, params=address_shipping)
-                address_shipping_id = cur.fetchone()["id"]
-            else:
-                address_shipping_id = None
-        except Exception as error:
-            logfire.error(f"Failed to insert shipping address: {error}")
-            return None
-
-        try:
-            query_company = """
-                INSERT INTO companies (company_id, company_name, address_billing, address_shipping, phone_number, email, website)
-                VALUES (%(company_id)s, %(company_name)s, %(address_billing)s, %(address_shipping)s, %(phone_number)s, %(email)s, %(website)s)
-                RETURNING id;
-            """
-            cur.execute(
-                query=query_company,
-                params={
-                    "company_id": company.company_id,
-                    "company_name": company.company_name,
-                    "address_billing": address_billing_id,
-                    "address_shipping": address_shipping_id,
-                    "phone_number": company.phone_number,
-                    "email": company.email,
-                    "website": company.website,
-                },
-            )
+            cur.execute(query=QUERY_ADD_COMPANY, params=company_params(company))
             company_id: int = cur.fetchone()["id"]
 
-            logfire.info(f"Insert Company ID: {company.company_id} - {company.company_name}")
+            logfire.debug(
+                "Insert Company ID: {company_id} - {company_name}",
+                company_id=company.company_id,
+                company_name=company.company_name,
+            )
 
             return company_id
 
@@ -139,6 +332,359 @@ def add_company(company: Company) -> SqlId | None:
             return None
 
 
+QUERY_ORPHAN_ADDRESSES = """
+    SELECT p.id
+    FROM postal_addresses p
+    WHERE NOT EXISTS (SELECT 1 FROM companies c WHERE c.address_billing = p.id)
+      AND NOT EXISTS (SELECT 1 FROM companies c WHERE c.address_shipping = p.id)
+"""
+"""Postal addresses no company references"""
+
+QUERY_COUNT_ORPHAN_ADDRESSES = f"SELECT count(*) FROM ({QUERY_ORPHAN_ADDRESSES}) orphans;"
+
+QUERY_DELETE_ORPHAN_ADDRESSES = (
+    f"DELETE FROM postal_addresses WHERE id IN ({QUERY_ORPHAN_ADDRESSES} LIMIT %(batch_size)s);"
+)
+
+
+def purge_orphan_addresses(batch_size: int = BULK_BATCH_SIZE, dry_run: bool = False) -> int:
+    """Deletes postal addresses that no company references.
+
+    Orphans were left behind by earlier versions of ``add_company`` when a company insert
+    failed after its addresses were written. They are deleted in batches of ``batch_size``,
+    one transaction per batch, so the purge does not hold long locks on a large table.
+
+    Args:
+        batch_size: Number of addresses deleted per transaction.
+        dry_run: Only count the orphaned addresses.
+
+    Returns:
+        int: The number of orphaned addresses found (dry run) or deleted.
+    """
+    if dry_run:
+        with get_pool().connection() as conn:
+            count = conn.execute(QUERY_COUNT_ORPHAN_ADDRESSES).fetchone()[0]
+        logfire.info(f"Found {count} orphaned postal addresses")
+        return count
+
+    deleted = 0
+    while True:
+        with get_pool().connection() as conn:
+            cur = conn.execute(QUERY_DELETE_ORPHAN_ADDRESSES, {"batch_size": batch_size})
+            deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            break
+
+    logfire.info(f"Deleted {deleted} orphaned postal addresses")
+    return deleted
+
+
+AddressRow = tuple[str, str, str, str, str, str]
+"""Postal address as (address_line1, address_line2, city, province, postal_code, country)"""
+
+CompanyRow = tuple[str, str, AddressRow, AddressRow | None, str, str, str]
+"""Company as (company_id, company_name, address_billing, address_shipping, phone_number,
+email, website)"""
+
+
+def address_row(address: Address) -> AddressRow:
+    """Converts a postal address to an ``AddressRow``."""
+    return (
+        address.address_line1,
+        address.address_line2,
+        address.city,
+        address.province,
+        address.postal_code,
+        address.country,
+    )
+
+
+def company_row(company: Company) -> CompanyRow:
+    """Converts a company to the ``CompanyRow`` of ``add_company_rows``."""
+    return (
+        company.company_id,
+        company.company_name,
+        address_row(company.address_billing),
+        None if company.address_shipping is None else address_row(company.address_shipping),
+        company.phone_number,
+        company.email,
+        company.website,
+    )
+
+
+def add_companies(
+    companies: Iterable[Company], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many companies with their addresses using the COPY protocol.
+
+    See ``add_company_rows``, which skips building ``Company`` models for bulk loads.
+
+    Args:
+        companies: Companies to insert. May be a generator.
+        batch_size: Number of companies per transaction.
+
+    Returns:
+        list[SqlId | None]: The database ID of each company in input order, or None for
+        companies skipped because their company_id already exists or the batch failed.
+    """
+    return add_company_rows(
+        companies=(company_row(company) for company in companies), batch_size=batch_size
+    )
+
+
+def add_company_rows(
+    companies: Iterable[CompanyRow], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many companies with their addresses using the COPY protocol.
+
+    Companies are written in batches of ``batch_size``, each batch in one transaction:
+    - Company IDs that already exist, or repeat earlier in the input, are skipped. A company
+      of a failed batch does not count, so a later repeat of its company ID is inserted
+    - Address ids are reserved from the postal_addresses sequence and the addresses are
+      copied with those ids, so every company maps to its own address rows
+    - Companies are copied into a staging table and inserted from there, so a company ID
+      added concurrently by another session skips that row instead of the whole batch
+
+    Args:
+        companies: Company rows to insert, not validated. May be a generator.
+        batch_size: Number of companies per transaction.
+
+    Returns:
+        list[SqlId | None]: The database ID of each company in input order, or None for
+        companies skipped because their company_id already exists or the batch failed.
+    """
+    company_ids: list[SqlId | None] = []
+    seen: set[str] = set()
+
+    for batch in batched(companies, batch_size):
+        try:
+            company_ids.extend(_copy_companies(companies=batch, seen=seen))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} companies: {error}")
+            company_ids.extend([None] * len(batch))
+
+    return company_ids
+
+
+QUERY_EXISTING_COMPANY_IDS = (
+    "SELECT company_id FROM companies WHERE company_id = ANY(%(company_ids)s);"
+)
+
+QUERY_RESERVE_ADDRESS_IDS = """
+    SELECT nextval(pg_get_serial_sequence('postal_addresses', 'id')) AS id
+    FROM generate_series(1, %(count)s);
+"""
+
+QUERY_CREATE_COMPANIES_STAGING = """
+    CREATE TEMP TABLE companies_staging (
+      company_id char(5),
+      company_name varchar(255),
+      address_billing integer,
+      address_shipping integer,
+      phone_number varchar(20),
+      email varchar(255),
+      website varchar(255)
+    ) ON COMMIT DROP;
+"""
+
+COPY_POSTAL_ADDRESSES = (
+    "COPY postal_addresses (id, address_line1, address_line2, city, province, postal_code, "
+    "country) FROM STDIN"
+)
+
+COPY_COMPANIES_STAGING = (
+    "COPY companies_staging (company_id, company_name, address_billing, address_shipping, "
+    "phone_number, email, website) FROM STDIN"
+)
+
+QUERY_INSERT_STAGED_COMPANIES = """
+    INSERT INTO companies (company_id, company_name, address_billing, address_shipping, phone_number, email, website)
+    SELECT company_id, company_name, address_billing, address_shipping, phone_number, email, website
+    FROM companies_staging
+    ON CONFLICT (company_id) DO NOTHING
+    RETURNING id, company_id;
+"""
+
+QUERY_DELETE_STAGED_ADDRESSES = """
+    DELETE FROM postal_addresses p
+    USING companies_staging s
+    WHERE p.id IN (s.address_billing, s.address_shipping)
+      AND s.company_id <> ALL(%(inserted)s);
+"""
+"""Addresses of staged companies that another session inserted first"""
+
+
+def _accept_companies(
+    companies: tuple[CompanyRow, ...], seen: set[str], existing: set[str]
+) -> tuple[list[bool], list[str]]:
+    """Flags the companies whose company_id is new to ``seen``, ``existing`` and the batch.
+
+    ``seen`` is left unchanged: callers add the inserted company IDs once the batch commits.
+
+    Args:
+        companies: Company rows of one batch.
+        seen: Company IDs inserted by earlier batches.
+        existing: Company IDs of the batch already in the database.
+
+    Returns:
+        tuple[list[bool], list[str]]: Whether each company is accepted, and the skipped
+        company IDs.
+    """
+    taken = set(existing)
+    accepted: list[bool] = []
+    skipped: list[str] = []
+    for company_id, *_ in companies:
+        accepted.append(company_id not in seen and company_id not in taken)
+        if accepted[-1]:
+            taken.add(company_id)
+        else:
+            skipped.append(company_id)
+    return accepted, skipped
+
+
+def _address_count(companies: tuple[CompanyRow, ...], accepted: list[bool]) -> int:
+    """Number of postal addresses of the accepted companies."""
+    return sum(
+        (company[3] is not None) + 1
+        for company, is_accepted in zip(companies, accepted, strict=True)
+        if is_accepted
+    )
+
+
+def _company_copy_rows(
+    companies: tuple[CompanyRow, ...], accepted: list[bool], address_ids: list[int]
+) -> tuple[list[tuple], list[tuple]]:
+    """Builds the ``COPY_POSTAL_ADDRESSES`` and ``COPY_COMPANIES_STAGING`` rows.
+
+    Args:
+        companies: Company rows of one batch.
+        accepted: Whether each company is inserted. See ``_accept_companies``.
+        address_ids: Reserved postal address ids, one per address of accepted companies.
+
+    Returns:
+        tuple[list[tuple], list[tuple]]: The postal address rows and the company rows.
+    """
+    reserved_ids = iter(address_ids)
+    address_rows = []
+    company_rows = []
+    for company, is_accepted in zip(companies, accepted, strict=True):
+        if not is_accepted:
+            continue
+        company_id, company_name, billing, shipping, phone_number, email, website = company
+        billing_id = next(reserved_ids)
+        address_rows.append((billing_id, *billing))
+        shipping_id = None
+        if shipping is not None:
+            shipping_id = next(reserved_ids)
+            address_rows.append((shipping_id, *shipping))
+        company_rows.append(
+            (company_id, company_name, billing_id, shipping_id, phone_number, email, website)
+        )
+    return address_rows, company_rows
+
+
+def _copy_companies(companies: tuple[CompanyRow, ...], seen: set[str]) -> list[SqlId | None]:
+    """Copies one batch of companies in a single transaction. See ``add_company_rows``."""
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        cur.execute(
+            QUERY_EXISTING_COMPANY_IDS,
+            {"company_ids": [company[0] for company in companies]},
+        )
+        existing = {row["company_id"] for row in cur.fetchall()}
+
+        accepted, skipped = _accept_companies(companies=companies, seen=seen, existing=existing)
+        if skipped:
+            logfire.error(f"Company IDs already exist: {', '.join(skipped)}")
+
+        # Reserve address ids up front so each company row can reference its addresses
+        cur.execute(QUERY_RESERVE_ADDRESS_IDS, {"count": _address_count(companies, accepted)})
+        address_ids = [row["id"] for row in cur.fetchall()]
+        address_rows, company_rows = _company_copy_rows(
+            companies=companies, accepted=accepted, address_ids=address_ids
+        )
+
+        cur.execute(QUERY_CREATE_COMPANIES_STAGING)
+        with cur.copy(COPY_POSTAL_ADDRESSES) as copy:
+            for row in address_rows:
+                copy.write_row(row)
+        with cur.copy(COPY_COMPANIES_STAGING) as copy:
+            for row in company_rows:
+                copy.write_row(row)
+
+        cur.execute(QUERY_INSERT_STAGED_COMPANIES)
+        inserted = {row["company_id"]: row["id"] for row in cur.fetchall()}
+
+        # Drop the addresses of companies inserted concurrently by another session
+        cur.execute(QUERY_DELETE_STAGED_ADDRESSES, {"inserted": list(inserted)})
+
+        logfire.info(f"Inserted {len(inserted)} companies, skipped {len(skipped)}")
+
+    # The transaction has committed, so a failed batch never marks its companies as seen
+    seen.update(inserted)
+    return [
+        inserted.get(company[0]) if is_accepted else None
+        for company, is_accepted in zip(companies, accepted, strict=True)
+    ]
+
+
+QUERY_COMPANIES = """
+    SELECT c.id, c.company_id, c.company_name, c.phone_number, c.email, c.website,
+           b.address_line1 as billing_address_line1,
+           b.address_line2 as billing_address_line2,
+           b.city as billing_city,
+           b.province as billing_province,
+           b.postal_code as billing_postal_code,
+           b.country as billing_country,
+           s.address_line1 as shipping_address_line1,
+           s.address_line2 as shipping_address_line2,
+           s.city as shipping_city,
+           s.province as shipping_province,
+           s.postal_code as shipping_postal_code,
+           s.country as shipping_country
+    FROM companies c
+    LEFT JOIN postal_addresses b ON c.address_billing = b.id
+    LEFT JOIN postal_addresses s ON c.address_shipping = s.id
+"""
+"""Companies with billing and shipping addresses, shared by all company lookups"""
+
+
+def company_from_row(row: dict) -> Company:
+    """Builds a Company from a row selected with ``QUERY_COMPANIES``."""
+    return Company(
+        company_id=row["company_id"],
+        company_name=row["company_name"],
+        phone_number=row["phone_number"],
+        email=row["email"],
+        website=row["website"],
+        address_billing=Address(
+            address_line1=row["billing_address_line1"],
+            address_line2=row["billing_address_line2"],
+            city=row["billing_city"],
+            province=row["billing_province"],
+            postal_code=row["billing_postal_code"],
+            country=row["billing_country"],
+        ),
+        address_shipping=Address(
+            address_line1=row["shipping_address_line1"],
+            address_line2=row["shipping_address_line2"],
+            city=row["shipping_city"],
+            province=row["shipping_province"],
+            postal_code=row["shipping_postal_code"],
+            country=row["shipping_country"],
+        )
+        if row["shipping_address_line1"]
+        else None,
+    )
+
+
+QUERY_GET_COMPANY = QUERY_COMPANIES + "WHERE c.company_id = %(company_id)s;"
+
+QUERY_SAMPLE_COMPANIES = QUERY_COMPANIES + "WHERE c.id = ANY(%(ids)s);"
+
+
 def get_company(company_id: str) -> Company | None:
     """Retrieves a company's details from the database by its unique company ID.
 
@@ -157,141 +703,137 @@ def get_company(company_id: str) -> Company | None:
         Exception: Logs and returns None if any database or query-related error occurs.
     """
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            query = """
-                SELECT c.company_id, c.company_name, c.phone_number, c.email, c.website,
-                       b.address_line1 as billing_address_line1,
-                       b.address_line2 as billing_address_line2,
-                       b.city as billing_city,
-                       b.province as billing_province,
-                       b.postal_code as billing_postal_code,
-                       b.country as billing_country,
-                       s.address_line1 as shipping_address_line1,
-                       s.address_line2 as shipping_address_line2,
-                       s.city as shipping_city,
-                       s.province as shipping_province,
-                       s.postal_code as shipping_postal_code,
-                       s.country as shipping_country
-                FROM companies c
-                LEFT JOIN postal_addresses b ON c.address_billing = b.id
-                LEFT JOIN postal_addresses s ON c.address_shipping = s.id
-                WHERE c.company_id = %(company_id)s;
-            """
-            cur.execute(query=query, params={"company_id": company_id})
+            cur.execute(query=QUERY_GET_COMPANY, params={"company_id": company_id})
             results = cur.fetchone()
 
             if results is None:
-                logfire.info(f"No company found with ID: {company_id}")
+                logfire.debug("No company found with ID: {company_id}", company_id=company_id)
                 return None
 
-            company = Company(
-                company_id=results["company_id"],
-                company_name=results["company_name"],
-                phone_number=results["phone_number"],
-                email=results["email"],
-                website=results["website"],
-                address_billing=Address(
-                    address_line1=results["billing_address_line1"],
-                    address_line2=results["billing_address_line2"],
-                    city=results["billing_city"],
-                    province=results["billing_province"],
-                    postal_code=results["billing_postal_code"],
-                    country=results["billing_country"],
-                ),
-                address_shipping=Address(
-                    address_line1=results["shipping_address_line1"],
-                    address_line2=results["shipping_address_line2"],
-                    city=results["shipping_city"],
-                    province=results["shipping_province"],
-                    postal_code=results["shipping_postal_code"],
-                    country=results["shipping_country"],
-                )
-                if results["shipping_address_line1"]
-                else None,
-            )
-
-            return company
+            return company_from_row(results)
 
         except Exception as error:
             logfire.error(f"Failed to fetch companies: {error}")
             return None
 
 
-def get_random_companies(limit: int = 2) -> list[Company] | None:
-    """Retrieves a list of random companies from the database."""
+def get_random_companies_batch(limits: list[int], seed: int | None = None) -> list[list[Company]]:
+    """Retrieves random companies for many invoices at once.
+
+    Args:
+        limits: Number of distinct companies to draw for each sample.
+        seed: Random seed for reproducible samples. See ``_sample_rows``.
+
+    Returns:
+        list[list[Company]]: One list of companies per entry in ``limits``, or an empty
+        list if an error occurs.
+    """
     with (
-        POSTGRES_POOL.connection() as conn,
+        stage("db.sample", table="companies") as span,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            query = """
-                SELECT company_id
-                FROM companies
-                ORDER BY RANDOM()
-                LIMIT %(limit)s;
-            """
-            cur.execute(query=query, params={"limit": limit})
-            results = cur.fetchall()
-
-            companies = []
-            for result in results:
-                company = get_company(result["company_id"])
-                if company:
-                    companies.append(company)
+            samples = _run_sample(
+                cur=cur,
+                sample=_sample_rows(
+                    table="companies",
+                    query=QUERY_SAMPLE_COMPANIES,
+                    limits=limits,
+                    seed=seed,
+                ),
+            )
+            companies = [[company_from_row(row) for row in sample] for sample in samples]
 
-            logfire.info(f"Retrieved {len(companies)} companies")
+            span.add(items=sum(map(len, companies)))
+            logfire.info("Retrieved {count} random company samples", count=len(companies))
 
             return companies
 
         except Exception as error:
             logfire.error(f"Failed to fetch companies: {error}")
-            return None
+            return []
+
+
+def get_random_companies(limit: int = 2, seed: int | None = None) -> list[Company] | None:
+    """Retrieves a list of random companies from the database."""
+    samples = get_random_companies_batch(limits=[limit], seed=seed)
+    return samples[0] if samples else None
+
+
+QUERY_FIND_COMPANIES = (
+    QUERY_COMPANIES
+    + """
+    WHERE c.company_id::text ILIKE %(search)s
+       OR c.company_name ILIKE %(search)s
+       OR c.phone_number ILIKE %(search)s
+       OR c.email ILIKE %(search)s
+       OR c.website ILIKE %(search)s
+    ORDER BY greatest(
+        word_similarity(%(query)s, c.company_id::text),
+        word_similarity(%(query)s, c.company_name),
+        word_similarity(%(query)s, c.phone_number),
+        word_similarity(%(query)s, c.email),
+        word_similarity(%(query)s, c.website)
+    ) DESC, c.id
+    LIMIT %(limit)s OFFSET %(offset)s;
+    """
+)
+
+
+SEARCH_LIMIT = 20
+"""Default page size of ``find_company`` and ``find_invoice_item``"""
+
 
+def search_params(query: str, limit: int | None, offset: int) -> dict:
+    """Returns the parameters of the ``QUERY_FIND_*`` searches.
 
-def find_company(query: str) -> list[Company] | list[None]:
+    The ILIKE pattern is served by the trigram indexes in ``schema.sql`` and the raw query
+    ranks the matches with ``word_similarity``. A limit of None returns all matches, which
+    on a large table ranks every row matching a short query.
+    """
+    return {"search": f"%{query}%", "query": query, "limit": limit, "offset": offset}
+
+
+def find_company(
+    query: str, limit: int | None = SEARCH_LIMIT, offset: int = 0
+) -> list[Company] | list[None]:
     """Searches for companies in the database based on a search query.
 
     Searches across company_id, company_name, phone_number, email, and website
-    using case-insensitive partial matching.
+    using case-insensitive partial matching backed by a trigram index. The best
+    matches come first. Companies and their addresses are fetched in a single query.
 
     Args:
         query: A string to search for in company details.
+        limit: Maximum number of companies to return, ``SEARCH_LIMIT`` by default, or None
+            for all matches.
+        offset: Number of matches to skip, for paging through the results.
 
     Returns:
         A list of Company objects matching the search query, or an empty list
         if no companies are found or an error occurs.
     """
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            search = f"%{query}%"
-            sql_query = """
-                SELECT company_id
-                FROM companies
-                WHERE company_id ILIKE %(search)s
-                   OR company_name ILIKE %(search)s
-                   OR phone_number ILIKE %(search)s
-                   OR email ILIKE %(search)s
-                   OR website ILIKE %(search)s;
-            """
-            cur.execute(query=sql_query, params={"search": search})
+            params = search_params(query=query, limit=limit, offset=offset)
+            cur.execute(query=QUERY_FIND_COMPANIES, params=params)
             results = cur.fetchall()
 
-            companies = []
-            for result in results:
-                try:
-                    company = get_company(result["company_id"])
-                except Exception as error:
-                    logfire.error(f"Failed to fetch company: {error}")
-                    continue
-                companies.append(company)
+            companies = [company_from_row(result) for result in results]
 
-            logfire.info(f"Found {len(companies)} companies matching query: '{query}'")
+            logfire.debug(
+                "Found {count} companies matching query: '{query}'",
+                count=len(companies),
+                query=query,
+            )
             return companies
 
         except Exception as error:
@@ -299,6 +841,38 @@ def find_company(query: str) -> list[Company] | list[None]:
             return []
 
 
+QUERY_COMPANY_IDS = "SELECT company_id FROM companies;"
+
+
+def get_company_ids() -> set[str]:
+    """Retrieves the IDs of all companies in the database.
+
+    Only the ``company_id`` column is read, so checking generated companies for
+    uniqueness stays cheap as the catalog grows.
+
+    Returns:
+        set[str]: The company IDs, or an empty set if an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_COMPANY_IDS)
+            return {company_id for (company_id,) in cur}
+
+        except Exception as error:
+            logfire.error(f"Failed to get company IDs: {error}")
+            return set()
+
+
+QUERY_ADD_INVOICE_ITEM = """
+    INSERT INTO invoice_items (item_sku, item_info, quantity, unit_price)
+    VALUES (%(item_sku)s, %(item_info)s, %(quantity)s, %(unit_price)s)
+    RETURNING id;
+"""
+
+
 def add_invoice_item(invoice_item: InvoiceItem) -> SqlId | None:
     """Adds a new invoice item to the database.
 
@@ -314,22 +888,19 @@ def add_invoice_item(invoice_item: InvoiceItem) -> SqlId | None:
     """
 
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            query_invoice_item = """
-                INSERT INTO invoice_items (item_sku, item_info, quantity, unit_price)
-                VALUES (%(item_sku)s, %(item_info)s, %(quantity)s, %(unit_price)s)
-                RETURNING id;
-            """
             params = invoice_item.model_dump()
-            cur.execute(query=query_invoice_item, params=params)
+            cur.execute(query=QUERY_ADD_INVOICE_ITEM, params=params)
             invoice_item_id: int = cur.fetchone()["id"]
             assert isinstance(invoice_item_id, int)
 
-            logfire.info(
-                f"Inserted Invoice Item: {invoice_item.item_sku} - {invoice_item.item_info}"
+            logfire.debug(
+                "Inserted Invoice Item: {item_sku} - {item_info}",
+                item_sku=invoice_item.item_sku,
+                item_info=invoice_item.item_info,
             )
 
             return invoice_item_id
@@ -342,6 +913,176 @@ def add_invoice_item(invoice_item: InvoiceItem) -> SqlId | None:
             return None
 
 
+InvoiceItemRow = tuple[str, str, int, Decimal]
+"""Invoice item as (item_sku, item_info, quantity, unit_price)"""
+
+
+def invoice_item_row(invoice_item: InvoiceItem) -> InvoiceItemRow:
+    """Converts an invoice item to the ``InvoiceItemRow`` of ``add_invoice_item_rows``."""
+    return (
+        invoice_item.item_sku,
+        invoice_item.item_info,
+        invoice_item.quantity,
+        invoice_item.unit_price,
+    )
+
+
+def add_invoice_items(
+    invoice_items: Iterable[InvoiceItem], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many invoice items using the COPY protocol.
+
+    See ``add_invoice_item_rows``, which skips building ``InvoiceItem`` models for bulk loads.
+
+    Args:
+        invoice_items: Invoice items to insert. May be a generator.
+        batch_size: Number of invoice items per transaction.
+
+    Returns:
+        list[SqlId | None]: The database ID of each invoice item in input order, or None for
+        items skipped because their item_sku already exists or the batch failed.
+    """
+    return add_invoice_item_rows(
+        invoice_items=(invoice_item_row(item) for item in invoice_items), batch_size=batch_size
+    )
+
+
+def add_invoice_item_rows(
+    invoice_items: Iterable[InvoiceItemRow], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many invoice items using the COPY protocol.
+
+    Items are copied into a staging table and inserted from there in batches of
+    ``batch_size``, each batch in one transaction. Items whose SKU already exists, or
+    repeats earlier in the input, are skipped without aborting the batch.
+
+    Args:
+        invoice_items: Invoice item rows to insert, not validated. May be a generator.
+        batch_size: Number of invoice items per transaction.
+
+    Returns:
+        list[SqlId | None]: The database ID of each invoice item in input order, or None for
+        items skipped because their item_sku already exists or the batch failed.
+    """
+    invoice_item_ids: list[SqlId | None] = []
+
+    for batch in batched(invoice_items, batch_size):
+        try:
+            invoice_item_ids.extend(_copy_invoice_items(invoice_items=batch))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} invoice items: {error}")
+            invoice_item_ids.extend([None] * len(batch))
+
+    return invoice_item_ids
+
+
+QUERY_CREATE_INVOICE_ITEMS_STAGING = """
+    CREATE TEMP TABLE invoice_items_staging (
+      position integer,
+      item_sku char(5),
+      item_info varchar(255),
+      quantity integer,
+      unit_price decimal(10, 2)
+    ) ON COMMIT DROP;
+"""
+
+COPY_INVOICE_ITEMS_STAGING = (
+    "COPY invoice_items_staging (position, item_sku, item_info, quantity, unit_price) FROM STDIN"
+)
+
+QUERY_INSERT_STAGED_INVOICE_ITEMS = """
+    INSERT INTO invoice_items (item_sku, item_info, quantity, unit_price)
+    SELECT DISTINCT ON (item_sku) item_sku, item_info, quantity, unit_price
+    FROM invoice_items_staging
+    ORDER BY item_sku, position
+    ON CONFLICT (item_sku) DO NOTHING
+    RETURNING id, item_sku;
+"""
+
+
+def _invoice_item_copy_rows(invoice_items: tuple[InvoiceItemRow, ...]) -> list[tuple]:
+    """Builds the ``COPY_INVOICE_ITEMS_STAGING`` rows of a batch."""
+    return [(position, *item) for position, item in enumerate(invoice_items)]
+
+
+def _staged_invoice_item_ids(
+    invoice_items: tuple[InvoiceItemRow, ...], inserted: list[dict]
+) -> tuple[list[SqlId | None], list[str]]:
+    """Maps the rows returned by ``QUERY_INSERT_STAGED_INVOICE_ITEMS`` back to the batch.
+
+    Returns:
+        tuple[list[SqlId | None], list[str]]: The id of each invoice item, None if skipped,
+        and the skipped SKUs.
+    """
+    ids_by_sku = {row["item_sku"]: row["id"] for row in inserted}
+
+    # Only the first occurrence of a newly inserted SKU maps to its id
+    invoice_item_ids = [ids_by_sku.pop(item[0], None) for item in invoice_items]
+    skipped = [
+        item[0]
+        for item, item_id in zip(invoice_items, invoice_item_ids, strict=True)
+        if item_id is None
+    ]
+    return invoice_item_ids, skipped
+
+
+def _copy_invoice_items(invoice_items: tuple[InvoiceItemRow, ...]) -> list[SqlId | None]:
+    """Copies one batch of invoice items in a single transaction. See ``add_invoice_item_rows``."""
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        cur.execute(QUERY_CREATE_INVOICE_ITEMS_STAGING)
+        with cur.copy(COPY_INVOICE_ITEMS_STAGING) as copy:
+            for row in _invoice_item_copy_rows(invoice_items):
+                copy.write_row(row)
+
+        cur.execute(QUERY_INSERT_STAGED_INVOICE_ITEMS)
+        invoice_item_ids, skipped = _staged_invoice_item_ids(
+            invoice_items=invoice_items, inserted=cur.fetchall()
+        )
+
+        if skipped:
+            logfire.error(f"Invoice Item SKUs already exist: {', '.join(skipped)}")
+        logfire.info(f"Inserted {len(invoice_items) - len(skipped)} invoice items")
+
+        return invoice_item_ids
+
+
+QUERY_INVOICE_ITEMS = """
+    SELECT id, item_sku, item_info, quantity, unit_price
+    FROM invoice_items
+"""
+"""Invoice items, shared by all invoice item lookups"""
+
+QUERY_GET_INVOICE_ITEM = QUERY_INVOICE_ITEMS + "WHERE item_sku = %(item_sku)s;"
+
+QUERY_SAMPLE_INVOICE_ITEMS = QUERY_INVOICE_ITEMS + "WHERE id = ANY(%(ids)s);"
+
+QUERY_FIND_INVOICE_ITEMS = (
+    QUERY_INVOICE_ITEMS
+    + """
+    WHERE item_sku::text ILIKE %(search)s
+       OR item_info ILIKE %(search)s
+    ORDER BY greatest(
+        word_similarity(%(query)s, item_sku::text),
+        word_similarity(%(query)s, item_info)
+    ) DESC, created_at DESC, id
+    LIMIT %(limit)s OFFSET %(offset)s;
+    """
+)
+
+
+def invoice_item_from_row(row: dict) -> InvoiceItem:
+    """Builds an InvoiceItem from a row selected with ``QUERY_INVOICE_ITEMS``."""
+    return InvoiceItem(
+        item_sku=row["item_sku"],
+        item_info=row["item_info"],
+        quantity=row["quantity"],
+        unit_price=row["unit_price"],
+    )
+
+
 def get_invoice_item(item_sku: str) -> InvoiceItem | None:
     """Retrieves a single invoice item from the database by its SKU.
 
@@ -361,22 +1102,17 @@ def get_invoice_item(item_sku: str) -> InvoiceItem | None:
             error occurs during retrieval.
     """
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            query = """
-                SELECT item_sku, item_info, quantity, unit_price
-                FROM invoice_items 
-                WHERE item_sku = %(item_sku)s;
-            """
-            cur.execute(query=query, params={"item_sku": item_sku})
+            cur.execute(query=QUERY_GET_INVOICE_ITEM, params={"item_sku": item_sku})
             result = cur.fetchone()
 
             if result is None:
                 return None
 
-            invoice_item = InvoiceItem(**result)
+            invoice_item = invoice_item_from_row(result)
 
             return invoice_item
 
@@ -385,25 +1121,38 @@ def get_invoice_item(item_sku: str) -> InvoiceItem | None:
             return None
 
 
-def get_random_invoice_items(limit: int = 2) -> list[InvoiceItem]:
-    """Retrieves a list of random invoice items from the database."""
+def get_random_invoice_items_batch(
+    limits: list[int], seed: int | None = None
+) -> list[list[InvoiceItem]]:
+    """Retrieves random invoice items for many invoices at once.
+
+    Args:
+        limits: Number of distinct invoice items to draw for each sample.
+        seed: Random seed for reproducible samples. See ``_sample_rows``.
+
+    Returns:
+        list[list[InvoiceItem]]: One list of invoice items per entry in ``limits``, or an
+        empty list if an error occurs.
+    """
     with (
-        POSTGRES_POOL.connection() as conn,
+        stage("db.sample", table="invoice_items") as span,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            query = """
-                SELECT item_sku, item_info, quantity, unit_price
-                FROM invoice_items
-                ORDER BY RANDOM()
-                LIMIT %(limit)s;
-            """
-            cur.execute(query=query, params={"limit": limit})
-            results = cur.fetchall()
-
-            invoice_items = [InvoiceItem(**item) for item in results]
+            samples = _run_sample(
+                cur=cur,
+                sample=_sample_rows(
+                    table="invoice_items",
+                    query=QUERY_SAMPLE_INVOICE_ITEMS,
+                    limits=limits,
+                    seed=seed,
+                ),
+            )
+            invoice_items = [[invoice_item_from_row(row) for row in sample] for sample in samples]
 
-            logfire.info(f"Retrieved {len(invoice_items)} invoice items")
+            span.add(items=sum(map(len, invoice_items)))
+            logfire.info("Retrieved {count} random invoice item samples", count=len(invoice_items))
 
             return invoice_items
 
@@ -412,20 +1161,31 @@ def get_random_invoice_items(limit: int = 2) -> list[InvoiceItem]:
             return []
 
 
-def find_invoice_item(query: str) -> list[InvoiceItem] | list[None]:
+def get_random_invoice_items(limit: int = 2, seed: int | None = None) -> list[InvoiceItem]:
+    """Retrieves a list of random invoice items from the database."""
+    samples = get_random_invoice_items_batch(limits=[limit], seed=seed)
+    return samples[0] if samples else []
+
+
+def find_invoice_item(
+    query: str, limit: int | None = SEARCH_LIMIT, offset: int = 0
+) -> list[InvoiceItem] | list[None]:
     """Searches for invoice items in the database based on a search query.
 
     This function performs a case-insensitive search across item_sku and item_info
-    fields in the invoice_items table. Results are ordered by creation date in
-    descending order.
+    fields in the invoice_items table, backed by a trigram index. Results are ranked
+    by similarity to the query, then ordered by creation date in descending order.
 
     Args:
         query (str): A string to search for in invoice item details. The search is
             performed using partial matching (contains) on both SKU and item info.
+        limit (int | None): Maximum number of items to return, ``SEARCH_LIMIT`` by
+            default, or None for all matches.
+        offset (int): Number of matches to skip, for paging through the results.
 
     Returns:
         list[InvoiceItem] | list[None]: A list of InvoiceItem objects matching the
-            search query, ordered by creation date (newest first). Returns an empty
+            search query, best matches first and then newest first. Returns an empty
             list if no items are found or if an error occurs during the search.
 
     Raises:
@@ -433,24 +1193,21 @@ def find_invoice_item(query: str) -> list[InvoiceItem] | list[None]:
             query-related error occurs during the search operation.
     """
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor(row_factory=dict_row) as cur,
     ):
         try:
-            search = f"%{query}%"
-            sql_query = """
-                SELECT item_sku, item_info, quantity, unit_price 
-                FROM invoice_items
-                WHERE item_sku ILIKE %(search)s
-                   OR item_info ILIKE %(search)s
-                ORDER BY created_at DESC;
-            """
-            cur.execute(query=sql_query, params={"search": search})
+            params = search_params(query=query, limit=limit, offset=offset)
+            cur.execute(query=QUERY_FIND_INVOICE_ITEMS, params=params)
             results = cur.fetchall()
 
-            invoice_items = [InvoiceItem(**item) for item in results]
+            invoice_items = [invoice_item_from_row(result) for result in results]
 
-            logfire.info(f"Found {len(invoice_items)} invoice items matching query: '{query}'")
+            logfire.debug(
+                "Found {count} invoice items matching query: '{query}'",
+                count=len(invoice_items),
+                query=query,
+            )
             return invoice_items
 
         except Exception as error:
@@ -458,9 +1215,726 @@ def find_invoice_item(query: str) -> list[InvoiceItem] | list[None]:
             return []
 
 
-def add_invoice(invoice: Invoice) -> SqlId | None:
-    """Adds a new invoice to the database."""
+QUERY_INVOICE_ITEM_SKUS = "SELECT item_sku FROM invoice_items;"
 
 
-def get_invoice(invoice_number: int) -> Invoice | None:
-    """Retrieves an invoice from the database by its ID."""
+def get_invoice_item_skus() -> set[str]:
+    """Retrieves the SKUs of all invoice items in the database. See ``get_company_ids``.
+
+    Returns:
+        set[str]: The invoice item SKUs, or an empty set if an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_INVOICE_ITEM_SKUS)
+            return {item_sku for (item_sku,) in cur}
+
+        except Exception as error:
+            logfire.error(f"Failed to get invoice item SKUs: {error}")
+            return set()
+
+
+QUERY_RESERVE_INVOICE_NUMBERS = """
+    SELECT nextval('invoice_number_seq') AS invoice_number
+    FROM generate_series(1, %(count)s);
+"""
+
+
+def reserve_invoice_numbers(count: int) -> list[int]:
+    """Reserves invoice numbers that were never handed out, from ``invoice_number_seq``.
+
+    Numbers are unique across runs and concurrent callers, so a generated invoice never
+    reuses the number, and PDF name, of a stored one.
+
+    Args:
+        count: Number of invoice numbers to reserve.
+
+    Returns:
+        list[int]: The reserved numbers in increasing order, empty if the query failed.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_RESERVE_INVOICE_NUMBERS, params={"count": count})
+            return [row["invoice_number"] for row in cur.fetchall()]
+
+        except Exception as error:
+            logfire.error(f"Failed to reserve invoice numbers: {error}")
+            return []
+
+
+QUERY_ADD_INVOICE = """
+    WITH lines AS (
+        SELECT l.position, i.id AS invoice_item, l.quantity, l.unit_price
+        FROM unnest(%(item_skus)s::text[], %(quantities)s::integer[], %(unit_prices)s::numeric[])
+             WITH ORDINALITY AS l(item_sku, quantity, unit_price, position)
+        JOIN invoice_items i ON i.item_sku = l.item_sku
+    ), invoice AS (
+        INSERT INTO invoice_records (invoice_number, issue_date, due_date, supplier, customer, tax_rate, currency)
+        SELECT %(invoice_number)s, %(issue_date)s, %(due_date)s, s.id, c.id, %(tax_rate)s, %(currency)s
+        FROM companies s, companies c
+        WHERE s.company_id = %(supplier)s AND c.company_id = %(customer)s
+          AND (SELECT count(*) FROM lines) = cardinality(%(item_skus)s::text[])
+        ON CONFLICT (invoice_number) DO NOTHING
+        RETURNING id
+    ), line_items AS (
+        INSERT INTO invoice_line_items (invoice, position, invoice_item, quantity, unit_price)
+        SELECT invoice.id, lines.position, lines.invoice_item, lines.quantity, lines.unit_price
+        FROM invoice, lines
+    )
+    SELECT id FROM invoice;
+"""
+"""Invoice with its line items in one atomic statement, see ``invoice_params``.
+
+Inserts nothing if the invoice number exists, or the supplier, customer or an item SKU does not.
+"""
+
+
+def invoice_params(invoice: Invoice) -> dict:
+    """Builds the ``QUERY_ADD_INVOICE`` parameters of an invoice."""
+    return {
+        "invoice_number": invoice.invoice_number,
+        "issue_date": invoice.issue_date,
+        "due_date": invoice.due_date,
+        "supplier": invoice.supplier.company_id,
+        "customer": invoice.customer.company_id,
+        "tax_rate": invoice.tax_rate,
+        "currency": invoice.currency.value,
+        "item_skus": [item.item_sku for item in invoice.line_items],
+        "quantities": [item.quantity for item in invoice.line_items],
+        "unit_prices": [item.unit_price for item in invoice.line_items],
+    }
+
+
+def add_invoice(invoice: Invoice) -> SqlId | None:
+    """Adds a new invoice with its line items to the database.
+
+    The invoice references its supplier and customer in the companies table and each line item
+    references its invoice item by SKU, with the quantity and unit price of the invoice. The
+    invoice and its line items are inserted by a single statement, so either all rows are
+    written or none are.
+
+    Args:
+        invoice (Invoice): The invoice to insert. Its supplier, customer and line items must
+            already be in the database.
+
+    Returns:
+        SqlId | None: The database ID of the newly inserted invoice if successful,
+        None if the invoice number already exists, the supplier, customer or an item SKU
+        is not in the database, or the insertion fails.
+    """
+    ids = add_invoices(invoices=[invoice])
+    return ids[0] if ids else None
+
+
+def add_invoices(
+    invoices: Iterable[Invoice], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many invoices with their line items, one transaction per batch.
+
+    The ``QUERY_ADD_INVOICE`` statements of a batch are pipelined in a single round trip.
+    Invoices that cannot be inserted, see ``add_invoice``, are skipped without aborting the
+    batch.
+
+    Args:
+        invoices: Invoices to insert. May be a generator.
+        batch_size: Number of invoices per transaction.
+
+    Returns:
+        list[SqlId | None]: The database ID of each invoice in input order, or None for
+        invoices skipped or in a failed batch.
+    """
+    invoice_ids: list[SqlId | None] = []
+
+    for batch in batched(invoices, batch_size):
+        try:
+            invoice_ids.extend(_insert_invoices(invoices=batch))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} invoices: {error}")
+            invoice_ids.extend([None] * len(batch))
+
+    return invoice_ids
+
+
+def _collect_inserted_ids(
+    cur: Cursor | AsyncCursor,
+) -> Generator[None, dict | None, list[SqlId | None]]:
+    """Collects the id returned by each statement of an ``executemany(returning=True)``.
+
+    The generator yields once per statement and expects its first row (``fetchone``) to be
+    sent back, so the sync and async database modules share the loop. See ``_inserted_ids``.
+    """
+    ids = []
+    while True:
+        row = yield
+        ids.append(row["id"] if row else None)
+        if not cur.nextset():
+            return ids
+
+
+def _inserted_ids(cur: Cursor) -> list[SqlId | None]:
+    """Runs ``_collect_inserted_ids`` on a cursor and returns the ids."""
+    collect = _collect_inserted_ids(cur)
+    next(collect)
+    try:
+        while True:
+            collect.send(cur.fetchone())
+    except StopIteration as stop:
+        return stop.value
+
+
+def _insert_invoices(invoices: tuple[Invoice, ...]) -> list[SqlId | None]:
+    """Inserts one batch of invoices in a single transaction. See ``add_invoices``."""
+    with (
+        stage("db.insert", table="invoice_records") as span,
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        cur.executemany(
+            QUERY_ADD_INVOICE, [invoice_params(invoice) for invoice in invoices], returning=True
+        )
+        invoice_ids = _inserted_ids(cur)
+
+        skipped = [
+            invoice.invoice_number
+            for invoice, invoice_id in zip(invoices, invoice_ids, strict=True)
+            if invoice_id is None
+        ]
+        if skipped:
+            logfire.error(
+                "Invoices already exist or reference missing companies or invoice items: "
+                f"{', '.join(skipped)}"
+            )
+        span.add(items=len(invoices) - len(skipped))
+        logfire.info("Inserted {count} invoices", count=len(invoices) - len(skipped))
+
+        return invoice_ids
+
+
+QUERY_INVOICES = f"""
+    SELECT r.invoice_number, r.issue_date, r.due_date, r.tax_rate, r.currency,
+           (SELECT row_to_json(s) FROM ({QUERY_COMPANIES} WHERE c.id = r.supplier) s) AS supplier,
+           (SELECT row_to_json(s) FROM ({QUERY_COMPANIES} WHERE c.id = r.customer) s) AS customer,
+           (SELECT coalesce(json_agg(json_build_object(
+                       'item_sku', i.item_sku,
+                       'item_info', i.item_info,
+                       'quantity', l.quantity,
+                       'unit_price', l.unit_price
+                   ) ORDER BY l.position), '[]')
+            FROM invoice_line_items l
+            JOIN invoice_items i ON i.id = l.invoice_item
+            WHERE l.invoice = r.id) AS line_items
+    FROM invoice_records r
+"""
+"""Invoices with their companies and line items as JSON, one row per invoice"""
+
+QUERY_GET_INVOICE = QUERY_INVOICES + "WHERE r.invoice_number = %(invoice_number)s;"
+
+QUERY_GET_INVOICES = QUERY_INVOICES + "WHERE r.invoice_number = ANY(%(invoice_numbers)s);"
+
+
+def invoice_from_row(row: dict) -> Invoice:
+    """Builds an Invoice from a row selected with ``QUERY_INVOICES``."""
+    return Invoice(
+        invoice_number=row["invoice_number"],
+        issue_date=row["issue_date"],
+        due_date=row["due_date"],
+        supplier=company_from_row(row["supplier"]),
+        customer=company_from_row(row["customer"]),
+        line_items=[invoice_item_from_row(line_item) for line_item in row["line_items"]],
+        tax_rate=row["tax_rate"],
+        currency=row["currency"],
+    )
+
+
+def get_invoice(invoice_number: str) -> Invoice | None:
+    """Retrieves an invoice with its companies and line items by its invoice number.
+
+    The invoice, its supplier and customer with their addresses, and its line items in
+    invoice order are fetched with a single query.
+
+    Args:
+        invoice_number (str): The unique invoice number, such as ``INV-1234``.
+
+    Returns:
+        Invoice | None: The invoice if found, or None if no invoice has this number or an
+        error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_GET_INVOICE, params={"invoice_number": invoice_number})
+            result = cur.fetchone()
+
+            if result is None:
+                logfire.debug(
+                    "No invoice found with number: {invoice_number}", invoice_number=invoice_number
+                )
+                return None
+
+            return invoice_from_row(result)
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice: {error}")
+            return None
+
+
+def get_invoices(invoice_numbers: list[str]) -> list[Invoice]:
+    """Retrieves many invoices with a single query. See ``get_invoice``.
+
+    Returns:
+        list[Invoice]: The invoices found, in no particular order, or an empty list if an
+        error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_GET_INVOICES, params={"invoice_numbers": invoice_numbers})
+            invoices = [invoice_from_row(row) for row in cur]
+
+            logfire.info(f"Retrieved {len(invoices)}/{len(invoice_numbers)} invoices")
+
+            return invoices
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoices: {error}")
+            return []
+
+
+QUERY_INVOICE_LINE_CENTS = """
+    SELECT r.invoice_number,
+           r.tax_rate,
+           coalesce(array_agg(l.quantity) FILTER (WHERE l.id IS NOT NULL), '{}') AS quantities,
+           coalesce(
+               array_agg((l.unit_price * 100)::bigint) FILTER (WHERE l.id IS NOT NULL), '{}'
+           ) AS unit_price_cents
+    FROM invoice_records r
+    LEFT JOIN invoice_line_items l ON l.invoice = r.id
+    WHERE r.invoice_number = ANY(%(invoice_numbers)s)
+    GROUP BY r.id;
+"""
+
+
+def get_invoice_totals(invoice_numbers: list[str]) -> dict[str, tuple[int, int, int]]:
+    """Computes the totals of many stored invoices at once, without building ``Invoice`` models.
+
+    Line items are fetched as integer cents and summed with ``money.batch_totals``, for bulk
+    reconciliation against extracted or reported totals. Needs NumPy.
+
+    Returns:
+        dict[str, tuple[int, int, int]]: The subtotal, tax and total in cents of each invoice
+        found, by invoice number, or an empty dict if an error occurs.
+    """
+    with (
+        stage("db.totals") as span,
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_INVOICE_LINE_CENTS, params={"invoice_numbers": invoice_numbers})
+            rows = cur.fetchall()
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice line items: {error}")
+            return {}
+
+        span.add(items=len(rows))
+        return _invoice_totals(rows)
+
+
+def _invoice_totals(rows: list[tuple]) -> dict[str, tuple[int, int, int]]:
+    """Sums the ``QUERY_INVOICE_LINE_CENTS`` rows with ``money.batch_totals``."""
+    import numpy as np
+
+    from .money import batch_totals
+
+    if not rows:
+        return {}
+    numbers, tax_rates, quantities, unit_price_cents = zip(*rows, strict=True)
+    line_counts = np.fromiter(map(len, quantities), dtype=np.intp, count=len(quantities))
+    subtotals, taxes, totals = batch_totals(
+        invoice_index=np.repeat(np.arange(len(numbers)), line_counts),
+        quantities=np.concatenate([np.asarray(q, dtype=np.int64) for q in quantities]),
+        unit_price_cents=np.concatenate([np.asarray(p, dtype=np.int64) for p in unit_price_cents]),
+        tax_rates=np.asarray(tax_rates, dtype=np.int64),
+    )
+
+    return dict(
+        zip(
+            numbers,
+            zip(subtotals.tolist(), taxes.tolist(), totals.tolist(), strict=True),
+            strict=True,
+        )
+    )
+
+
+QUERY_EXISTING_FILE_SHA256 = (
+    "SELECT file_sha256 FROM invoices WHERE file_sha256 = ANY(%(file_sha256)s);"
+)
+
+QUERY_ADD_INVOICE_FILES = """
+    INSERT INTO invoices (file_origin, file_mime_type, file_sha256)
+    SELECT * FROM unnest(%(file_origin)s::text[], %(file_mime_type)s::text[], %(file_sha256)s::text[])
+    ON CONFLICT (file_sha256) DO NOTHING
+    RETURNING id, file_sha256;
+"""
+
+
+def add_invoice_files(
+    files: Iterable[InvoiceFile], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds invoice files whose SHA-256 is not in the database yet.
+
+    Files are inserted in batches of ``batch_size``, each batch in one transaction:
+    - The known hashes of the whole batch are looked up with a single query
+    - The new files are inserted with a single statement, skipping a hash inserted
+      concurrently by another session
+    Only the first file of a hash repeated in the input is inserted, or the first one after
+    a failed batch.
+
+    Args:
+        files: Invoice files to insert. May be a generator.
+        batch_size: Number of files per transaction.
+
+    Returns:
+        list[SqlId | None]: The database ID of each file in input order, or None for files
+        whose hash already exists, repeats earlier in the input or whose batch failed.
+    """
+    file_ids: list[SqlId | None] = []
+    seen: set[str] = set()
+
+    for batch in batched(files, batch_size):
+        try:
+            file_ids.extend(_insert_invoice_files(files=batch, seen=seen))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} invoice files: {error}")
+            file_ids.extend([None] * len(batch))
+
+    return file_ids
+
+
+def _new_invoice_files(
+    files: tuple[InvoiceFile, ...], seen: set[str], existing: set[str]
+) -> list[InvoiceFile]:
+    """The files of a batch whose hash is new to ``seen``, ``existing`` and the batch."""
+    taken = set(existing)
+    new_files = []
+    for file in files:
+        if file.file_sha256 not in seen and file.file_sha256 not in taken:
+            taken.add(file.file_sha256)
+            new_files.append(file)
+    return new_files
+
+
+def _invoice_file_params(files: list[InvoiceFile]) -> dict:
+    """Query parameters of ``QUERY_ADD_INVOICE_FILES``."""
+    return {field: [getattr(file, field) for file in files] for field in InvoiceFile.model_fields}
+
+
+def _insert_invoice_files(files: tuple[InvoiceFile, ...], seen: set[str]) -> list[SqlId | None]:
+    """Inserts the new files of one batch in a single transaction. See ``add_invoice_files``."""
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        cur.execute(
+            QUERY_EXISTING_FILE_SHA256, {"file_sha256": [file.file_sha256 for file in files]}
+        )
+        existing = {row["file_sha256"] for row in cur.fetchall()}
+
+        new_files = _new_invoice_files(files=files, seen=seen, existing=existing)
+        inserted = {}
+        if new_files:
+            cur.execute(QUERY_ADD_INVOICE_FILES, _invoice_file_params(new_files))
+            inserted = {row["file_sha256"]: row["id"] for row in cur.fetchall()}
+
+        logfire.info(
+            f"Inserted {len(inserted)} invoice files, skipped {len(files) - len(inserted)}"
+        )
+
+    # The transaction has committed, so a failed batch never marks its files as seen
+    seen.update(inserted)
+    # Only the first occurrence of a newly inserted hash maps to its id
+    return [inserted.pop(file.file_sha256, None) for file in files]
+
+
+QUERY_INVOICE_FILES_WITHOUT_WEBP = """
+    SELECT id, file_origin, file_mime_type
+    FROM invoices
+    WHERE file_webp_sha256 IS NULL AND id > %(after_id)s
+    ORDER BY id
+    LIMIT %(limit)s;
+"""
+"""Keyset page of invoice files without a WebP preview, see ``invoices_file_webp_missing_idx``"""
+
+QUERY_SET_INVOICE_WEBPS = """
+    UPDATE invoices i
+    SET file_webp_sha256 = w.file_webp_sha256, updated_at = current_timestamp
+    FROM unnest(%(ids)s::integer[], %(file_webp_sha256)s::text[]) AS w(id, file_webp_sha256)
+    WHERE i.id = w.id;
+"""
+
+QUERY_INVOICE_WEBP_SHA256 = "SELECT file_webp_sha256 FROM invoices WHERE id = %(id)s;"
+
+
+def get_invoice_files_without_webp(after_id: SqlId = 0, limit: int = 100) -> list[dict]:
+    """Retrieves a page of invoice files without a WebP preview.
+
+    Args:
+        after_id: Only return files with a greater id, the last id of the previous page.
+        limit: Maximum number of files to return.
+
+    Returns:
+        list[dict]: The ``id``, ``file_origin`` and ``file_mime_type`` of each file in id
+        order, or an empty list if an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            cur.execute(
+                query=QUERY_INVOICE_FILES_WITHOUT_WEBP,
+                params={"after_id": after_id, "limit": limit},
+            )
+            return cur.fetchall()
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice files without preview: {error}")
+            return []
+
+
+def set_invoice_webps(webps: dict[SqlId, str]) -> int:
+    """Records the blob keys of the WebP previews of many invoice files in one statement.
+
+    Args:
+        webps: SHA-256 blob key of the preview by invoice file id. See ``blobs.BlobStore``.
+
+    Returns:
+        int: The number of invoice files updated, 0 if an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(
+                query=QUERY_SET_INVOICE_WEBPS,
+                params={"ids": list(webps), "file_webp_sha256": list(webps.values())},
+            )
+            return cur.rowcount
+
+        except Exception as error:
+            logfire.error(f"Failed to store {len(webps)} invoice previews: {error}")
+            return 0
+
+
+def get_invoice_webp_sha256(invoice_file_id: SqlId) -> str | None:
+    """Retrieves the blob key of the WebP preview of an invoice file.
+
+    Returns:
+        str | None: The SHA-256 blob key, or None if the file has no preview, does not exist
+        or an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_INVOICE_WEBP_SHA256, params={"id": invoice_file_id})
+            row = cur.fetchone()
+            return row[0] if row else None
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice preview key: {error}")
+            return None
+
+
+QUERY_ADD_BLOBS = """
+    INSERT INTO blobs (sha256, content)
+    SELECT * FROM unnest(%(sha256)s::text[], %(content)s::bytea[])
+    ON CONFLICT (sha256) DO NOTHING;
+"""
+
+QUERY_GET_BLOB = "SELECT content FROM blobs WHERE sha256 = %(sha256)s;"
+
+
+def add_blobs(blobs: dict[str, bytes]) -> None:
+    """Stores content-addressed blobs in one statement, skipping the known keys.
+
+    Args:
+        blobs: Blob content by SHA-256 key.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        cur.execute(
+            query=QUERY_ADD_BLOBS,
+            params={"sha256": list(blobs), "content": list(blobs.values())},
+        )
+
+
+def get_blob(sha256: str) -> bytes | None:
+    """Retrieves the content of a blob, or None if the key is unknown."""
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        cur.execute(query=QUERY_GET_BLOB, params={"sha256": sha256})
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+QUERY_INVOICE_FILES_WITHOUT_EXTRACTION = """
+    SELECT i.id, i.file_origin, i.file_mime_type, i.file_sha256
+    FROM invoices i
+    WHERE i.id > %(after_id)s
+      AND NOT EXISTS (SELECT 1 FROM invoice_extractions e WHERE e.file_sha256 = i.file_sha256)
+    ORDER BY i.id
+    LIMIT %(limit)s;
+"""
+"""Keyset page of invoice files neither extracted nor recorded as failed yet"""
+
+QUERY_ADD_INVOICE_EXTRACTIONS = """
+    INSERT INTO invoice_extractions (file_sha256, model, invoice)
+    SELECT file_sha256, %(model)s, invoice
+    FROM unnest(%(file_sha256)s::text[], %(invoice)s::jsonb[]) AS e(file_sha256, invoice)
+    ON CONFLICT (file_sha256) DO NOTHING;
+"""
+
+QUERY_ADD_INVOICE_EXTRACTION_FAILURES = """
+    INSERT INTO invoice_extractions (file_sha256, model, status, error)
+    SELECT file_sha256, %(model)s, status, error
+    FROM unnest(%(file_sha256)s::text[], %(status)s::text[], %(error)s::text[])
+      AS e(file_sha256, status, error)
+    ON CONFLICT (file_sha256) DO NOTHING;
+"""
+"""Records files that reruns skip, with a NULL invoice"""
+
+QUERY_GET_INVOICE_EXTRACTION = """
+    SELECT invoice FROM invoice_extractions
+    WHERE file_sha256 = %(file_sha256)s AND invoice IS NOT NULL;
+"""
+
+
+def get_invoice_files_without_extraction(after_id: SqlId = 0, limit: int = 100) -> list[dict]:
+    """Retrieves a page of invoice files without an extracted invoice.
+
+    Files recorded with ``add_invoice_extraction_failures`` are left out.
+
+    Args:
+        after_id: Only return files with a greater id, the last id of the previous page.
+        limit: Maximum number of files to return.
+
+    Returns:
+        list[dict]: The ``id``, ``file_origin``, ``file_mime_type`` and ``file_sha256`` of
+        each file in id order, or an empty list if an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            cur.execute(
+                query=QUERY_INVOICE_FILES_WITHOUT_EXTRACTION,
+                params={"after_id": after_id, "limit": limit},
+            )
+            return cur.fetchall()
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice files without extraction: {error}")
+            return []
+
+
+def add_invoice_extractions(extractions: dict[str, Invoice], model: str) -> int:
+    """Stores the invoices extracted from many invoice files in one statement.
+
+    Args:
+        extractions: Extracted invoice by file SHA-256.
+        model: Name of the model that extracted the invoices.
+
+    Returns:
+        int: The number of extractions stored, 0 if an error occurs. Files extracted
+        concurrently by another session keep their first extraction.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(
+                query=QUERY_ADD_INVOICE_EXTRACTIONS,
+                params={
+                    "model": model,
+                    "file_sha256": list(extractions),
+                    "invoice": [invoice.model_dump_json() for invoice in extractions.values()],
+                },
+            )
+            return cur.rowcount
+
+        except Exception as error:
+            logfire.error(f"Failed to store {len(extractions)} invoice extractions: {error}")
+            return 0
+
+
+def add_invoice_extraction_failures(failures: dict[str, tuple[str, str | None]], model: str) -> int:
+    """Records invoice files that cannot be extracted, so later runs skip them.
+
+    Args:
+        failures: Status and error message by file SHA-256, such as a ``needs_ocr`` status
+            for a file without a text layer.
+        model: Name of the model of the extraction run.
+
+    Returns:
+        int: The number of failures recorded, 0 if an error occurs. Files already extracted
+        or recorded keep their first row.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(
+                query=QUERY_ADD_INVOICE_EXTRACTION_FAILURES,
+                params={
+                    "model": model,
+                    "file_sha256": list(failures),
+                    "status": [status for status, _ in failures.values()],
+                    "error": [error for _, error in failures.values()],
+                },
+            )
+            return cur.rowcount
+
+        except Exception as error:
+            logfire.error(f"Failed to record {len(failures)} invoice extraction failures: {error}")
+            return 0
+
+
+def get_invoice_extraction(file_sha256: str) -> Invoice | None:
+    """Retrieves the invoice extracted from an invoice file by the file SHA-256.
+
+    Returns:
+        Invoice | None: The extracted invoice, or None if the file is not extracted yet, its
+        extraction failed (see ``add_invoice_extraction_failures``) or an error occurs.
+    """
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            cur.execute(query=QUERY_GET_INVOICE_EXTRACTION, params={"file_sha256": file_sha256})
+            row = cur.fetchone()
+            return Invoice.model_validate(row[0]) if row else None
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice extraction: {error}")
+            return None
@@ -0,0 +1,849 @@
+"""
+Asyncio database module for invoice OCR system.
+
+This module is an asyncio twin of the ``db`` module, backed by a
+``psycopg_pool.AsyncConnectionPool`` so a service can overlap database access with LLM calls
+or PDF rendering and run many concurrent lookups on a handful of connections. Every public
+database function of ``db`` has a twin here, with the same name, arguments and return value:
+companies, invoice items, invoices and their totals, invoice files, WebP previews,
+extractions and blobs.
+
+The SQL statements, the row-to-model mapping and the random sampling logic are shared with the
+``db`` module, so both modules always read and write the same rows the same way.
+
+The pool is opened on first use inside the running event loop, sized by the same settings as
+the sync pool. Call ``close_pool`` before the event loop exits.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Generator, Iterable
+from contextlib import asynccontextmanager
+from itertools import batched
+
+import logfire
+from psycopg import AsyncConnection, AsyncCursor
+from psycopg.errors import UniqueViolation
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from . import db
+from .db import BULK_BATCH_SIZE, CompanyRow, InvoiceItemRow, SampleQuery, SqlId
+from .schema import Company, Invoice, InvoiceFile, InvoiceItem
+from .telemetry import stage
+
+_POSTGRES_ASYNC_POOL: AsyncConnectionPool | None = None
+_POSTGRES_ASYNC_POOL_LOCK = asyncio.Lock()
+
+
+async def get_pool() -> AsyncConnectionPool:
+    """Returns the async connection pool, opening it on first use. See ``db.get_pool``.
+
+    Concurrent first callers wait for the same pool instead of each opening their own.
+
+    Raises:
+        PoolTimeout: If the pool cannot open ``min_size`` connections within the timeout.
+    """
+    global _POSTGRES_ASYNC_POOL  # noqa: PLW0603
+
+    if _POSTGRES_ASYNC_POOL is not None:
+        return _POSTGRES_ASYNC_POOL
+
+    async with _POSTGRES_ASYNC_POOL_LOCK:
+        if _POSTGRES_ASYNC_POOL is None:
+            pool = AsyncConnectionPool(
+                conninfo=db.POSTGRES_CONNINFO, open=False, **db.POSTGRES_POOL_SETTINGS
+            )
+            try:
+                await pool.open(wait=True, timeout=db.POSTGRES_POOL_SETTINGS["timeout"])
+            except Exception as error:
+                logfire.error(f"PostageSQL Async Pool is not ready: {error}")
+                await pool.close()
+                raise
+            _POSTGRES_ASYNC_POOL = pool
+            logfire.info("PostageSQL Async Pool opened")
+
+    return _POSTGRES_ASYNC_POOL
+
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[AsyncConnection]:
+    """Checks out a connection from the async pool, opening the pool on first use."""
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+
+async def close_pool() -> None:
+    """Closes the async pool. The next database call opens a new one.
+
+    The lock is renewed too, so the next pool can be opened from another event loop.
+    """
+    global _POSTGRES_ASYNC_POOL, _POSTGRES_ASYNC_POOL_LOCK  # noqa: PLW0603
+
+    async with _POSTGRES_ASYNC_POOL_LOCK:
+        if _POSTGRES_ASYNC_POOL is not None:
+            pool, _POSTGRES_ASYNC_POOL = _POSTGRES_ASYNC_POOL, None
+            await pool.close()
+    _POSTGRES_ASYNC_POOL_LOCK = asyncio.Lock()
+
+
+def get_pool_stats() -> dict[str, float]:
+    """Returns the statistics of the async connection pool. See ``db.pool_stats``."""
+    return db.pool_stats(_POSTGRES_ASYNC_POOL)
+
+
+async def _run_sample(
+    cur: AsyncCursor[dict], sample: Generator[SampleQuery, list[dict], list[list[dict]]]
+) -> list[list[dict]]:
+    """Executes the queries of a ``db._sample_rows`` generator and returns its samples."""
+    try:
+        query, params = next(sample)
+        while True:
+            await cur.execute(query=query, params=params)
+            query, params = sample.send(await cur.fetchall())
+    except StopIteration as stop:
+        return stop.value
+
+
+async def add_company(company: Company) -> SqlId | None:
+    """Adds a new company with its addresses. See ``db.add_company``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_ADD_COMPANY, params=db.company_params(company))
+            company_id: int = (await cur.fetchone())["id"]
+
+            logfire.debug(
+                "Insert Company ID: {company_id} - {company_name}",
+                company_id=company.company_id,
+                company_name=company.company_name,
+            )
+
+            return company_id
+
+        except UniqueViolation:
+            logfire.error(
+                f"Company ID {company.company_id} - {company.company_name} already exists"
+            )
+            return None
+        except Exception as error:
+            logfire.error(f"Failed to insert company: {error}")
+            return None
+
+
+async def purge_orphan_addresses(batch_size: int = BULK_BATCH_SIZE, dry_run: bool = False) -> int:
+    """Deletes postal addresses that no company references. See ``db.purge_orphan_addresses``."""
+    if dry_run:
+        async with connection() as conn:
+            cur = await conn.execute(db.QUERY_COUNT_ORPHAN_ADDRESSES)
+            count = (await cur.fetchone())[0]
+        logfire.info(f"Found {count} orphaned postal addresses")
+        return count
+
+    deleted = 0
+    while True:
+        async with connection() as conn:
+            cur = await conn.execute(db.QUERY_DELETE_ORPHAN_ADDRESSES, {"batch_size": batch_size})
+            deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            break
+
+    logfire.info(f"Deleted {deleted} orphaned postal addresses")
+    return deleted
+
+
+async def add_companies(
+    companies: Iterable[Company], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many companies with their addresses using COPY. See ``db.add_companies``."""
+    return await add_company_rows(
+        companies=(db.company_row(company) for company in companies), batch_size=batch_size
+    )
+
+
+async def add_company_rows(
+    companies: Iterable[CompanyRow], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many company rows with their addresses using COPY. See ``db.add_company_rows``."""
+    company_ids: list[SqlId | None] = []
+    seen: set[str] = set()
+
+    for batch in batched(companies, batch_size):
+        try:
+            company_ids.extend(await _copy_companies(companies=batch, seen=seen))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} companies: {error}")
+            company_ids.extend([None] * len(batch))
+
+    return company_ids
+
+
+async def _copy_companies(companies: tuple[CompanyRow, ...], seen: set[str]) -> list[SqlId | None]:
+    """Copies one batch of companies in a single transaction. See ``db._copy_companies``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(
+            db.QUERY_EXISTING_COMPANY_IDS,
+            {"company_ids": [company[0] for company in companies]},
+        )
+        existing = {row["company_id"] for row in await cur.fetchall()}
+
+        accepted, skipped = db._accept_companies(companies=companies, seen=seen, existing=existing)
+        if skipped:
+            logfire.error(f"Company IDs already exist: {', '.join(skipped)}")
+
+        await cur.execute(
+            db.QUERY_RESERVE_ADDRESS_IDS, {"count": db._address_count(companies, accepted)}
+        )
+        address_ids = [row["id"] for row in await cur.fetchall()]
+        address_rows, company_rows = db._company_copy_rows(
+            companies=companies, accepted=accepted, address_ids=address_ids
+        )
+
+        await cur.execute(db.QUERY_CREATE_COMPANIES_STAGING)
+        async with cur.copy(db.COPY_POSTAL_ADDRESSES) as copy:
+            for row in address_rows:
+                await copy.write_row(row)
+        async with cur.copy(db.COPY_COMPANIES_STAGING) as copy:
+            for row in company_rows:
+                await copy.write_row(row)
+
+        await cur.execute(db.QUERY_INSERT_STAGED_COMPANIES)
+        inserted = {row["company_id"]: row["id"] for row in await cur.fetchall()}
+
+        await cur.execute(db.QUERY_DELETE_STAGED_ADDRESSES, {"inserted": list(inserted)})
+
+        logfire.info(f"Inserted {len(inserted)} companies, skipped {len(skipped)}")
+
+    seen.update(inserted)
+    return [
+        inserted.get(company[0]) if is_accepted else None
+        for company, is_accepted in zip(companies, accepted, strict=True)
+    ]
+
+
+async def get_company(company_id: str) -> Company | None:
+    """Retrieves a company by its unique company ID. See ``db.get_company``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_GET_COMPANY, params={"company_id": company_id})
+            results = await cur.fetchone()
+
+            if results is None:
+                logfire.debug("No company found with ID: {company_id}", company_id=company_id)
+                return None
+
+            return db.company_from_row(results)
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch companies: {error}")
+            return None
+
+
+async def get_random_companies_batch(
+    limits: list[int], seed: int | None = None
+) -> list[list[Company]]:
+    """Retrieves random companies for many invoices at once. See ``db.get_random_companies_batch``."""
+    async with (
+        stage("db.sample", table="companies") as span,
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            samples = await _run_sample(
+                cur=cur,
+                sample=db._sample_rows(
+                    table="companies",
+                    query=db.QUERY_SAMPLE_COMPANIES,
+                    limits=limits,
+                    seed=seed,
+                ),
+            )
+            companies = [[db.company_from_row(row) for row in sample] for sample in samples]
+
+            span.add(items=sum(map(len, companies)))
+            logfire.info("Retrieved {count} random company samples", count=len(companies))
+
+            return companies
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch companies: {error}")
+            return []
+
+
+async def get_random_companies(limit: int = 2, seed: int | None = None) -> list[Company] | None:
+    """Retrieves a list of random companies from the database."""
+    samples = await get_random_companies_batch(limits=[limit], seed=seed)
+    return samples[0] if samples else None
+
+
+async def find_company(
+    query: str, limit: int | None = db.SEARCH_LIMIT, offset: int = 0
+) -> list[Company] | list[None]:
+    """Searches for companies matching a search query. See ``db.find_company``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            params = db.search_params(query=query, limit=limit, offset=offset)
+            await cur.execute(query=db.QUERY_FIND_COMPANIES, params=params)
+            results = await cur.fetchall()
+
+            companies = [db.company_from_row(result) for result in results]
+
+            logfire.debug(
+                "Found {count} companies matching query: '{query}'",
+                count=len(companies),
+                query=query,
+            )
+            return companies
+
+        except Exception as error:
+            logfire.error(f"Failed to search companies: {error}")
+            return []
+
+
+async def get_company_ids() -> set[str]:
+    """Retrieves the IDs of all companies. See ``db.get_company_ids``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_COMPANY_IDS)
+            return {company_id async for (company_id,) in cur}
+
+        except Exception as error:
+            logfire.error(f"Failed to get company IDs: {error}")
+            return set()
+
+
+async def add_invoice_item(invoice_item: InvoiceItem) -> SqlId | None:
+    """Adds a new invoice item to the database. See ``db.add_invoice_item``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            params = invoice_item.model_dump()
+            await cur.execute(query=db.QUERY_ADD_INVOICE_ITEM, params=params)
+            invoice_item_id: int = (await cur.fetchone())["id"]
+
+            logfire.debug(
+                "Inserted Invoice Item: {item_sku} - {item_info}",
+                item_sku=invoice_item.item_sku,
+                item_info=invoice_item.item_info,
+            )
+
+            return invoice_item_id
+
+        except UniqueViolation:
+            logfire.error(f"Invoice Item SKU {invoice_item.item_sku} already exists")
+            return None
+        except Exception as error:
+            logfire.error(f"Failed to insert invoice item: {error}")
+            return None
+
+
+async def add_invoice_items(
+    invoice_items: Iterable[InvoiceItem], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many invoice items using COPY. See ``db.add_invoice_items``."""
+    return await add_invoice_item_rows(
+        invoice_items=(db.invoice_item_row(item) for item in invoice_items), batch_size=batch_size
+    )
+
+
+async def add_invoice_item_rows(
+    invoice_items: Iterable[InvoiceItemRow], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many invoice item rows using COPY. See ``db.add_invoice_item_rows``."""
+    invoice_item_ids: list[SqlId | None] = []
+
+    for batch in batched(invoice_items, batch_size):
+        try:
+            invoice_item_ids.extend(await _copy_invoice_items(invoice_items=batch))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} invoice items: {error}")
+            invoice_item_ids.extend([None] * len(batch))
+
+    return invoice_item_ids
+
+
+async def _copy_invoice_items(invoice_items: tuple[InvoiceItemRow, ...]) -> list[SqlId | None]:
+    """Copies one batch of invoice items in a single transaction."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(db.QUERY_CREATE_INVOICE_ITEMS_STAGING)
+        async with cur.copy(db.COPY_INVOICE_ITEMS_STAGING) as copy:
+            for row in db._invoice_item_copy_rows(invoice_items):
+                await copy.write_row(row)
+
+        await cur.execute(db.QUERY_INSERT_STAGED_INVOICE_ITEMS)
+        invoice_item_ids, skipped = db._staged_invoice_item_ids(
+            invoice_items=invoice_items, inserted=await cur.fetchall()
+        )
+
+        if skipped:
+            logfire.error(f"Invoice Item SKUs already exist: {', '.join(skipped)}")
+        logfire.info(f"Inserted {len(invoice_items) - len(skipped)} invoice items")
+
+        return invoice_item_ids
+
+
+async def get_invoice_item(item_sku: str) -> InvoiceItem | None:
+    """Retrieves a single invoice item by its SKU. See ``db.get_invoice_item``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_GET_INVOICE_ITEM, params={"item_sku": item_sku})
+            result = await cur.fetchone()
+
+            if result is None:
+                return None
+
+            return db.invoice_item_from_row(result)
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice item: {error}")
+            return None
+
+
+async def get_random_invoice_items_batch(
+    limits: list[int], seed: int | None = None
+) -> list[list[InvoiceItem]]:
+    """Retrieves random invoice items for many invoices at once.
+
+    See ``db.get_random_invoice_items_batch``.
+    """
+    async with (
+        stage("db.sample", table="invoice_items") as span,
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            samples = await _run_sample(
+                cur=cur,
+                sample=db._sample_rows(
+                    table="invoice_items",
+                    query=db.QUERY_SAMPLE_INVOICE_ITEMS,
+                    limits=limits,
+                    seed=seed,
+                ),
+            )
+            invoice_items = [
+                [db.invoice_item_from_row(row) for row in sample] for sample in samples
+            ]
+
+            span.add(items=sum(map(len, invoice_items)))
+            logfire.info("Retrieved {count} random invoice item samples", count=len(invoice_items))
+
+            return invoice_items
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice items: {error}")
+            return []
+
+
+async def get_random_invoice_items(limit: int = 2, seed: int | None = None) -> list[InvoiceItem]:
+    """Retrieves a list of random invoice items from the database."""
+    samples = await get_random_invoice_items_batch(limits=[limit], seed=seed)
+    return samples[0] if samples else []
+
+
+async def find_invoice_item(
+    query: str, limit: int | None = db.SEARCH_LIMIT, offset: int = 0
+) -> list[InvoiceItem] | list[None]:
+    """Searches for invoice items matching a search query. See ``db.find_invoice_item``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            params = db.search_params(query=query, limit=limit, offset=offset)
+            await cur.execute(query=db.QUERY_FIND_INVOICE_ITEMS, params=params)
+            results = await cur.fetchall()
+
+            invoice_items = [db.invoice_item_from_row(result) for result in results]
+
+            logfire.debug(
+                "Found {count} invoice items matching query: '{query}'",
+                count=len(invoice_items),
+                query=query,
+            )
+            return invoice_items
+
+        except Exception as error:
+            logfire.error(f"Failed to search invoice items: {error}")
+            return []
+
+
+async def get_invoice_item_skus() -> set[str]:
+    """Retrieves the SKUs of all invoice items. See ``db.get_invoice_item_skus``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_INVOICE_ITEM_SKUS)
+            return {item_sku async for (item_sku,) in cur}
+
+        except Exception as error:
+            logfire.error(f"Failed to get invoice item SKUs: {error}")
+            return set()
+
+
+async def reserve_invoice_numbers(count: int) -> list[int]:
+    """Reserves invoice numbers never handed out. See ``db.reserve_invoice_numbers``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_RESERVE_INVOICE_NUMBERS, params={"count": count})
+            return [row["invoice_number"] for row in await cur.fetchall()]
+
+        except Exception as error:
+            logfire.error(f"Failed to reserve invoice numbers: {error}")
+            return []
+
+
+async def add_invoice(invoice: Invoice) -> SqlId | None:
+    """Adds a new invoice with its line items. See ``db.add_invoice``."""
+    ids = await add_invoices(invoices=[invoice])
+    return ids[0] if ids else None
+
+
+async def add_invoices(
+    invoices: Iterable[Invoice], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds many invoices, one transaction per batch. See ``db.add_invoices``."""
+    invoice_ids: list[SqlId | None] = []
+
+    for batch in batched(invoices, batch_size):
+        try:
+            invoice_ids.extend(await _insert_invoices(invoices=batch))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} invoices: {error}")
+            invoice_ids.extend([None] * len(batch))
+
+    return invoice_ids
+
+
+async def _inserted_ids(cur: AsyncCursor[dict]) -> list[SqlId | None]:
+    """Runs ``db._collect_inserted_ids`` on an async cursor and returns the ids."""
+    collect = db._collect_inserted_ids(cur)
+    next(collect)
+    try:
+        while True:
+            collect.send(await cur.fetchone())
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _insert_invoices(invoices: tuple[Invoice, ...]) -> list[SqlId | None]:
+    """Inserts one batch of invoices in a single transaction."""
+    async with (
+        stage("db.insert", table="invoice_records") as span,
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.executemany(
+            db.QUERY_ADD_INVOICE,
+            [db.invoice_params(invoice) for invoice in invoices],
+            returning=True,
+        )
+        invoice_ids = await _inserted_ids(cur)
+
+        skipped = [
+            invoice.invoice_number
+            for invoice, invoice_id in zip(invoices, invoice_ids, strict=True)
+            if invoice_id is None
+        ]
+        if skipped:
+            logfire.error(
+                "Invoices already exist or reference missing companies or invoice items: "
+                f"{', '.join(skipped)}"
+            )
+        span.add(items=len(invoices) - len(skipped))
+        logfire.info("Inserted {count} invoices", count=len(invoices) - len(skipped))
+
+        return invoice_ids
+
+
+async def get_invoice(invoice_number: str) -> Invoice | None:
+    """Retrieves an invoice by its invoice number. See ``db.get_invoice``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_GET_INVOICE, params={"invoice_number": invoice_number})
+            result = await cur.fetchone()
+
+            if result is None:
+                logfire.debug(
+                    "No invoice found with number: {invoice_number}", invoice_number=invoice_number
+                )
+                return None
+
+            return db.invoice_from_row(result)
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice: {error}")
+            return None
+
+
+async def get_invoices(invoice_numbers: list[str]) -> list[Invoice]:
+    """Retrieves many invoices with a single query. See ``db.get_invoices``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_GET_INVOICES, params={"invoice_numbers": invoice_numbers}
+            )
+            invoices = [db.invoice_from_row(row) async for row in cur]
+
+            logfire.info(f"Retrieved {len(invoices)}/{len(invoice_numbers)} invoices")
+
+            return invoices
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoices: {error}")
+            return []
+
+
+async def get_invoice_totals(invoice_numbers: list[str]) -> dict[str, tuple[int, int, int]]:
+    """Computes the totals of many stored invoices at once. See ``db.get_invoice_totals``."""
+    async with (
+        stage("db.totals") as span,
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_INVOICE_LINE_CENTS, params={"invoice_numbers": invoice_numbers}
+            )
+            rows = await cur.fetchall()
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice line items: {error}")
+            return {}
+
+        span.add(items=len(rows))
+        return db._invoice_totals(rows)
+
+
+async def add_invoice_files(
+    files: Iterable[InvoiceFile], batch_size: int = BULK_BATCH_SIZE
+) -> list[SqlId | None]:
+    """Adds invoice files whose SHA-256 is new. See ``db.add_invoice_files``."""
+    file_ids: list[SqlId | None] = []
+    seen: set[str] = set()
+
+    for batch in batched(files, batch_size):
+        try:
+            file_ids.extend(await _insert_invoice_files(files=batch, seen=seen))
+        except Exception as error:
+            logfire.error(f"Failed to insert {len(batch)} invoice files: {error}")
+            file_ids.extend([None] * len(batch))
+
+    return file_ids
+
+
+async def _insert_invoice_files(
+    files: tuple[InvoiceFile, ...], seen: set[str]
+) -> list[SqlId | None]:
+    """Inserts the new files of one batch in a single transaction."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(
+            db.QUERY_EXISTING_FILE_SHA256, {"file_sha256": [file.file_sha256 for file in files]}
+        )
+        existing = {row["file_sha256"] for row in await cur.fetchall()}
+
+        new_files = db._new_invoice_files(files=files, seen=seen, existing=existing)
+        inserted = {}
+        if new_files:
+            await cur.execute(db.QUERY_ADD_INVOICE_FILES, db._invoice_file_params(new_files))
+            inserted = {row["file_sha256"]: row["id"] for row in await cur.fetchall()}
+
+        logfire.info(
+            f"Inserted {len(inserted)} invoice files, skipped {len(files) - len(inserted)}"
+        )
+
+    seen.update(inserted)
+    return [inserted.pop(file.file_sha256, None) for file in files]
+
+
+async def get_invoice_files_without_webp(after_id: SqlId = 0, limit: int = 100) -> list[dict]:
+    """Retrieves a page of invoice files without a WebP preview. See ``db``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_INVOICE_FILES_WITHOUT_WEBP,
+                params={"after_id": after_id, "limit": limit},
+            )
+            return await cur.fetchall()
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice files without preview: {error}")
+            return []
+
+
+async def set_invoice_webps(webps: dict[SqlId, str]) -> int:
+    """Records the blob keys of many WebP previews. See ``db.set_invoice_webps``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_SET_INVOICE_WEBPS,
+                params={"ids": list(webps), "file_webp_sha256": list(webps.values())},
+            )
+            return cur.rowcount
+
+        except Exception as error:
+            logfire.error(f"Failed to store {len(webps)} invoice previews: {error}")
+            return 0
+
+
+async def get_invoice_webp_sha256(invoice_file_id: SqlId) -> str | None:
+    """Retrieves the blob key of a WebP preview. See ``db.get_invoice_webp_sha256``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(query=db.QUERY_INVOICE_WEBP_SHA256, params={"id": invoice_file_id})
+            row = await cur.fetchone()
+            return row[0] if row else None
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice preview key: {error}")
+            return None
+
+
+async def add_blobs(blobs: dict[str, bytes]) -> None:
+    """Stores content-addressed blobs in one statement. See ``db.add_blobs``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        await cur.execute(
+            query=db.QUERY_ADD_BLOBS,
+            params={"sha256": list(blobs), "content": list(blobs.values())},
+        )
+
+
+async def get_blob(sha256: str) -> bytes | None:
+    """Retrieves the content of a blob, or None if the key is unknown. See ``db.get_blob``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        await cur.execute(query=db.QUERY_GET_BLOB, params={"sha256": sha256})
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+async def get_invoice_files_without_extraction(after_id: SqlId = 0, limit: int = 100) -> list[dict]:
+    """Retrieves a page of invoice files without an extracted invoice. See ``db``."""
+    async with (
+        connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_INVOICE_FILES_WITHOUT_EXTRACTION,
+                params={"after_id": after_id, "limit": limit},
+            )
+            return await cur.fetchall()
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice files without extraction: {error}")
+            return []
+
+
+async def add_invoice_extractions(extractions: dict[str, Invoice], model: str) -> int:
+    """Stores many extracted invoices in one statement. See ``db.add_invoice_extractions``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_ADD_INVOICE_EXTRACTIONS,
+                params={
+                    "model": model,
+                    "file_sha256": list(extractions),
+                    "invoice": [invoice.model_dump_json() for invoice in extractions.values()],
+                },
+            )
+            return cur.rowcount
+
+        except Exception as error:
+            logfire.error(f"Failed to store {len(extractions)} invoice extractions: {error}")
+            return 0
+
+
+async def add_invoice_extraction_failures(
+    failures: dict[str, tuple[str, str | None]], model: str
+) -> int:
+    """Records invoice files that cannot be extracted. See ``db.add_invoice_extraction_failures``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_ADD_INVOICE_EXTRACTION_FAILURES,
+                params={
+                    "model": model,
+                    "file_sha256": list(failures),
+                    "status": [status for status, _ in failures.values()],
+                    "error": [error for _, error in failures.values()],
+                },
+            )
+            return cur.rowcount
+
+        except Exception as error:
+            logfire.error(f"Failed to record {len(failures)} invoice extraction failures: {error}")
+            return 0
+
+
+async def get_invoice_extraction(file_sha256: str) -> Invoice | None:
+    """Retrieves the invoice extracted from a file. See ``db.get_invoice_extraction``."""
+    async with (
+        connection() as conn,
+        conn.cursor() as cur,
+    ):
+        try:
+            await cur.execute(
+                query=db.QUERY_GET_INVOICE_EXTRACTION, params={"file_sha256": file_sha256}
+            )
+            row = await cur.fetchone()
+            return Invoice.model_validate(row[0]) if row else None
+
+        except Exception as error:
+            logfire.error(f"Failed to fetch invoice extraction: {error}")
+            return None
@@ -0,0 +1,321 @@
+"""
+Extraction of structured invoices from ingested invoice files.
+
+Turns the files recorded by the ingest command back into ``schema.Invoice`` objects:
+1. The text layer of each PDF is read locally with pdfium, in a process pool when ``workers``
+   is greater than one. Files without a text layer, such as scans and images, need OCR and
+   are logged and recorded with the ``needs_ocr`` status, files that fail to read with the
+   ``unreadable`` status.
+2. The text is sent to a pydantic-ai agent with ``result_type=Invoice``, at most
+   ``concurrency`` runs in flight, through the LLM cache (see ``generate.run_agent``).
+3. Invoices are stored in ``invoice_extractions`` by the SHA-256 of their file, one statement
+   per batch, so reruns only extract files that have not been extracted or recorded yet.
+
+Text extraction and agent runs are connected by a bounded queue, so a slow model holds back
+the reading of files instead of buffering the whole archive in memory.
+
+``stub_model`` returns a local model that builds an invoice from the text without any API
+call, for tests and dry runs of the pipeline.
+"""
+
+import asyncio
+import re
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+from pathlib import Path
+from random import Random
+from typing import TYPE_CHECKING
+
+from .schema import Address, Company, Invoice
+from .settings import PYDANTIC_AI_CONCURRENCY, PYDANTIC_AI_MAX_ATTEMPTS, PYDANTIC_AI_MODEL
+
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+    from pydantic_ai.models import Model
+    from pydantic_ai.models.function import FunctionModel
+
+EXTRACT_SYSTEM_PROMPT = (
+    "You extract structured data from the text of invoice documents. "
+    "Copy names, addresses, dates, quantities and prices exactly as they appear in the text. "
+    "Invoice line items are listed with their item description, quantity, unit price and "
+    "amount. When a company ID or item SKU is not printed, derive one from the name in the "
+    "required format."
+)
+
+EXTRACT_BATCH_SIZE = 100
+"""Invoice files read and extracted invoices stored per batch"""
+
+MAX_TEXT_LENGTH = 20_000
+"""Characters of document text sent to the model, bounding the prompt size"""
+
+STUB_MODEL_NAME = "stub"
+
+EXTRACTION_NEEDS_OCR = "needs_ocr"
+"""Extraction status of a file without a text layer, such as a scan or an image"""
+
+EXTRACTION_UNREADABLE = "unreadable"
+"""Extraction status of a file that failed to read"""
+
+
+def extract_text(path: Path, mime_type: str) -> str:
+    """Returns the text layer of a PDF, pages separated by form feeds, or "" if it has none.
+
+    Images have no text layer, they need OCR.
+    """
+    if mime_type != "application/pdf":
+        return ""
+
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        return "\f".join(page.get_textpage().get_text_range() for page in pdf).strip()
+    finally:
+        pdf.close()
+
+
+def extract_invoice_file_text(row: dict) -> tuple[dict, str | None, str | None]:
+    """Reads the text of an invoice file row in a worker.
+
+    Returns:
+        tuple[dict, str | None, str | None]: The row, and the text or the error.
+    """
+    try:
+        return row, extract_text(Path(row["file_origin"]), row["file_mime_type"]), None
+    except Exception as error:
+        return row, None, f"{row['file_origin']}: {error}"
+
+
+def extract_user_prompt(text: str) -> str:
+    return f"Extract the invoice from this document text:\n\n{text[:MAX_TEXT_LENGTH]}"
+
+
+@cache
+def get_extract_agent() -> "Agent[None, Invoice]":
+    """Returns the invoice extraction agent, built on first use."""
+    from pydantic_ai import Agent
+
+    return Agent(
+        model=PYDANTIC_AI_MODEL,
+        result_type=Invoice,
+        system_prompt=EXTRACT_SYSTEM_PROMPT,
+    )
+
+
+STUB_COMPANY = Company(
+    company_id="STUB0",
+    company_name="Stub Company",
+    address_billing=Address(
+        address_line1="1 Stub St",
+        address_line2="",
+        city="Toronto",
+        province="ON",
+        postal_code="M5A 1A1",
+    ),
+    phone_number="+1-555-000-0000",
+    email="stub@example.com",
+    website="https://example.com",
+)
+
+
+def stub_model() -> "FunctionModel":
+    """Returns a local model that answers with the invoice number found in the text.
+
+    Every other field is a fixed placeholder, so the pipeline can run without a model API.
+    """
+    from pydantic_ai.messages import ModelResponse, ToolCallPart
+    from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+    def respond(messages: list, info: AgentInfo) -> ModelResponse:
+        match = re.search(r"Invoice #:\s*(\S+)", messages[-1].parts[-1].content)
+        invoice = Invoice(
+            invoice_number=match.group(1) if match else "UNKNOWN",
+            supplier=STUB_COMPANY,
+            customer=STUB_COMPANY,
+        )
+        args = invoice.model_dump(mode="json")
+        return ModelResponse(parts=[ToolCallPart.from_raw_args(info.result_tools[0].name, args)])
+
+    return FunctionModel(respond)
+
+
+async def read_invoice_files(
+    executor: Executor, batch_size: int, model_name: str
+) -> AsyncIterator[tuple[dict, str]]:
+    """Yields the text of the invoice files not extracted yet, read a page at a time.
+
+    Files that fail to read or have no text layer are logged and yielded with an empty text.
+    Their failures are recorded with ``db.add_invoice_extraction_failures`` once the page is
+    read, so later runs skip them.
+    """
+    from . import db
+
+    loop = asyncio.get_running_loop()
+    after_id = 0
+    while page := await asyncio.to_thread(
+        db.get_invoice_files_without_extraction, after_id=after_id, limit=batch_size
+    ):
+        after_id = page[-1]["id"]
+        reads = [loop.run_in_executor(executor, extract_invoice_file_text, row) for row in page]
+        failures = {}
+        for read in reads:
+            row, text, error = await read
+            if failure := extraction_failure(row=row, text=text, error=error):
+                failures[row["file_sha256"]] = failure
+            yield row, text or ""
+
+        if failures:
+            await asyncio.to_thread(db.add_invoice_extraction_failures, failures, model_name)
+
+
+def extraction_failure(
+    row: dict, text: str | None, error: str | None
+) -> tuple[str, str | None] | None:
+    """Logs and returns the status and error of a file that cannot be extracted, or None."""
+    import logfire
+
+    if error:
+        logfire.error("Failed to read {error}", error=error)
+        return EXTRACTION_UNREADABLE, error
+    if not text:
+        logfire.debug(
+            "No text layer in {file_origin}, it needs OCR", file_origin=row["file_origin"]
+        )
+        return EXTRACTION_NEEDS_OCR, None
+    return None
+
+
+async def extract_invoice(
+    row: dict, text: str, max_attempts: int, model: "Model | None", rng: Random
+) -> Invoice | None:
+    """Runs the extraction agent on the text of an invoice file, with retries.
+
+    Retryable agent errors (see ``generate.is_retryable``) are retried with exponential
+    backoff, anything else is logged.
+
+    Returns:
+        Invoice | None: The extracted invoice, or None if the extraction failed.
+    """
+    import logfire
+
+    from .generate import is_retryable, retry_delay, run_agent
+
+    agent = get_extract_agent()
+    user_prompt = extract_user_prompt(text)
+    for attempt in range(max_attempts):
+        try:
+            if model is not None:
+                return (await agent.run(user_prompt=user_prompt, model=model)).data
+            invoice, _ = await run_agent(
+                agent=agent,
+                result_type=Invoice,
+                system_prompt=EXTRACT_SYSTEM_PROMPT,
+                user_prompt=user_prompt,
+            )
+            return invoice
+        except Exception as error:
+            if not is_retryable(error):
+                logfire.error(
+                    "Failed to extract {file_origin}: {error}",
+                    file_origin=row["file_origin"],
+                    error=error,
+                )
+                return None
+            logfire.warning(
+                "Retrying {file_origin}: {error}", file_origin=row["file_origin"], error=error
+            )
+            await asyncio.sleep(retry_delay(attempt=attempt, rng=rng))
+
+    logfire.error(
+        "Failed to extract {file_origin} after {max_attempts} attempts",
+        file_origin=row["file_origin"],
+        max_attempts=max_attempts,
+    )
+    return None
+
+
+async def extract_invoices(
+    batch_size: int = EXTRACT_BATCH_SIZE,
+    concurrency: int = PYDANTIC_AI_CONCURRENCY,
+    workers: int = 1,
+    max_attempts: int = PYDANTIC_AI_MAX_ATTEMPTS,
+    model: "Model | None" = None,
+) -> tuple[int, int]:
+    """Extracts and stores an invoice for every invoice file not extracted yet.
+
+    Files that fail to extract, see ``extract_invoice``, are logged and left unextracted, so
+    a later run retries them. Files without a text layer or that fail to read would fail
+    again, they are recorded with ``db.add_invoice_extraction_failures`` and skipped by
+    later runs.
+
+    Args:
+        batch_size: Invoice files read and extractions stored per batch.
+        concurrency: Maximum number of agent runs in flight.
+        workers: Number of text extraction processes. Reads in one thread when 1.
+        max_attempts: Agent runs per file before giving up on it.
+        model: Model to run instead of ``PYDANTIC_AI_MODEL``, such as ``stub_model()``.
+            Bypasses the LLM cache.
+
+    Returns:
+        tuple[int, int]: The number of invoices stored and of files that failed.
+    """
+    import logfire
+
+    from . import db
+
+    model_name = PYDANTIC_AI_MODEL if model is None else STUB_MODEL_NAME
+    queue: asyncio.Queue[tuple[dict, str] | None] = asyncio.Queue(maxsize=concurrency * 2)
+    rng = Random()
+    extracted: dict[str, Invoice] = {}
+    stored = failed = 0
+
+    async def store(extractions: dict[str, Invoice]) -> None:
+        nonlocal stored
+        if not extractions:
+            return
+        count = await asyncio.to_thread(db.add_invoice_extractions, extractions, model_name)
+        stored += count
+        logfire.info(
+            "Stored {stored} extracted invoices, {failed} failed", stored=stored, failed=failed
+        )
+
+    async def consume() -> None:
+        nonlocal extracted, failed
+        while (item := await queue.get()) is not None:
+            row, text = item
+            # Files without text are recorded by read_invoice_files, see extraction_failure
+            invoice = (
+                await extract_invoice(
+                    row=row, text=text, max_attempts=max_attempts, model=model, rng=rng
+                )
+                if text
+                else None
+            )
+            if invoice is None:
+                failed += 1
+                continue
+
+            extracted[row["file_sha256"]] = invoice
+            if len(extracted) >= batch_size:
+                batch, extracted = extracted, {}
+                await store(batch)
+
+    async def produce(executor: Executor) -> None:
+        async for item in read_invoice_files(executor, batch_size, model_name):
+            await queue.put(item)
+
+    # pdfium is not thread-safe, so in-process reads go through a single thread
+    executor_type = ProcessPoolExecutor if workers > 1 else ThreadPoolExecutor
+    with executor_type(max_workers=workers) as executor:
+        consumers = [asyncio.create_task(consume()) for _ in range(concurrency)]
+        try:
+            await produce(executor)
+        finally:
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+
+    await store(extracted)
+
+    return stored, failed
@@ -11,45 +11,166 @@ Cody Instructions:
 - Use Pydantic v2.0.0 and above
 """
 
+import asyncio
 import json
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass
+from functools import cache
+from importlib.resources import files
+from itertools import batched
+from pathlib import Path
+from random import Random
+from typing import TYPE_CHECKING, Any
 
 import logfire
-from jinja2 import Environment, FileSystemLoader
-from pydantic_ai import Agent, RunContext, UserError
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader, Template
+from pydantic import TypeAdapter
 
-from invoice_ocr import db
+from invoice_ocr import db, telemetry
 
+from .archive import InvoiceWriter
+from .llm_cache import get_llm_cache
 from .schema import Company, Invoice, InvoiceItem
+from .settings import (
+    JINJA2_CACHE_DIR,
+    PYDANTIC_AI_CONCURRENCY,
+    PYDANTIC_AI_MAX_ATTEMPTS,
+    PYDANTIC_AI_MODEL,
+    configure_logfire,
+)
+from .telemetry import stage
+
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+configure_logfire()
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504, 529})
+"""HTTP status codes of model API errors that are retried with backoff"""
+
+BACKOFF_BASE = 1.0
+"""Seconds of the first retry delay, doubled on every attempt"""
+
+BACKOFF_MAX = 60.0
+"""Upper bound in seconds of a single retry delay"""
+
+RENDER_AHEAD = 4
+"""Invoices in flight per rendering process, bounding the PDFs held in memory"""
+
+SAMPLE_BATCH_SIZE = 1000
+"""Invoices sampled and stored at a time by ``sample_invoices``"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns whether a failed agent run is worth retrying.
+
+    Rate limits, overloaded or failing model APIs, network errors and results that kept
+    failing validation are transient. Anything else, such as a bad API key, is not.
+    """
+    from pydantic_ai import UnexpectedModelBehavior
+
+    if isinstance(error, UnexpectedModelBehavior | TimeoutError | ConnectionError):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def retry_delay(attempt: int, rng: Random) -> float:
+    """Returns the exponential backoff delay, with full jitter, before a retry attempt."""
+    return rng.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+async def run_agent(
+    agent: "Agent[None, Any]",
+    result_type: Any,
+    system_prompt: str,
+    user_prompt: str,
+    variant: str = "",
+) -> tuple[Any, int]:
+    """Runs an agent, through the LLM cache when ``LLM_CACHE_PATH`` is set.
+
+    Args:
+        agent: The agent to run.
+        result_type: The result type of the agent, part of the cache key.
+        system_prompt: The system prompt of the agent, part of the cache key.
+        user_prompt: The user prompt.
+        variant: Tells apart runs with the same prompts, such as companies of a batch.
+
+    Returns:
+        tuple[Any, int]: The result data and the total tokens used, 0 on a cache hit.
+
+    Raises:
+        LLMCacheMissError: If the result is not cached and the cache is in replay mode.
+    """
+    llm_cache = get_llm_cache()
+    if llm_cache is None:
+        async with stage("llm.call", model=PYDANTIC_AI_MODEL) as span:
+            result = await agent.run(user_prompt=user_prompt)
+            span.add(items=1, tokens=result.usage().total_tokens)
+        return result.data, result.usage().total_tokens
+
+    adapter = TypeAdapter(result_type)
+    key = llm_cache.cache_key(
+        model=PYDANTIC_AI_MODEL,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        schema=adapter.json_schema(),
+        variant=variant,
+    )
+
+    with stage("llm.cache_get"):
+        cached = llm_cache.get(key)
+    if cached is not None:
+        return adapter.validate_json(cached), 0
+
+    async with stage("llm.call", model=PYDANTIC_AI_MODEL) as span:
+        result = await agent.run(user_prompt=user_prompt)
+        span.add(items=1, tokens=result.usage().total_tokens)
+    llm_cache.put(key=key, model=PYDANTIC_AI_MODEL, value=adapter.dump_json(result.data).decode())
+    return result.data, result.usage().total_tokens
 
 
 @dataclass
 class CompanyDeps:
-    companies: list[tuple[str, str]] = None
+    """Company IDs generated companies must not reuse.
+
+    Loaded from the database with ``db.get_company_ids`` unless given, and extended with
+    every accepted company. Uniqueness is checked after generation against this set instead
+    of listing the catalog in the prompt, so the prompt size does not grow with the database.
+    """
+
+    company_ids: set[str] = None
 
     def __post_init__(self):
-        companies = db.find_company("")
-        self.companies = [(company.company_id, company.company_name) for company in companies]
-
-
-company_agent = Agent(
-    model="claude-3-5-haiku-latest",
-    deps_type=CompanyDeps,
-    result_type=Company,
-    system_prompt=(
-        "You are a helpful assistant that generates company information. "
-        "Do not use company names or company IDs that are already in the database. "
-    ),
+        if self.company_ids is None:
+            self.company_ids = db.get_company_ids()
+
+
+COMPANY_SYSTEM_PROMPT = (
+    "You are a helpful assistant that generates company information. "
+    "Generate uncommon company names and company IDs, many companies already exist. "
 )
 
 
-@company_agent.system_prompt
-def company_agent_system_prompt(context: RunContext[CompanyDeps]) -> str:
-    companies = context.deps.companies
-    return f"List of companies in database: {companies}"
+@cache
+def get_company_agent() -> "Agent[None, Company]":
+    """Returns the company agent, built on first use.
 
+    Building it imports pydantic-ai, so only the commands that call the LLM pay for it.
+    """
+    from pydantic_ai import Agent
 
-def create_company() -> Company:
+    return Agent(
+        model=PYDANTIC_AI_MODEL,
+        result_type=Company,
+        system_prompt=COMPANY_SYSTEM_PROMPT,
+    )
+
+
+def company_user_prompt(taken_ids: Iterable[str] = ()) -> str:
     schema = json.dumps(Company.model_json_schema())
 
     user_prompt = (
@@ -61,50 +182,124 @@ def create_company() -> Company:
         "Generate unique website URL based on company name. "
         f"Use JSON schema: {schema} "
     )
-
-    deps = CompanyDeps()
-
-    try:
-        result = company_agent.run_sync(user_prompt=user_prompt, deps=deps)
-    except UserError as error:
-        logfire.error(error)
-
-    logfire.info(
-        f"Generated company {result.data.company_id} - {result.data.company_name}. Total tokens: {result._usage.total_tokens}"
-    )
-
-    return result.data
+    if taken_ids:
+        user_prompt += f"These company IDs are already taken: {', '.join(taken_ids)}. "
+
+    return user_prompt
+
+
+def create_company(deps: CompanyDeps | None = None) -> Company | None:
+    """Generates one company. See ``create_companies``."""
+    companies = asyncio.run(create_companies(quantity=1, concurrency=1, deps=deps))
+    return companies[0] if companies else None
+
+
+async def create_companies(
+    quantity: int,
+    concurrency: int = PYDANTIC_AI_CONCURRENCY,
+    max_attempts: int = PYDANTIC_AI_MAX_ATTEMPTS,
+    deps: CompanyDeps | None = None,
+) -> list[Company]:
+    """Generates companies concurrently with ``Agent.run``.
+
+    At most ``concurrency`` agent runs are in flight at once. Retryable errors (see
+    ``is_retryable``) are retried with exponential backoff, outside the concurrency limit.
+    A company whose ``company_id`` is already in the database, or was generated earlier in
+    this batch, is regenerated with the rejected IDs named in the prompt.
+
+    Args:
+        quantity: Number of companies to generate.
+        concurrency: Maximum number of agent runs in flight.
+        max_attempts: Agent runs per company before giving up on it.
+        deps: Company IDs to avoid. Loaded from the database when None.
+
+    Returns:
+        list[Company]: The generated companies in completion order. Companies that still
+            failed after ``max_attempts`` are logged and left out.
+    """
+    agent = get_company_agent()
+    deps = deps if deps is not None else CompanyDeps()
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = Random()
+    companies: list[Company] = []
+
+    async def generate(index: int) -> None:
+        rejected_ids: list[str] = []
+        for attempt in range(max_attempts):
+            try:
+                async with semaphore:
+                    company, total_tokens = await run_agent(
+                        agent=agent,
+                        result_type=Company,
+                        system_prompt=COMPANY_SYSTEM_PROMPT,
+                        user_prompt=company_user_prompt(rejected_ids),
+                        variant=str(index),
+                    )
+            except Exception as error:
+                if not is_retryable(error):
+                    logfire.error(f"Failed to generate company {index + 1}/{quantity}: {error}")
+                    return
+                logfire.warning(f"Retrying company {index + 1}/{quantity}: {error}")
+                await asyncio.sleep(retry_delay(attempt=attempt, rng=rng))
+                continue
+
+            if company.company_id in deps.company_ids:
+                logfire.warning(
+                    f"Regenerating company {index + 1}/{quantity}: "
+                    f"company ID {company.company_id} is taken"
+                )
+                rejected_ids.append(company.company_id)
+                continue
+
+            deps.company_ids.add(company.company_id)
+            companies.append(company)
+            logfire.info(
+                "Generated company {company_id} - {company_name}. Total tokens: {total_tokens}",
+                company_id=company.company_id,
+                company_name=company.company_name,
+                total_tokens=total_tokens,
+            )
+            return
+
+        logfire.error(
+            f"Failed to generate company {index + 1}/{quantity} after {max_attempts} attempts"
+        )
+
+    await asyncio.gather(*(generate(index) for index in range(quantity)))
+
+    return companies
 
 
 @dataclass
 class InvoiceItemsDeps:
-    invoice_items: list[tuple[str, str]] = None
+    """Invoice item SKUs generated items must not reuse. See ``CompanyDeps``."""
+
+    item_skus: set[str] = None
 
     def __post_init__(self):
-        invoice_items = db.find_invoice_item("")
-        self.invoice_items = [
-            (invoice_item.item_sku, invoice_item.item_info) for invoice_item in invoice_items
-        ]
+        if self.item_skus is None:
+            self.item_skus = db.get_invoice_item_skus()
 
 
-invoice_agent = Agent(
-    model="claude-3-5-haiku-latest",
-    deps_type=InvoiceItemsDeps,
-    result_type=list[InvoiceItem],
-    system_prompt=(
-        "You are a helpful assistant that generates invoice line items. "
-        "Do not use item_sku or item_info that are already in database. "
-    ),
+INVOICE_ITEMS_SYSTEM_PROMPT = (
+    "You are a helpful assistant that generates invoice line items. "
+    "Generate uncommon item_sku values, many invoice items already exist. "
 )
 
 
-@invoice_agent.system_prompt
-def invoice_agent_system_prompt(context: RunContext[InvoiceItemsDeps]) -> str:
-    invoice_items = context.deps.invoice_items
-    return f"List of item_sku and item_info in database: {invoice_items}"
+@cache
+def get_invoice_agent() -> "Agent[None, list[InvoiceItem]]":
+    """Returns the invoice line item agent, built on first use. See ``get_company_agent``."""
+    from pydantic_ai import Agent
+
+    return Agent(
+        model=PYDANTIC_AI_MODEL,
+        result_type=list[InvoiceItem],
+        system_prompt=INVOICE_ITEMS_SYSTEM_PROMPT,
+    )
 
 
-def create_invoice_items(quantity: int = 5) -> list[InvoiceItem]:
+def invoice_items_user_prompt(quantity: int, taken_skus: Iterable[str] = ()) -> str:
     schema = json.dumps(InvoiceItem.model_json_schema())
 
     user_prompt = (
@@ -112,27 +307,110 @@ def create_invoice_items(quantity: int = 5) -> list[InvoiceItem]:
         "Avoid duplicate item_sku and item_info. "
         f"Use JSON schema for each invoice line item: {schema}"
     )
+    if taken_skus:
+        user_prompt += f" These item_sku values are already taken: {', '.join(taken_skus)}."
+
+    return user_prompt
+
+
+def create_invoice_items(
+    quantity: int = 5,
+    max_attempts: int = PYDANTIC_AI_MAX_ATTEMPTS,
+    deps: InvoiceItemsDeps | None = None,
+) -> list[InvoiceItem]:
+    """Generates invoice items with unique SKUs.
+
+    Items whose ``item_sku`` is already in the database, or earlier in the batch, are
+    dropped, and the missing items are requested again with the rejected SKUs named in
+    the prompt.
+
+    Args:
+        quantity: Number of invoice items to generate.
+        max_attempts: Agent runs before returning fewer than ``quantity`` items.
+        deps: Invoice item SKUs to avoid. Loaded from the database when None.
+
+    Returns:
+        list[InvoiceItem]: The generated invoice items, at most ``quantity``.
+    """
+    agent = get_invoice_agent()
+    deps = deps if deps is not None else InvoiceItemsDeps()
+    invoice_items: list[InvoiceItem] = []
+    rejected_skus: list[str] = []
+
+    for _ in range(max_attempts):
+        missing = quantity - len(invoice_items)
+        generated, total_tokens = asyncio.run(
+            run_agent(
+                agent=agent,
+                result_type=list[InvoiceItem],
+                system_prompt=INVOICE_ITEMS_SYSTEM_PROMPT,
+                user_prompt=invoice_items_user_prompt(missing, rejected_skus),
+            )
+        )
+
+        rejected_skus = []
+        for invoice_item in generated[:missing]:
+            if invoice_item.item_sku in deps.item_skus:
+                rejected_skus.append(invoice_item.item_sku)
+                continue
+            deps.item_skus.add(invoice_item.item_sku)
+            invoice_items.append(invoice_item)
+
+        logfire.info(
+            "Generated {count} invoice line items, {taken} taken. Total tokens: {total_tokens}",
+            count=len(generated),
+            taken=len(rejected_skus),
+            total_tokens=total_tokens,
+        )
+
+        if len(invoice_items) == quantity:
+            break
+
+    return invoice_items
+
+
+@cache
+def get_invoice_template() -> Template:
+    """Returns the compiled invoice template, loaded once per process.
+
+    The template is read from the installed package, so rendering does not depend on the
+    current working directory. Set ``JINJA2_CACHE_DIR`` to also keep compiled bytecode on
+    disk between runs.
+    """
+    if JINJA2_CACHE_DIR:
+        Path(JINJA2_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(directory=JINJA2_CACHE_DIR)
+    else:
+        bytecode_cache = None
+
+    env = Environment(
+        loader=PackageLoader("invoice_ocr", package_path="."),
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,
+    )
+    return env.get_template("invoice.j2")
 
-    deps = InvoiceItemsDeps()
 
-    result = invoice_agent.run_sync(user_prompt=user_prompt, deps=deps)
+@cache
+def get_font_config() -> "FontConfiguration":
+    """Returns the WeasyPrint font configuration shared by every invoice in this process."""
+    from weasyprint.text.fonts import FontConfiguration
 
-    logfire.info(
-        f"Generated {quantity} invoice line items. Total tokens: {result._usage.total_tokens}"
-    )
+    return FontConfiguration()
 
-    return result.data
 
+@cache
+def get_invoice_stylesheet() -> "CSS":
+    """Returns the invoice stylesheet, parsed once per process."""
+    from weasyprint import CSS
 
-def create_pdf_invoice(invoice: Invoice) -> bytes:
-    from weasyprint import HTML
+    css = files("invoice_ocr").joinpath("invoice.css").read_text()
+    return CSS(string=css, font_config=get_font_config())
 
-    # Set up Jinja2 environment
-    env = Environment(loader=FileSystemLoader("src/invoice_ocr"))
-    template = env.get_template("invoice.j2")
 
-    # Render the template with the invoice data
-    html_content = template.render(
+def render_html_invoice(invoice: Invoice) -> str:
+    """Renders an invoice to HTML without styles. See ``get_invoice_stylesheet``."""
+    return get_invoice_template().render(
         invoice_number=invoice.invoice_number,
         issue_date=invoice.issue_date.strftime("%Y-%m-%d"),
         due_date=invoice.due_date.strftime("%Y-%m-%d"),
@@ -146,13 +424,178 @@ def create_pdf_invoice(invoice: Invoice) -> bytes:
         total=invoice.total_formatted,
     )
 
-    # html_file = Path(f"data/{invoice.invoice_number}.html")
-    # html_file.write_text(html_content)
-    # Convert HTML to PDF
-    pdf_bytes = HTML(string=html_content).write_pdf()
+
+def create_pdf_invoice(invoice: Invoice) -> bytes:
+    from weasyprint import HTML
+
+    with stage("render.template"):
+        html_content = render_html_invoice(invoice)
+
+    # Lay out the HTML, reusing the parsed stylesheet and fonts across invoices
+    with stage("render.layout"):
+        document = HTML(string=html_content).render(
+            stylesheets=[get_invoice_stylesheet()],
+            font_config=get_font_config(),
+        )
+
+    with stage("render.pdf") as span:
+        pdf_bytes = document.write_pdf()
+        span.add(items=1, nbytes=len(pdf_bytes))
 
     return pdf_bytes
 
 
+def create_pdf_invoice_profiled(
+    invoice: Invoice,
+) -> tuple[bytes, dict[str, telemetry.ProfileEntry] | None]:
+    """Renders an invoice in a worker process, with the worker profile of the rendering.
+
+    See ``telemetry.take_profile``.
+    """
+    pdf_bytes = create_pdf_invoice(invoice)
+    return pdf_bytes, telemetry.take_profile()
+
+
+def sample_invoices(
+    count: int, seed: int | None = None, batch_size: int = SAMPLE_BATCH_SIZE
+) -> Iterator[Invoice]:
+    """Builds invoices from random companies and invoice items and stores their ground truth.
+
+    Invoices are built and stored ``batch_size`` at a time, as they are consumed, so a run
+    of any size holds one batch in memory. Invoices that ``db.add_invoices`` skips are not
+    yielded, so every invoice rendered has its ground truth in the database.
+
+    Numbers come from ``db.reserve_invoice_numbers`` and are unique across runs, so they are
+    not covered by ``seed``: a seeded run repeats the companies, line items and amounts of
+    its invoices under new numbers.
+
+    Stops with an error log, yielding fewer than ``count`` invoices, if the database holds
+    fewer than two companies or no invoice item, or if reserving numbers or sampling fails.
+
+    Args:
+        count: Number of invoices to build.
+        seed: Random seed of the line item counts and database samples.
+        batch_size: Invoices sampled and stored at a time.
+
+    Yields:
+        Invoice: Each stored invoice.
+    """
+    if len(db.get_random_companies(limit=2, seed=seed) or []) < 2:  # noqa: PLR2004
+        logfire.error("Generating invoices needs at least 2 companies in the database")
+        return
+    if not db.get_random_invoice_items(limit=1, seed=seed):
+        logfire.error("Generating invoices needs at least 1 invoice item in the database")
+        return
+
+    rng = Random(seed)
+    for index, batch in enumerate(batched(range(count), batch_size)):
+        invoice_numbers = db.reserve_invoice_numbers(count=len(batch))
+        if len(invoice_numbers) != len(batch):
+            logfire.error(
+                "Reserved {reserved}/{count} invoice numbers, stopping",
+                reserved=len(invoice_numbers),
+                count=len(batch),
+            )
+            return
+
+        batch_seed = None if seed is None else seed + index
+        companies = db.get_random_companies_batch(limits=[2] * len(batch), seed=batch_seed)
+        invoice_items = db.get_random_invoice_items_batch(
+            limits=[rng.randint(1, 10) for _ in batch], seed=batch_seed
+        )
+        if (
+            len(companies) != len(batch)
+            or len(invoice_items) != len(batch)
+            or any(len(sample) < 2 for sample in companies)  # noqa: PLR2004
+        ):
+            logfire.error("Failed to sample companies and invoice items, stopping")
+            return
+
+        invoices = [
+            Invoice(
+                invoice_number=f"INV-{invoice_number}",
+                supplier=supplier,
+                customer=customer,
+                line_items=line_items,
+            )
+            for invoice_number, (supplier, customer), line_items in zip(
+                invoice_numbers, companies, invoice_items, strict=True
+            )
+        ]
+
+        invoice_ids = db.add_invoices(invoices=invoices)
+        yield from (
+            invoice
+            for invoice, invoice_id in zip(invoices, invoice_ids, strict=True)
+            if invoice_id is not None
+        )
+
+
+def render_pdf_invoices(
+    invoices: Iterable[Invoice], workers: int = 1
+) -> Iterator[tuple[Invoice, bytes]]:
+    """Renders invoices to PDF, optionally in a pool of worker processes.
+
+    WeasyPrint layout is CPU-bound, so with ``workers`` greater than one the rendering is
+    fanned out to a process pool. PDFs are yielded in the order of ``invoices``, so the
+    output does not depend on the number of workers. At most ``RENDER_AHEAD`` invoices per
+    worker are in flight, so memory does not grow with the number of invoices.
+
+    Args:
+        invoices: Invoices to render. May be a generator.
+        workers: Number of rendering processes. Renders in-process when 1.
+
+    Yields:
+        tuple[Invoice, bytes]: Each invoice and its PDF.
+    """
+    if workers <= 1:
+        for invoice in invoices:
+            yield invoice, create_pdf_invoice(invoice)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=telemetry.enable_profile,
+        initargs=(telemetry.is_profiling(),),
+    ) as executor:
+        pending: deque[tuple[Invoice, Future]] = deque()
+        for invoice in invoices:
+            pending.append((invoice, executor.submit(create_pdf_invoice_profiled, invoice)))
+            if len(pending) < workers * RENDER_AHEAD:
+                continue
+            rendered, future = pending.popleft()
+            pdf_bytes, profile = future.result()
+            telemetry.merge_profile(profile)
+            yield rendered, pdf_bytes
+
+        for rendered, future in pending:
+            pdf_bytes, profile = future.result()
+            telemetry.merge_profile(profile)
+            yield rendered, pdf_bytes
+
+
+def write_pdf_invoices(
+    invoices: Iterable[Invoice], writer: InvoiceWriter, workers: int = 1
+) -> Iterator[str]:
+    """Renders invoices and streams the PDFs to files or archives, with their manifest.
+
+    PDFs are written as soon as they are rendered, see ``render_pdf_invoices``.
+
+    Args:
+        invoices: Invoices to render, such as ``sample_invoices``. May be a generator.
+        writer: Where the PDFs, the manifest and the labels are written. Closed by the
+            caller.
+        workers: Number of rendering processes. Renders in-process when 1.
+
+    Yields:
+        str: The path of each PDF, or ``<archive path>:<file>`` in an archive.
+    """
+    for invoice, pdf_bytes in render_pdf_invoices(invoices=invoices, workers=workers):
+        with stage("pdf.write") as span:
+            location = writer.write(invoice=invoice, pdf_bytes=pdf_bytes)
+            span.add(items=1, nbytes=len(pdf_bytes))
+        yield location
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,102 @@
+"""
+Ingestion of invoice documents into the ``invoices`` table.
+
+Walks a directory of PDF and image files, hashes each file with SHA-256 and records the new
+ones. Files are read in fixed size chunks, so memory stays bounded whatever their size, and
+hashed by a thread pool, since ``hashlib`` releases the GIL while digesting large buffers.
+
+Paths are processed in batches. Each batch costs one query to look up the known hashes and
+one to insert the new files, see ``db.add_invoice_files``, so re-ingesting an archive only
+writes the files added since the last run.
+"""
+
+import hashlib
+import os
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import batched
+from pathlib import Path
+
+from .schema import InvoiceFile
+from .settings import BULK_BATCH_SIZE
+
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+}
+"""MIME type of the ingested file suffixes"""
+
+HASH_CHUNK_SIZE = 1024 * 1024
+"""Bytes read at a time while hashing a file"""
+
+
+def file_sha256(path: Path) -> str:
+    """Returns the hex SHA-256 digest of a file, read in ``HASH_CHUNK_SIZE`` chunks."""
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_files(root: Path) -> Iterator[Path]:
+    """Yields the PDF and image files under ``root``, in a stable order.
+
+    ``root`` may also be a single file.
+    """
+    if root.is_file():
+        if root.suffix.lower() in MIME_TYPES:
+            yield root
+        return
+
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if Path(filename).suffix.lower() in MIME_TYPES:
+                yield Path(directory) / filename
+
+
+def invoice_file(path: Path) -> InvoiceFile:
+    """Hashes a file and describes it as an ``invoices`` row."""
+    return InvoiceFile(
+        file_origin=str(path.resolve()),
+        file_mime_type=MIME_TYPES[path.suffix.lower()],
+        file_sha256=file_sha256(path),
+    )
+
+
+def hash_files(
+    paths: Iterable[Path], batch_size: int = BULK_BATCH_SIZE, workers: int = 4
+) -> Iterator[InvoiceFile]:
+    """Yields the ``InvoiceFile`` of each path in order, hashed by ``workers`` threads.
+
+    At most ``batch_size`` files are hashed ahead of the consumer.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batched(paths, batch_size):
+            yield from executor.map(invoice_file, batch)
+
+
+def ingest_files(
+    root: Path, batch_size: int = BULK_BATCH_SIZE, workers: int = 4
+) -> list[int | None]:
+    """Records the new PDF and image files under ``root`` in the ``invoices`` table.
+
+    Args:
+        root: Directory to walk, or a single file.
+        batch_size: Number of files hashed ahead and inserted per transaction.
+        workers: Number of hashing threads.
+
+    Returns:
+        list[int | None]: The database ID of each file in walk order, or None for files
+        already ingested or in a failed batch.
+    """
+    from . import db
+
+    files = hash_files(paths=find_files(root), batch_size=batch_size, workers=workers)
+    return db.add_invoice_files(files=files, batch_size=batch_size)
@@ -0,0 +1,286 @@
+"""
+Ground-truth labels of generated invoices, in a columnar format for OCR training.
+
+Two tables are written next to the PDFs:
+- ``invoices``: one row per invoice with the header fields, totals, and the supplier and
+  customer flattened into ``supplier_*`` and ``customer_*`` columns (billing address only,
+  as printed on the invoice)
+- ``line_items``: one row per line item, keyed by ``invoice_number`` and ``position``
+
+Both carry the ``file`` and ``archive`` of the PDF, as in the ``archive`` manifest.
+
+Parquet files (``invoices.parquet``, ``line_items.parquet``) are written with pyarrow, one
+row group per ``batch_size`` rows, so memory stays flat and readers can filter row groups
+without loading the whole dataset. pyarrow is optional (``pip install invoice-ocr[parquet]``),
+without it the same rows are written as JSONL (``invoices.jsonl``, ``line_items.jsonl``).
+"""
+
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+
+from .schema import Company, Invoice
+
+if TYPE_CHECKING:
+    import pyarrow
+    import pyarrow.parquet
+
+LABEL_FORMATS = ("parquet", "jsonl")
+
+LABEL_TABLES = ("invoices", "line_items")
+
+LABEL_BATCH_SIZE = 10_000
+"""Rows buffered per table before they are written, the Parquet row group size"""
+
+COMPANY_COLUMNS = (
+    "company_id",
+    "company_name",
+    "phone_number",
+    "email",
+    "website",
+    "address_line1",
+    "address_line2",
+    "city",
+    "province",
+    "postal_code",
+    "country",
+)
+
+
+def company_columns(role: str, company: Company) -> dict:
+    """Returns the flat ``<role>_*`` columns of a supplier or customer."""
+    address = company.address_billing
+    values = (
+        company.company_id,
+        company.company_name,
+        company.phone_number,
+        company.email,
+        company.website,
+        address.address_line1,
+        address.address_line2,
+        address.city,
+        address.province,
+        address.postal_code,
+        address.country,
+    )
+    return {
+        f"{role}_{column}": value for column, value in zip(COMPANY_COLUMNS, values, strict=True)
+    }
+
+
+def invoice_row(invoice: Invoice, file: str, archive: str | None) -> dict:
+    """Returns the ``invoices`` row of an invoice rendered to ``file``."""
+    return {
+        "invoice_number": invoice.invoice_number,
+        "file": file,
+        "archive": archive,
+        "issue_date": invoice.issue_date,
+        "due_date": invoice.due_date,
+        "payment_terms": invoice.payment_terms,
+        "currency": invoice.currency.value,
+        "tax_rate": invoice.tax_rate,
+        "subtotal": invoice.subtotal,
+        "tax_total": invoice.tax_total,
+        "total": invoice.total,
+        "line_item_count": len(invoice.line_items),
+        **company_columns("supplier", invoice.supplier),
+        **company_columns("customer", invoice.customer),
+    }
+
+
+def line_item_rows(invoice: Invoice, file: str, archive: str | None) -> list[dict]:
+    """Returns the ``line_items`` rows of an invoice, positions starting at 1."""
+    return [
+        {
+            "invoice_number": invoice.invoice_number,
+            "file": file,
+            "archive": archive,
+            "position": position,
+            "item_sku": item.item_sku,
+            "item_info": item.item_info,
+            "quantity": item.quantity,
+            "unit_price": item.unit_price,
+            "total_price": item.total_price,
+        }
+        for position, item in enumerate(invoice.line_items, start=1)
+    ]
+
+
+def invoice_schema() -> "pyarrow.Schema":
+    import pyarrow as pa
+
+    company_fields = [
+        pa.field(f"{role}_{column}", pa.string())
+        for role in ("supplier", "customer")
+        for column in COMPANY_COLUMNS
+    ]
+    return pa.schema(
+        [
+            pa.field("invoice_number", pa.string()),
+            pa.field("file", pa.string()),
+            pa.field("archive", pa.string()),
+            pa.field("issue_date", pa.timestamp("us")),
+            pa.field("due_date", pa.timestamp("us")),
+            pa.field("payment_terms", pa.int32()),
+            pa.field("currency", pa.dictionary(pa.int8(), pa.string())),
+            pa.field("tax_rate", pa.int32()),
+            pa.field("subtotal", pa.decimal128(12, 2)),
+            pa.field("tax_total", pa.decimal128(12, 2)),
+            pa.field("total", pa.decimal128(12, 2)),
+            pa.field("line_item_count", pa.int32()),
+            *company_fields,
+        ]
+    )
+
+
+def line_item_schema() -> "pyarrow.Schema":
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            pa.field("invoice_number", pa.string()),
+            pa.field("file", pa.string()),
+            pa.field("archive", pa.string()),
+            pa.field("position", pa.int32()),
+            pa.field("item_sku", pa.string()),
+            pa.field("item_info", pa.string()),
+            pa.field("quantity", pa.int32()),
+            pa.field("unit_price", pa.decimal128(12, 2)),
+            pa.field("total_price", pa.decimal128(12, 2)),
+        ]
+    )
+
+
+class LabelWriter(ABC):
+    """Buffers label rows and writes them ``batch_size`` rows at a time.
+
+    Use as a context manager, so the last rows are written and the files closed.
+
+    Args:
+        output_dir: Directory of the label files.
+        batch_size: Rows buffered per table before they are written.
+    """
+
+    def __init__(self, output_dir: Path, batch_size: int = LABEL_BATCH_SIZE):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.invoices: list[dict] = []
+        self.line_items: list[dict] = []
+
+    def __enter__(self) -> "LabelWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def write(self, invoice: Invoice, file: str, archive: str | None = None) -> None:
+        """Adds the labels of an invoice rendered to ``file``, in ``archive`` if any."""
+        self.invoices.append(invoice_row(invoice, file, archive))
+        self.line_items.extend(line_item_rows(invoice, file, archive))
+
+        if len(self.invoices) >= self.batch_size:
+            self.flush_invoices()
+        if len(self.line_items) >= self.batch_size:
+            self.flush_line_items()
+
+    def flush_invoices(self) -> None:
+        if self.invoices:
+            self.write_invoices(self.invoices)
+            self.invoices = []
+
+    def flush_line_items(self) -> None:
+        if self.line_items:
+            self.write_line_items(self.line_items)
+            self.line_items = []
+
+    @abstractmethod
+    def write_invoices(self, rows: list[dict]) -> None:
+        """Writes a batch of ``invoices`` rows."""
+
+    @abstractmethod
+    def write_line_items(self, rows: list[dict]) -> None:
+        """Writes a batch of ``line_items`` rows."""
+
+    def close(self) -> None:
+        """Writes the buffered rows."""
+        self.flush_invoices()
+        self.flush_line_items()
+
+
+class ParquetLabelWriter(LabelWriter):
+    """Writes the label tables as Parquet files, one row group per batch."""
+
+    def __init__(self, output_dir: Path, batch_size: int = LABEL_BATCH_SIZE):
+        import pyarrow.parquet as pq
+
+        super().__init__(output_dir=output_dir, batch_size=batch_size)
+        self.invoices_file = pq.ParquetWriter(
+            output_dir / "invoices.parquet", invoice_schema(), compression="zstd"
+        )
+        self.line_items_file = pq.ParquetWriter(
+            output_dir / "line_items.parquet", line_item_schema(), compression="zstd"
+        )
+
+    @staticmethod
+    def write_rows(file: "pyarrow.parquet.ParquetWriter", rows: list[dict]) -> None:
+        import pyarrow as pa
+
+        file.write_table(pa.Table.from_pylist(rows, schema=file.schema), row_group_size=len(rows))
+
+    def write_invoices(self, rows: list[dict]) -> None:
+        self.write_rows(self.invoices_file, rows)
+
+    def write_line_items(self, rows: list[dict]) -> None:
+        self.write_rows(self.line_items_file, rows)
+
+    def close(self) -> None:
+        super().close()
+        self.invoices_file.close()
+        self.line_items_file.close()
+
+
+class JsonlLabelWriter(LabelWriter):
+    """Writes the label tables as JSONL files, dates in ISO 8601 and amounts as strings."""
+
+    def __init__(self, output_dir: Path, batch_size: int = LABEL_BATCH_SIZE):
+        super().__init__(output_dir=output_dir, batch_size=batch_size)
+        self.invoices_file: IO[str] = (output_dir / "invoices.jsonl").open("w")
+        self.line_items_file: IO[str] = (output_dir / "line_items.jsonl").open("w")
+
+    @staticmethod
+    def write_rows(file: IO[str], rows: list[dict]) -> None:
+        file.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+
+    def write_invoices(self, rows: list[dict]) -> None:
+        self.write_rows(self.invoices_file, rows)
+
+    def write_line_items(self, rows: list[dict]) -> None:
+        self.write_rows(self.line_items_file, rows)
+
+    def close(self) -> None:
+        super().close()
+        self.invoices_file.close()
+        self.line_items_file.close()
+
+
+def get_label_writer(
+    output_dir: Path, label_format: str = "parquet", batch_size: int = LABEL_BATCH_SIZE
+) -> LabelWriter:
+    """Returns the label writer of a format, JSONL if Parquet is asked but pyarrow is missing.
+
+    Raises:
+        ValueError: If the label format is unknown.
+    """
+    if label_format not in LABEL_FORMATS:
+        raise ValueError(f"Unknown label format: {label_format}")
+
+    if label_format == "parquet":
+        try:
+            return ParquetLabelWriter(output_dir=output_dir, batch_size=batch_size)
+        except ImportError:
+            import logfire
+
+            logfire.warning("pyarrow is not installed, writing the labels as JSONL")
+
+    return JsonlLabelWriter(output_dir=output_dir, batch_size=batch_size)
@@ -0,0 +1,157 @@
+"""
+Content-addressed cache of LLM generation results.
+
+Agent results are stored in a SQLite file keyed by the SHA-256 of the model name, the prompts,
+the JSON schema of the result type and a caller supplied variant (such as the position of a
+company in a batch). Rerunning a dataset build replays the stored results instead of paying for
+the model again, and replay mode rebuilds a dataset offline without reaching the model at all.
+
+The cache is bounded in size. Writes only add to a running total of the stored size, and once
+it grows past its limit the least recently used results are evicted down to
+``EVICTION_TARGET`` of the limit, so the cost of eviction is spread over many writes. Hits and
+misses are counted with logfire metrics.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from functools import cache
+from pathlib import Path
+
+import logfire
+
+from .settings import LLM_CACHE_MAX_MB, LLM_CACHE_PATH, LLM_CACHE_REPLAY
+
+QUERY_CREATE_RESPONSES = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        value TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_last_used_idx ON responses (last_used);
+"""
+
+QUERY_GET_RESPONSE = "UPDATE responses SET last_used = ? WHERE key = ? RETURNING value;"
+
+QUERY_PUT_RESPONSE = """
+    INSERT OR REPLACE INTO responses (key, model, value, size, created_at, last_used)
+    VALUES (?, ?, ?, ?, ?, ?);
+"""
+
+QUERY_TOTAL_SIZE = "SELECT coalesce(sum(size), 0) FROM responses;"
+
+QUERY_LEAST_RECENTLY_USED = "SELECT key, size FROM responses ORDER BY last_used, key;"
+
+QUERY_EVICT_RESPONSES = "DELETE FROM responses WHERE key IN (SELECT value FROM json_each(?));"
+
+EVICTION_TARGET = 0.9
+"""Fraction of the size limit left after an eviction, so evictions run once per many writes"""
+
+hits_counter = logfire.metric_counter("llm_cache_hits", description="LLM cache hits")
+misses_counter = logfire.metric_counter("llm_cache_misses", description="LLM cache misses")
+
+
+class LLMCacheMissError(LookupError):
+    """Raised in replay mode when a result is not in the cache."""
+
+
+class LLMCache:
+    """SQLite store of LLM results, keyed by ``cache_key``.
+
+    Args:
+        path: SQLite file, created with its parent directories if missing.
+        max_bytes: Total size of stored results before least recently used ones are evicted.
+        replay: Raise ``LLMCacheMissError`` on a miss instead of letting the caller run the model.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, replay: bool = False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.executescript(QUERY_CREATE_RESPONSES)
+        self.size: int = self.conn.execute(QUERY_TOTAL_SIZE).fetchone()[0]
+
+    @staticmethod
+    def cache_key(
+        model: str, system_prompt: str, user_prompt: str, schema: dict, variant: str = ""
+    ) -> str:
+        """Returns the SHA-256 content address of an agent run."""
+        content = json.dumps(
+            [model, system_prompt, user_prompt, schema, variant], sort_keys=True
+        ).encode()
+        return hashlib.sha256(content).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Returns the stored result JSON of a key, or None on a miss.
+
+        Raises:
+            LLMCacheMissError: On a miss in replay mode.
+        """
+        row = self.conn.execute(QUERY_GET_RESPONSE, (time.time(), key)).fetchone()
+        if row is not None:
+            self.hits += 1
+            hits_counter.add(1)
+            return row[0]
+
+        self.misses += 1
+        misses_counter.add(1)
+        if self.replay:
+            raise LLMCacheMissError(f"LLM result {key} is not cached and replay mode is on")
+        return None
+
+    def put(self, key: str, model: str, value: str) -> None:
+        """Stores the result JSON of a key, evicting results if the cache is over its limit."""
+        now = time.time()
+        size = len(value.encode())
+        self.conn.execute(QUERY_PUT_RESPONSE, (key, model, value, size, now, now))
+        self.size += size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """Evicts the least recently used results down to ``EVICTION_TARGET`` of the limit.
+
+        The stored size is recounted first, as replaced results and writes of other processes
+        sharing the file make the running total approximate. Only the evicted rows are read.
+        """
+        self.size = self.conn.execute(QUERY_TOTAL_SIZE).fetchone()[0]
+        if self.size <= self.max_bytes:
+            return
+
+        excess = self.size - int(self.max_bytes * EVICTION_TARGET)
+        keys = []
+        freed = 0
+        for key, size in self.conn.execute(QUERY_LEAST_RECENTLY_USED):
+            if freed >= excess:
+                break
+            keys.append(key)
+            freed += size
+
+        evicted = self.conn.execute(QUERY_EVICT_RESPONSES, (json.dumps(keys),)).rowcount
+        self.size -= freed
+        logfire.info(f"Evicted {evicted} LLM results from {self.path}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+@cache
+def get_llm_cache() -> LLMCache | None:
+    """Returns the LLM cache configured by ``LLM_CACHE_PATH``, or None if it is disabled."""
+    if not LLM_CACHE_PATH:
+        return None
+
+    return LLMCache(
+        path=Path(LLM_CACHE_PATH),
+        max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+        replay=LLM_CACHE_REPLAY,
+    )
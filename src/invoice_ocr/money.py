@@ -0,0 +1,94 @@
+"""
+Exact money arithmetic of invoices.
+
+Amounts are ``Decimal`` values with two decimal places, matching the ``decimal(10, 2)``
+columns of ``schema.sql``, so they round trip through the database unchanged. Inputs such as
+floats from an LLM are rounded to the cent once, when they are validated (see ``to_money``).
+
+Rounding rules, shared by ``schema.Invoice`` and ``batch_totals``:
+- Line totals are ``quantity * unit_price``, exact in cents
+- The subtotal is the exact sum of the line totals
+- The tax is computed once on the subtotal, ``subtotal * tax_rate / 100``, rounded half up
+  (away from zero) to the cent, and never per line
+- The total is ``subtotal + tax``
+
+``batch_totals`` applies the same rules to integer-cent NumPy arrays, so reconciliation jobs
+can check the totals of millions of invoices without building a model per invoice. NumPy is
+optional (``pip install invoice-ocr[numpy]``) and only imported by ``batch_totals``.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+CENT = Decimal("0.01")
+CENT_EXPONENT = CENT.as_tuple().exponent
+
+MONEY_ROUNDING = ROUND_HALF_UP
+"""Rounding of inputs with more than two decimals and of taxes"""
+
+
+def to_money(value: Decimal | float | int | str) -> Decimal:
+    """Returns an amount rounded to the cent.
+
+    Floats are converted through their shortest repr, so ``19.99`` is ``Decimal("19.99")``
+    and not the nearest binary fraction.
+    """
+    if isinstance(value, Decimal) and value.as_tuple().exponent == CENT_EXPONENT:
+        return value
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value).quantize(CENT, rounding=MONEY_ROUNDING)
+
+
+def to_cents(amount: Decimal) -> int:
+    """Returns an amount rounded to the cent as an integer number of cents."""
+    return int(to_money(amount).scaleb(2))
+
+
+def from_cents(cents: int) -> Decimal:
+    """Returns an integer number of cents as an amount."""
+    return Decimal(cents).scaleb(-2)
+
+
+def tax_cents(subtotal_cents: int, tax_rate: int) -> int:
+    """Returns the tax of a subtotal in cents, rounded half up (away from zero)."""
+    tax = (abs(subtotal_cents) * tax_rate + 50) // 100
+    return tax if subtotal_cents >= 0 else -tax
+
+
+def batch_totals(
+    invoice_index: "np.ndarray",
+    quantities: "np.ndarray",
+    unit_price_cents: "np.ndarray",
+    tax_rates: "np.ndarray",
+) -> tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Returns the subtotal, tax and total in cents of many invoices at once.
+
+    Line items are given as flat arrays, each line pointing to its invoice. Arithmetic stays
+    in int64 cents, so the results are exact and equal to the totals of ``schema.Invoice``.
+
+    Args:
+        invoice_index: Position of the invoice of each line item, in ``[0, len(tax_rates))``.
+        quantities: Quantity of each line item.
+        unit_price_cents: Unit price of each line item in cents.
+        tax_rates: Tax rate of each invoice, as a percentage.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The int64 subtotal, tax and total of each
+            invoice in cents. Invoices without line items have zero totals.
+    """
+    import numpy as np
+
+    line_cents = np.asarray(quantities, dtype=np.int64) * np.asarray(
+        unit_price_cents, dtype=np.int64
+    )
+    subtotals = np.zeros(len(tax_rates), dtype=np.int64)
+    np.add.at(subtotals, np.asarray(invoice_index, dtype=np.intp), line_cents)
+
+    taxes = (np.abs(subtotals) * np.asarray(tax_rates, dtype=np.int64) + 50) // 100
+    taxes = np.where(subtotals >= 0, taxes, -taxes)
+
+    return subtotals, taxes, subtotals + taxes
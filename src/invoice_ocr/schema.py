@@ -6,9 +6,16 @@ Cody Instructions:
 
 import re
 from datetime import datetime, timedelta
+from decimal import Decimal
 from enum import Enum
+from typing import Annotated
 
-from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic import AfterValidator, BaseModel, Field, field_validator, model_validator
+
+from .money import from_cents, tax_cents, to_cents, to_money
+
+Money = Annotated[Decimal, AfterValidator(to_money)]
+"""Amount rounded to the cent, see ``money``"""
 
 
 class Address(BaseModel):
@@ -87,12 +94,12 @@ class InvoiceItem(BaseModel):
     quantity: int = Field(
         description="Quantity of items",
     )
-    unit_price: float = Field(
+    unit_price: Money = Field(
         description="Price per unit",
     )
-    total_price: float = Field(
+    total_price: Money = Field(
         description="Total price for the item",
-        default=0.0,
+        default=Decimal("0.00"),
     )
 
     @model_validator(mode="after")
@@ -117,7 +124,7 @@ class Invoice(BaseModel):
         description="Date when invoice was issued",
         default_factory=lambda: datetime.now(),
     )
-    payment_terms: datetime = Field(
+    payment_terms: int = Field(
         description="Payment terms number of days from issue date",
         default=30,
     )
@@ -143,24 +150,27 @@ class Invoice(BaseModel):
         description="Currency of invoice",
         default=Currency.CAD,
     )
-    tax_total: float = Field(
+    tax_total: Money = Field(
         description="Total tax amount",
-        default=0.0,
+        default=Decimal("0.00"),
     )
-    subtotal: float = Field(
+    subtotal: Money = Field(
         description="Subtotal of invoice line_items",
-        default=0.0,
+        default=Decimal("0.00"),
     )
-    total: float = Field(
+    total: Money = Field(
         description="Total of invoice line_items plus tax",
-        default=0.0,
+        default=Decimal("0.00"),
     )
 
     @model_validator(mode="after")
     def calculate_totals(self) -> "Invoice":
-        self.subtotal = sum(item.total_price for item in self.line_items)
-        self.tax_total = self.subtotal * (self.tax_rate / 100)
-        self.total = self.subtotal + self.tax_total
+        """Computes the totals in cents with the rounding rules of ``money``."""
+        subtotal = sum(item.quantity * to_cents(item.unit_price) for item in self.line_items)
+        tax = tax_cents(subtotal, self.tax_rate)
+        self.subtotal = from_cents(subtotal)
+        self.tax_total = from_cents(tax)
+        self.total = from_cents(subtotal + tax)
         return self
 
     @property
@@ -174,3 +184,16 @@ class Invoice(BaseModel):
     @property
     def total_formatted(self) -> str:
         return f"${self.total:,.2f} " + self.currency.value
+
+
+class InvoiceFile(BaseModel):
+    file_origin: str = Field(
+        description="Path or URL the file was ingested from",
+    )
+    file_mime_type: str = Field(
+        description="MIME type of the file, such as application/pdf",
+    )
+    file_sha256: str = Field(
+        description="Hex SHA-256 digest of the file content",
+        pattern="^[0-9a-f]{64}$",
+    )
@@ -1,5 +1,8 @@
 --- PostgreSQL database schema for invoice_ocr
 ---
+--- Trigram matching for the substring searches of find_company and find_invoice_item
+create extension if not exists pg_trgm;
+
 --- Corresponds to Python class Address
 create table if not exists postal_addresses (
   id serial primary key,
@@ -27,6 +30,19 @@ create table if not exists companies (
   updated_at timestamp default current_timestamp
 );
 
+--- Foreign key lookups used by address joins and orphaned address purges
+create index if not exists companies_address_billing_idx on companies (address_billing);
+create index if not exists companies_address_shipping_idx on companies (address_shipping);
+
+--- Trigram index used by find_company
+create index if not exists companies_search_idx on companies using gin (
+  (company_id::text) gin_trgm_ops,
+  company_name gin_trgm_ops,
+  phone_number gin_trgm_ops,
+  email gin_trgm_ops,
+  website gin_trgm_ops
+);
+
 --- Corresponds to Python class InvoiceItem
 create table if not exists invoice_items (
   id serial primary key,
@@ -38,13 +54,89 @@ create table if not exists invoice_items (
   updated_at timestamp default current_timestamp
 );
 
--- Corresponds to Python class Invoice
+--- Trigram index used by find_invoice_item
+create index if not exists invoice_items_search_idx on invoice_items using gin (
+  (item_sku::text) gin_trgm_ops,
+  item_info gin_trgm_ops
+);
+
+--- Invoice files for OCR, such as rendered or scanned invoice PDFs
 create table if not exists invoices (
   id serial primary key,
   file_origin varchar(4096) not null,
   file_mime_type varchar(20) not null,
   file_sha256 varchar(64) not null unique,
-  file_webp bytea,
+  file_webp_sha256 char(64),
   created_at timestamp default current_timestamp,
   updated_at timestamp default current_timestamp
 );
+
+--- WebP previews moved to the blob store, see the blobs module. Previews are derived data,
+--- rerun the rasterize command to store them again.
+alter table invoices add column if not exists file_webp_sha256 char(64);
+alter table invoices drop column if exists file_webp;
+
+--- Invoice files still waiting for their WebP preview, scanned by rasterize_invoices
+create index if not exists invoices_file_webp_missing_idx on invoices (id)
+  where file_webp_sha256 is null;
+
+--- Content-addressed blobs of the postgres blob store, kept out of the invoices rows
+create table if not exists blobs (
+  sha256 char(64) primary key,
+  content bytea not null,
+  created_at timestamp default current_timestamp
+);
+
+--- Blobs are compressed images, so TOAST stores them out of line without compressing again
+alter table blobs alter column content set storage external;
+
+--- Numbers of generated invoices, never handed out twice. Starts above the 1000-9999 range
+--- drawn at random by earlier versions, so new numbers do not clash with stored invoices
+create sequence if not exists invoice_number_seq start with 100000;
+
+--- Corresponds to Python class Invoice, the ground truth of a generated invoice
+create table if not exists invoice_records (
+  id serial primary key,
+  invoice_number varchar(64) not null unique,
+  issue_date timestamp not null,
+  due_date timestamp not null,
+  supplier integer not null references companies (id),
+  customer integer not null references companies (id),
+  tax_rate integer not null,
+  currency char(3) not null,
+  created_at timestamp default current_timestamp,
+  updated_at timestamp default current_timestamp
+);
+
+--- Foreign key lookups and date range scans over invoice records
+create index if not exists invoice_records_supplier_idx on invoice_records (supplier);
+create index if not exists invoice_records_customer_idx on invoice_records (customer);
+create index if not exists invoice_records_issue_date_idx on invoice_records (issue_date);
+
+--- Corresponds to Python class InvoiceItem as a line of an invoice, priced when invoiced
+create table if not exists invoice_line_items (
+  id serial primary key,
+  invoice integer not null references invoice_records (id) on delete cascade,
+  position integer not null,
+  invoice_item integer not null references invoice_items (id),
+  quantity integer not null,
+  unit_price decimal(10, 2) not null,
+  unique (invoice, position)
+);
+
+--- Foreign key lookup of the invoices billing an invoice item
+create index if not exists invoice_line_items_invoice_item_idx on invoice_line_items (invoice_item);
+
+--- Corresponds to Python class Invoice as extracted from an invoice file, keyed by its content
+create table if not exists invoice_extractions (
+  file_sha256 varchar(64) primary key references invoices (file_sha256) on delete cascade,
+  model varchar(255) not null,
+  invoice jsonb not null,
+  created_at timestamp default current_timestamp
+);
+
+--- Files that cannot be extracted without OCR or at all, recorded with a NULL invoice so
+--- reruns skip them. Delete their rows to extract them again.
+alter table invoice_extractions alter column invoice drop not null;
+alter table invoice_extractions add column if not exists status varchar(20) not null default 'extracted';
+alter table invoice_extractions add column if not exists error text;
@@ -1,15 +1,24 @@
 import os
-from typing import cast
+from functools import cache
+from typing import TYPE_CHECKING, cast
 
 import dotenv
-import google.auth
-from pydantic_ai.models import KnownModelName
+
+if TYPE_CHECKING:
+    from google.auth.credentials import Credentials
+    from pydantic_ai.models import KnownModelName
 
 dotenv.load_dotenv()
 
-GOOGLE_CREDENTIALS, GOOGLE_PROJECT_ID = google.auth.default()
+PYDANTIC_AI_MODEL = cast(
+    "KnownModelName", os.getenv("PYDANTIC_AI_MODEL", "claude-3-5-haiku-latest")
+)
+PYDANTIC_AI_CONCURRENCY = int(os.environ.get("PYDANTIC_AI_CONCURRENCY", default="8"))
+PYDANTIC_AI_MAX_ATTEMPTS = int(os.environ.get("PYDANTIC_AI_MAX_ATTEMPTS", default="5"))
 
-PYDANTIC_AI_MODEL = cast(KnownModelName, os.getenv("PYDANTIC_AI_MODEL", "claude-3-5-haiku-latest"))
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", default=None)
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", default="512"))
+LLM_CACHE_REPLAY = os.environ.get("LLM_CACHE_REPLAY", default="false").lower() in ("1", "true")
 
 POSTGRES_HOST = os.environ.get("POSTGRES_HOST", default="localhost")
 POSTGRES_PORT = os.environ.get("POSTGRES_PORT", default="5432")
@@ -17,5 +26,49 @@ POSTGRES_DB = os.environ.get("POSTGRES_DB", default="invoice_ocr")
 POSTGRES_USER = os.environ.get("POSTGRES_USER", default="postgres")
 POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASSWORD", default="postgres")
 
+POSTGRES_POOL_MIN_SIZE = int(os.environ.get("POSTGRES_POOL_MIN_SIZE", default="2"))
+POSTGRES_POOL_MAX_SIZE = int(os.environ.get("POSTGRES_POOL_MAX_SIZE", default="10"))
+POSTGRES_POOL_MAX_IDLE = float(os.environ.get("POSTGRES_POOL_MAX_IDLE", default="300"))
+POSTGRES_POOL_MAX_LIFETIME = float(os.environ.get("POSTGRES_POOL_MAX_LIFETIME", default="300"))
+POSTGRES_POOL_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", default="30"))
+
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", default="10000"))
+
+JINJA2_CACHE_DIR = os.environ.get("JINJA2_CACHE_DIR", default=None)
+
+RASTERIZE_BATCH_SIZE = int(os.environ.get("RASTERIZE_BATCH_SIZE", default="100"))
+WEBP_MAX_SIZE = int(os.environ.get("WEBP_MAX_SIZE", default="1600"))
+WEBP_QUALITY = int(os.environ.get("WEBP_QUALITY", default="80"))
+
+BLOB_STORE = os.environ.get("BLOB_STORE", default="postgres")
+BLOB_STORE_PATH = os.environ.get("BLOB_STORE_PATH", default="data/blobs")
+BLOB_STORE_BUCKET = os.environ.get("BLOB_STORE_BUCKET", default=None)
+BLOB_STORE_PREFIX = os.environ.get("BLOB_STORE_PREFIX", default="blobs/")
+
 LOG_LEVEL = os.environ.get("LOG_LEVEL", default="INFO")
 LOGFIRE_SERVICE_NAME = os.environ.get("LOGFIRE_SERVICE_NAME", default="invoice-ocr")
+TELEMETRY = os.environ.get("TELEMETRY", default="true").lower() in ("1", "true")
+
+
+@cache
+def google_credentials() -> tuple["Credentials", str | None]:
+    """Returns the Google application default credentials and project ID.
+
+    Credential discovery is slow, so it runs on first use by the Google Cloud clients
+    instead of at import time.
+    """
+    import google.auth
+
+    return google.auth.default()
+
+
+@cache
+def configure_logfire() -> None:
+    """Configures logfire once per process.
+
+    Called by the modules that log, so commands that do not log, such as ``--help``, never
+    import logfire.
+    """
+    import logfire
+
+    logfire.configure(send_to_logfire="if-token-present", service_name=LOGFIRE_SERVICE_NAME)
@@ -0,0 +1,300 @@
+"""
+Deterministic offline generator of synthetic companies and invoice items.
+
+An alternative to the LLM agents of the ``generate`` module for load tests. Records are built
+from word lists with a seeded ``random.Random``, so the same seed always yields the same
+records, without network access.
+
+``company_rows`` and ``invoice_item_rows`` are the bulk path: they yield plain tuples that
+``db.add_company_rows`` and ``db.add_invoice_item_rows`` copy into the database as is, at
+over a hundred thousand companies (about 2.5 COPY rows each with their addresses) and over
+two hundred thousand invoice items per second on one core. ``generate_companies`` and
+``generate_invoice_items`` build the same records as models, two to four times slower.
+
+IDs and SKUs follow ``^[A-Z]{4}[0-9]$`` and are drawn from a seeded permutation of all
+4,569,760 possible values, so they are unique without keeping the generated ones in memory.
+Postal codes start with the letter of the province of their city and never use the letters
+Canada Post leaves out, so they pass ``Address.validate_postal_code``.
+
+Models are built with ``model_construct``: every field is valid by construction, so
+validation is skipped.
+"""
+
+from collections.abc import Container, Iterator
+from math import gcd
+from random import Random
+from string import ascii_uppercase
+from typing import TYPE_CHECKING
+
+from .money import from_cents
+from .schema import Address, Company, InvoiceItem
+
+if TYPE_CHECKING:
+    from .db import AddressRow, CompanyRow, InvoiceItemRow
+
+
+ID_SPACE = 26**4 * 10
+"""Number of possible ``^[A-Z]{4}[0-9]$`` company IDs and item SKUs"""
+
+CITIES = [
+    ("Toronto", "ON", "M"),
+    ("Ottawa", "ON", "K"),
+    ("Hamilton", "ON", "L"),
+    ("Sudbury", "ON", "P"),
+    ("London", "ON", "N"),
+    ("Montreal", "QC", "H"),
+    ("Quebec City", "QC", "G"),
+    ("Sherbrooke", "QC", "J"),
+    ("Vancouver", "BC", "V"),
+    ("Victoria", "BC", "V"),
+    ("Calgary", "AB", "T"),
+    ("Edmonton", "AB", "T"),
+    ("Winnipeg", "MB", "R"),
+    ("Regina", "SK", "S"),
+    ("Saskatoon", "SK", "S"),
+    ("Halifax", "NS", "B"),
+    ("Fredericton", "NB", "E"),
+    ("St. John's", "NL", "A"),
+    ("Charlottetown", "PE", "C"),
+    ("Whitehorse", "YT", "Y"),
+]
+"""City, province and first postal code letter"""
+
+POSTAL_CODE_LETTERS = "ABCEGHJKLMNPRSTVWXYZ"
+"""Letters used in Canadian postal codes, without D, F, I, O, Q and U"""
+
+LETTER_PAIRS = [ascii_uppercase[pair % 26] + ascii_uppercase[pair // 26] for pair in range(26**2)]
+"""Two letters of an ID by their base 26 value, least significant letter first"""
+
+STREETS = ["Main St", "King St", "Queen St", "Elm St", "Oak Ave", "Maple Dr", "Pine Rd",
+           "Cedar Ln", "Lakeshore Blvd", "Park Ave", "Church St", "Victoria Ave"]  # fmt: skip
+
+NAME_PREFIXES = ["Northern", "Maple", "Summit", "Pacific", "Atlantic", "Prairie", "Aurora",
+                 "Granite", "Harbour", "Boreal", "Cascade", "Polar", "Timber", "Beacon"]  # fmt: skip
+
+NAME_NOUNS = ["Systems", "Solutions", "Logistics", "Networks", "Dynamics", "Analytics",
+              "Supply", "Industries", "Technologies", "Consulting", "Robotics", "Labs"]  # fmt: skip
+
+NAME_SUFFIXES = ["Inc.", "Ltd.", "Corp.", "Co."]
+
+ITEM_BRANDS = ["Acer", "Apple", "Asus", "Dell", "HP", "Lenovo", "Logitech", "Samsung",
+               "Cisco", "Netgear", "Kingston", "Seagate", "Western Digital", "Intel"]  # fmt: skip
+
+ITEM_PRODUCTS = [
+    ("Laptop", 600, 3000),
+    ("Desktop PC", 500, 2500),
+    ("Monitor", 150, 1200),
+    ("Keyboard", 20, 200),
+    ("Mouse", 10, 120),
+    ("Docking Station", 100, 400),
+    ("Network Switch", 80, 2000),
+    ("Wireless Router", 60, 600),
+    ("SSD", 50, 700),
+    ("Hard Drive", 40, 400),
+    ("Memory Module", 30, 400),
+    ("Webcam", 30, 250),
+    ("Headset", 25, 350),
+    ("USB-C Cable", 5, 40),
+]
+"""Product name and unit price range"""
+
+
+def unique_ids(rng: Random, taken: Container[str] = frozenset()) -> Iterator[str]:
+    """Yields every ``^[A-Z]{4}[0-9]$`` value not in ``taken`` once, in a seeded order.
+
+    The order is the affine permutation ``(a * i + b) mod ID_SPACE`` with ``a`` coprime to
+    ``ID_SPACE``, which visits every value exactly once in constant memory.
+    """
+    a = rng.randrange(1, ID_SPACE)
+    while gcd(a, ID_SPACE) != 1:
+        a = rng.randrange(1, ID_SPACE)
+    b = rng.randrange(ID_SPACE)
+
+    for i in range(ID_SPACE):
+        value, digit = divmod((a * i + b) % ID_SPACE, 10)
+        high, low = divmod(value, 26**2)
+        unique_id = f"{LETTER_PAIRS[low]}{LETTER_PAIRS[high]}{digit}"
+        if unique_id not in taken:
+            yield unique_id
+
+
+def address_row(rng: Random) -> "AddressRow":
+    """Returns a random Canadian address as an ``AddressRow``."""
+    random = rng.random
+    city, province, first_letter = CITIES[int(random() * len(CITIES))]
+    letters = POSTAL_CODE_LETTERS
+    return (
+        f"{1 + int(random() * 9999)} {STREETS[int(random() * len(STREETS))]}",
+        f"Suite {100 + int(random() * 900)}" if random() < 0.3 else "",  # noqa: PLR2004
+        city,
+        province,
+        f"{first_letter}{int(random() * 10)}{letters[int(random() * len(letters))]} "
+        f"{int(random() * 10)}{letters[int(random() * len(letters))]}{int(random() * 10)}",
+        "Canada",
+    )
+
+
+def address(rng: Random) -> Address:
+    """Returns a random Canadian address."""
+    return address_model(address_row(rng))
+
+
+def address_model(row: "AddressRow") -> Address:
+    line1, line2, city, province, postal_code_, country = row
+    return Address.model_construct(
+        address_line1=line1,
+        address_line2=line2,
+        city=city,
+        province=province,
+        postal_code=postal_code_,
+        country=country,
+    )
+
+
+def company_rows(
+    quantity: int, seed: int | None = None, taken_ids: Container[str] = frozenset()
+) -> Iterator["CompanyRow"]:
+    """Yields synthetic companies with unique company IDs as ``CompanyRow`` tuples.
+
+    The bulk path of ``generate_companies``, for ``db.add_company_rows``: the same seed
+    yields the same companies, without building models.
+
+    Args:
+        quantity: Number of companies to generate.
+        seed: Random seed. The same seed and ``taken_ids`` yield the same companies.
+        taken_ids: Company IDs to skip, such as ``db.get_company_ids()``.
+
+    Yields:
+        CompanyRow: Schema-valid companies, half of them with a shipping address.
+
+    Raises:
+        ValueError: If fewer than ``quantity`` company IDs are left.
+    """
+    rng = Random(seed)
+    random = rng.random
+    company_ids = unique_ids(rng, taken_ids)
+    names = [
+        [(f"{prefix} {noun}", f"{prefix}{noun}".lower()) for noun in NAME_NOUNS]
+        for prefix in NAME_PREFIXES
+    ]
+
+    for _ in range(quantity):
+        company_id = next(company_ids, None)
+        if company_id is None:
+            raise ValueError(f"No company IDs left to generate {quantity} companies")
+
+        name, domain = names[int(random() * len(NAME_PREFIXES))][int(random() * len(NAME_NOUNS))]
+        domain = f"{domain}{company_id.lower()}.ca"
+        billing = address_row(rng)
+        company_name = f"{name} {NAME_SUFFIXES[int(random() * len(NAME_SUFFIXES))]}"
+        shipping = address_row(rng) if random() < 0.5 else None  # noqa: PLR2004
+
+        yield (
+            company_id,
+            company_name,
+            billing,
+            shipping,
+            f"+1-{200 + int(random() * 800)}-555-{int(random() * 10000):04d}",
+            f"info@{domain}",
+            f"https://www.{domain}",
+        )
+
+
+def generate_companies(
+    quantity: int, seed: int | None = None, taken_ids: Container[str] = frozenset()
+) -> Iterator[Company]:
+    """Yields synthetic companies with unique company IDs.
+
+    Args:
+        quantity: Number of companies to generate.
+        seed: Random seed. The same seed and ``taken_ids`` yield the same companies.
+        taken_ids: Company IDs to skip, such as ``db.get_company_ids()``.
+
+    Yields:
+        Company: Schema-valid companies, half of them with a shipping address.
+
+    Raises:
+        ValueError: If fewer than ``quantity`` company IDs are left.
+    """
+    for row in company_rows(quantity=quantity, seed=seed, taken_ids=taken_ids):
+        company_id, company_name, billing, shipping, phone_number, email, website = row
+        yield Company.model_construct(
+            company_id=company_id,
+            company_name=company_name,
+            address_billing=address_model(billing),
+            address_shipping=None if shipping is None else address_model(shipping),
+            phone_number=phone_number,
+            email=email,
+            website=website,
+        )
+
+
+def invoice_item_rows(
+    quantity: int, seed: int | None = None, taken_skus: Container[str] = frozenset()
+) -> Iterator["InvoiceItemRow"]:
+    """Yields synthetic computer equipment invoice items as ``InvoiceItemRow`` tuples.
+
+    The bulk path of ``generate_invoice_items``, for ``db.add_invoice_item_rows``: the same
+    seed yields the same items, without building models.
+
+    Args:
+        quantity: Number of invoice items to generate.
+        seed: Random seed. The same seed and ``taken_skus`` yield the same items.
+        taken_skus: Item SKUs to skip, such as ``db.get_invoice_item_skus()``.
+
+    Yields:
+        InvoiceItemRow: Schema-valid invoice items.
+
+    Raises:
+        ValueError: If fewer than ``quantity`` item SKUs are left.
+    """
+    rng = Random(seed)
+    random = rng.random
+    item_skus = unique_ids(rng, taken_skus)
+
+    for _ in range(quantity):
+        item_sku = next(item_skus, None)
+        if item_sku is None:
+            raise ValueError(f"No item SKUs left to generate {quantity} invoice items")
+
+        product, min_price, max_price = ITEM_PRODUCTS[int(random() * len(ITEM_PRODUCTS))]
+        item_quantity = 1 + int(random() * 100)
+        unit_price = from_cents(
+            min_price * 100 + int(random() * ((max_price - min_price) * 100 + 1))
+        )
+        brand = ITEM_BRANDS[int(random() * len(ITEM_BRANDS))]
+
+        yield (
+            item_sku,
+            f"{brand} {product} {item_sku[:2]}-{100 + int(random() * 900)}",
+            item_quantity,
+            unit_price,
+        )
+
+
+def generate_invoice_items(
+    quantity: int, seed: int | None = None, taken_skus: Container[str] = frozenset()
+) -> Iterator[InvoiceItem]:
+    """Yields synthetic computer equipment invoice items with unique SKUs.
+
+    Args:
+        quantity: Number of invoice items to generate.
+        seed: Random seed. The same seed and ``taken_skus`` yield the same items.
+        taken_skus: Item SKUs to skip, such as ``db.get_invoice_item_skus()``.
+
+    Yields:
+        InvoiceItem: Schema-valid invoice items.
+
+    Raises:
+        ValueError: If fewer than ``quantity`` item SKUs are left.
+    """
+    for item_sku, item_info, item_quantity, unit_price in invoice_item_rows(
+        quantity=quantity, seed=seed, taken_skus=taken_skus
+    ):
+        yield InvoiceItem.model_construct(
+            item_sku=item_sku,
+            item_info=item_info,
+            quantity=item_quantity,
+            unit_price=unit_price,
+            total_price=item_quantity * unit_price,
+        )
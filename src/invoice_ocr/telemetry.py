@@ -0,0 +1,200 @@
+"""
+Per-stage spans and metrics of the generation pipeline.
+
+Hot paths wrap each stage (database sampling, template render, WeasyPrint layout, PDF write,
+LLM call, ...) in ``stage``. A stage opens a logfire span and, when it ends, records:
+- ``stage_duration``: histogram of the stage duration in milliseconds, by stage
+- ``stage_items``: counter of the rows processed, by stage, for rows per second
+- ``bytes_written``: counter of the bytes written, by stage
+- ``llm_tokens``: counter of the tokens used by LLM calls, by model
+
+``record_pool_stats`` adds the connection pool wait time as ``db_pool_wait``.
+
+With ``TELEMETRY=false``, ``stage`` returns a shared no-op context manager, so instrumented
+code only pays for a function call. The profile mode, turned on by the ``--profile`` flag of
+the CLI, sums the stage durations in memory, independently of ``TELEMETRY``, and
+``format_profile`` prints them as a per-stage summary at the end of a run.
+"""
+
+import time
+from typing import Any
+
+import logfire
+
+from .settings import TELEMETRY
+
+stage_duration = logfire.metric_histogram(
+    "stage_duration", unit="ms", description="Duration of pipeline stages"
+)
+stage_items = logfire.metric_counter("stage_items", description="Rows processed by stages")
+bytes_written = logfire.metric_counter("bytes_written", unit="By", description="Bytes written")
+llm_tokens = logfire.metric_counter("llm_tokens", description="Tokens used by LLM calls")
+pool_wait = logfire.metric_counter(
+    "db_pool_wait", unit="ms", description="Time spent waiting for a pooled connection"
+)
+
+ProfileEntry = list[float]
+"""Calls, seconds, items and bytes of a stage, summed over a run"""
+
+_profile: dict[str, ProfileEntry] | None = None
+
+
+class NoopStage:
+    """Stage returned when telemetry and profiling are off. Every method does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "NoopStage":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+    async def __aenter__(self) -> "NoopStage":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        pass
+
+    def add(self, items: int = 0, nbytes: int = 0, tokens: int = 0) -> None:
+        pass
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+NOOP_STAGE = NoopStage()
+
+
+class Stage:
+    """Span and metrics of one run of a pipeline stage. See ``stage``."""
+
+    __slots__ = ("attributes", "items", "name", "nbytes", "span", "start", "tokens")
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+        self.items = self.nbytes = self.tokens = 0
+
+    def __enter__(self) -> "Stage":
+        if TELEMETRY:
+            # Debug level keeps per-row spans off the console, they are still exported
+            self.span = logfire.span(self.name, _level="debug", **self.attributes).__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        seconds = time.perf_counter() - self.start
+
+        if _profile is not None:
+            entry = _profile.setdefault(self.name, [0, 0.0, 0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += self.items
+            entry[3] += self.nbytes
+
+        if self.span is not None:
+            attributes = {"stage": self.name}
+            stage_duration.record(seconds * 1000, attributes)
+            if self.items:
+                stage_items.add(self.items, attributes)
+                self.span.set_attribute("items", self.items)
+            if self.nbytes:
+                bytes_written.add(self.nbytes, attributes)
+                self.span.set_attribute("bytes", self.nbytes)
+            if self.tokens:
+                llm_tokens.add(self.tokens, {"model": str(self.attributes.get("model"))})
+                self.span.set_attribute("tokens", self.tokens)
+            self.span.__exit__(*exc_info)
+
+    async def __aenter__(self) -> "Stage":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.__exit__(*exc_info)
+
+    def add(self, items: int = 0, nbytes: int = 0, tokens: int = 0) -> None:
+        """Counts rows processed, bytes written or LLM tokens used by the stage."""
+        self.items += items
+        self.nbytes += nbytes
+        self.tokens += tokens
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.span is not None:
+            self.span.set_attribute(key, value)
+
+
+def stage(name: str, **attributes: Any) -> Stage | NoopStage:
+    """Returns a context manager, sync or async, timing a pipeline stage.
+
+    Args:
+        name: Stage name, such as ``db.sample`` or ``render.layout``. Spans, metrics and the
+            profile are grouped by it, so it must not contain per-row values.
+        attributes: Span attributes, such as the table or the model.
+
+    Returns:
+        Stage | NoopStage: The stage, or the shared no-op stage when telemetry and profiling
+            are both off.
+    """
+    if not TELEMETRY and _profile is None:
+        return NOOP_STAGE
+    return Stage(name, attributes)
+
+
+def record_pool_stats(stats: dict[str, float]) -> None:
+    """Records the connection wait time of the pool statistics, see ``db.pool_stats``."""
+    wait_ms = stats.get("requests_wait_ms", 0)
+    if TELEMETRY and wait_ms:
+        pool_wait.add(wait_ms)
+    if _profile is not None and stats:
+        _profile["db.pool_wait"] = [stats.get("requests_num", 0), wait_ms / 1000, 0, 0]
+
+
+def enable_profile(enabled: bool = True) -> None:
+    """Starts summing stage durations in this process, discarding any previous profile.
+
+    Also the initializer of worker processes, so they profile like their parent.
+    """
+    global _profile  # noqa: PLW0603
+    _profile = {} if enabled else None
+
+
+def is_profiling() -> bool:
+    return _profile is not None
+
+
+def take_profile() -> dict[str, ProfileEntry] | None:
+    """Returns the profile of this process and starts a new one, or None if it is off.
+
+    Worker processes send it back with their results, see ``merge_profile``.
+    """
+    global _profile
+    if _profile is None:
+        return None
+    profile, _profile = _profile, {}
+    return profile
+
+
+def merge_profile(profile: dict[str, ProfileEntry] | None) -> None:
+    """Adds the profile of a worker process to the profile of this process."""
+    if _profile is None or not profile:
+        return
+    for name, worker_entry in profile.items():
+        entry = _profile.setdefault(name, [0, 0.0, 0, 0])
+        for index, value in enumerate(worker_entry):
+            entry[index] += value
+
+
+def format_profile() -> str:
+    """Returns the per-stage timing summary of the profile, slowest stages first."""
+    lines = [f"{'Stage':<24} {'Calls':>8} {'Total s':>10} {'Avg ms':>10} {'Rows/s':>12} {'MB':>10}"]
+    entries = sorted((_profile or {}).items(), key=lambda item: item[1][1], reverse=True)
+    for name, (calls, seconds, items, nbytes) in entries:
+        average_ms = seconds * 1000 / calls if calls else 0
+        rows_per_second = f"{items / seconds:12.1f}" if items and seconds else f"{'':>12}"
+        lines.append(
+            f"{name:<24} {calls:>8.0f} {seconds:>10.3f} {average_ms:>10.3f} "
+            f"{rows_per_second} {nbytes / 1e6:>10.2f}"
+        )
+    return "\n".join(lines)
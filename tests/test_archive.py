@@ -0,0 +1,175 @@
+import hashlib
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+from invoice_ocr import generate as gen
+from invoice_ocr.archive import MANIFEST_NAME, InvoiceWriter
+from invoice_ocr.schema import Invoice
+from invoice_ocr.synthetic import generate_companies, generate_invoice_items
+
+SUPPLIER, CUSTOMER = generate_companies(2, seed=1)
+
+INVOICES = [
+    Invoice(
+        invoice_number=f"TEST-{number}",
+        supplier=SUPPLIER,
+        customer=CUSTOMER,
+        line_items=list(generate_invoice_items(2, seed=number)),
+    )
+    for number in range(5)
+]
+
+
+def fake_pdf(invoice: Invoice) -> bytes:
+    return f"%PDF-1.7 {invoice.invoice_number}".encode()
+
+
+def read_manifest(output_dir):
+    return [json.loads(line) for line in (output_dir / MANIFEST_NAME).read_text().splitlines()]
+
+
+def test_write_directory(tmp_path):
+    with InvoiceWriter(output_dir=tmp_path / "out") as writer:
+        locations = [writer.write(invoice, fake_pdf(invoice)) for invoice in INVOICES[:2]]
+
+    assert locations == [str(tmp_path / "out" / "TEST-0.pdf"), str(tmp_path / "out" / "TEST-1.pdf")]
+    assert (tmp_path / "out" / "TEST-1.pdf").read_bytes() == fake_pdf(INVOICES[1])
+
+    manifest = read_manifest(tmp_path / "out")
+    assert [entry["archive"] for entry in manifest] == [None, None]
+    assert manifest[0]["sha256"] == hashlib.sha256(fake_pdf(INVOICES[0])).hexdigest()
+    assert Invoice.model_validate(manifest[0]["invoice"]) == INVOICES[0]
+
+
+def test_write_sharded_tar(tmp_path):
+    with InvoiceWriter(output_dir=tmp_path, archive_format="tar", shard_size=2) as writer:
+        for invoice in INVOICES:
+            writer.write(invoice, fake_pdf(invoice))
+
+    shards = sorted(path.name for path in tmp_path.glob("*.tar"))
+    assert shards == ["invoices-00000.tar", "invoices-00001.tar", "invoices-00002.tar"]
+
+    with tarfile.open(tmp_path / "invoices-00001.tar") as tar:
+        assert tar.getnames() == ["TEST-2.pdf", "TEST-3.pdf"]
+        assert tar.extractfile("TEST-3.pdf").read() == fake_pdf(INVOICES[3])
+
+    manifest = read_manifest(tmp_path)
+    assert [(entry["archive"], entry["file"]) for entry in manifest][-1] == (
+        "invoices-00002.tar",
+        "TEST-4.pdf",
+    )
+
+
+def test_write_zip(tmp_path):
+    with InvoiceWriter(output_dir=tmp_path, archive_format="zip") as writer:
+        location = writer.write(INVOICES[0], fake_pdf(INVOICES[0]))
+        writer.write(INVOICES[1], fake_pdf(INVOICES[1]))
+
+    assert location == f"{tmp_path / 'invoices.zip'}:TEST-0.pdf"
+    with zipfile.ZipFile(tmp_path / "invoices.zip") as archive:
+        assert archive.namelist() == ["TEST-0.pdf", "TEST-1.pdf"]
+        assert archive.read("TEST-1.pdf") == fake_pdf(INVOICES[1])
+
+
+def test_writer_rejects_shards_without_archive(tmp_path):
+    with pytest.raises(ValueError, match="archive format"):
+        InvoiceWriter(output_dir=tmp_path, shard_size=10)
+    with pytest.raises(ValueError, match="Unknown"):
+        InvoiceWriter(output_dir=tmp_path, archive_format="rar")
+
+
+def test_refuse_previous_output(tmp_path):
+    with InvoiceWriter(output_dir=tmp_path, archive_format="zip") as writer:
+        writer.write(INVOICES[0], fake_pdf(INVOICES[0]))
+
+    with pytest.raises(FileExistsError, match="earlier run"):
+        InvoiceWriter(output_dir=tmp_path, archive_format="zip")
+    assert len(read_manifest(tmp_path)) == 1
+
+    (tmp_path / MANIFEST_NAME).unlink()
+    with pytest.raises(FileExistsError, match=r"invoices\.zip"):
+        InvoiceWriter(output_dir=tmp_path)
+
+
+def test_write_pdf_invoices(tmp_path, monkeypatch):
+    monkeypatch.setattr(gen, "create_pdf_invoice", fake_pdf)
+
+    with InvoiceWriter(output_dir=tmp_path, archive_format="tar", shard_size=3) as writer:
+        locations = list(gen.write_pdf_invoices(invoices=iter(INVOICES), writer=writer))
+
+    assert locations[3] == f"{tmp_path / 'invoices-00001.tar'}:TEST-3.pdf"
+    assert [entry["file"] for entry in read_manifest(tmp_path)] == [
+        f"TEST-{number}.pdf" for number in range(5)
+    ]
+
+
+@pytest.fixture
+def sample_db(monkeypatch):
+    """Replaces the database calls of ``sample_invoices``, returns the stored batch sizes."""
+    numbers = iter(range(100, 200))
+    stored = []
+
+    def add_invoices(invoices):
+        stored.append(len(invoices))
+        # The database skips the second invoice of every batch
+        return [None if index == 1 else index for index in range(len(invoices))]
+
+    monkeypatch.setattr(gen.db, "get_random_companies", lambda limit, seed: [SUPPLIER, CUSTOMER])
+    monkeypatch.setattr(
+        gen.db, "get_random_invoice_items", lambda limit, seed: INVOICES[0].line_items
+    )
+    monkeypatch.setattr(
+        gen.db, "reserve_invoice_numbers", lambda count: [next(numbers) for _ in range(count)]
+    )
+    monkeypatch.setattr(
+        gen.db,
+        "get_random_companies_batch",
+        lambda limits, seed: [[SUPPLIER, CUSTOMER]] * len(limits),
+    )
+    monkeypatch.setattr(
+        gen.db,
+        "get_random_invoice_items_batch",
+        lambda limits, seed: [INVOICES[0].line_items] * len(limits),
+    )
+    monkeypatch.setattr(gen.db, "add_invoices", add_invoices)
+    return stored
+
+
+def test_sample_invoices_in_batches(sample_db):
+    invoices = gen.sample_invoices(count=5, seed=1, batch_size=2)
+    assert next(invoices).invoice_number == "INV-100"
+    assert sample_db == [2]
+
+    assert [invoice.invoice_number for invoice in invoices] == ["INV-102", "INV-104"]
+    assert sample_db == [2, 2, 1]
+
+
+def test_sample_invoices_stops_on_errors(sample_db, monkeypatch):
+    monkeypatch.setattr(gen.db, "get_random_companies", lambda limit, seed: [SUPPLIER])
+    assert list(gen.sample_invoices(count=2)) == []
+
+    monkeypatch.setattr(gen.db, "get_random_companies", lambda limit, seed: [SUPPLIER, CUSTOMER])
+    monkeypatch.setattr(gen.db, "get_random_companies_batch", lambda limits, seed: [])
+    assert list(gen.sample_invoices(count=2)) == []
+
+    monkeypatch.setattr(gen.db, "reserve_invoice_numbers", lambda count: [])
+    assert list(gen.sample_invoices(count=2)) == []
+    assert sample_db == []
+
+
+def test_write_labels(tmp_path):
+    with InvoiceWriter(output_dir=tmp_path, archive_format="tar", label_format="jsonl") as writer:
+        for invoice in INVOICES[:2]:
+            writer.write(invoice, fake_pdf(invoice))
+
+    rows = [json.loads(line) for line in (tmp_path / "line_items.jsonl").read_text().splitlines()]
+    assert [(row["invoice_number"], row["position"]) for row in rows] == [
+        ("TEST-0", 1),
+        ("TEST-0", 2),
+        ("TEST-1", 1),
+        ("TEST-1", 2),
+    ]
+    assert rows[0]["archive"] == "invoices.tar"
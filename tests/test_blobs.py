@@ -0,0 +1,69 @@
+import pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from invoice_ocr.blobs import GCSBlobStore, LocalBlobStore, PostgresBlobStore, blob_key
+from invoice_ocr.db import get_pool
+
+CONTENTS = [b"RIFF first preview", b"RIFF second preview", b"RIFF first preview"]
+
+
+class FakeBlob:
+    def __init__(self, objects: dict[str, bytes], name: str):
+        self.objects = objects
+        self.name = name
+
+    def upload_from_string(self, data: bytes, if_generation_match: int | None = None) -> None:
+        if if_generation_match == 0 and self.name in self.objects:
+            raise PreconditionFailed("exists")
+        self.objects[self.name] = data
+
+    def download_as_bytes(self) -> bytes:
+        if self.name not in self.objects:
+            raise NotFound("missing")
+        return self.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self.objects, name)
+
+
+class FakeClient:
+    """In-memory stand-in for ``google.cloud.storage.Client``."""
+
+    def __init__(self):
+        self.buckets: dict[str, FakeBucket] = {}
+
+    def bucket(self, name: str) -> FakeBucket:
+        return self.buckets.setdefault(name, FakeBucket())
+
+
+def check_store(store) -> list[str]:
+    keys = store.put_many(CONTENTS)
+    assert keys == [blob_key(content) for content in CONTENTS]
+    assert store.put(CONTENTS[1]) == keys[1]
+    assert [store.get(key) for key in keys] == CONTENTS
+    assert store.get(blob_key(b"unknown")) is None
+    return keys
+
+
+def test_local_blob_store(tmp_path):
+    store = LocalBlobStore(root=tmp_path)
+    keys = check_store(store)
+    assert sorted(path.name for path in tmp_path.rglob("*") if path.is_file()) == sorted(keys[:2])
+
+
+def test_gcs_blob_store():
+    client = FakeClient()
+    keys = check_store(GCSBlobStore(bucket="invoices", prefix="blobs/", client=client))
+    assert sorted(client.buckets["invoices"].objects) == sorted(f"blobs/{key}" for key in keys[:2])
+
+
+@pytest.mark.db
+def test_postgres_blob_store():
+    keys = check_store(PostgresBlobStore())
+    with get_pool().connection() as conn:
+        conn.execute("DELETE FROM blobs WHERE sha256 = ANY(%s)", (keys,))
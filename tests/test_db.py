@@ -1,17 +1,34 @@
 import pytest
 
 from invoice_ocr.db import (
-    POSTGRES_POOL,
+    SEARCH_LIMIT,
+    add_companies,
     add_company,
+    add_invoice,
     add_invoice_item,
+    add_invoice_items,
+    add_invoices,
     find_company,
     find_invoice_item,
     get_company,
+    get_company_ids,
+    get_invoice,
     get_invoice_item,
+    get_invoice_item_skus,
+    get_invoice_totals,
+    get_invoices,
+    get_pool,
+    get_pool_stats,
     get_random_companies,
+    get_random_companies_batch,
     get_random_invoice_items,
+    get_random_invoice_items_batch,
+    purge_orphan_addresses,
+    reserve_invoice_numbers,
 )
-from invoice_ocr.schema import Address, Company, InvoiceItem
+from invoice_ocr.money import to_cents
+from invoice_ocr.schema import Address, Company, Invoice, InvoiceItem
+from invoice_ocr.settings import POSTGRES_POOL_MAX_SIZE, POSTGRES_POOL_MIN_SIZE
 
 COMPANY = Company(
     company_id="TEST1",
@@ -37,6 +54,30 @@ INVOICE_ITEM = InvoiceItem(
     unit_price=10.0,
 )
 
+BULK_COMPANIES = [
+    COMPANY.model_copy(update={"company_id": "TEST2"}),
+    COMPANY.model_copy(update={"company_id": "TEST3", "address_shipping": COMPANY.address_billing}),
+]
+
+RETRIED_COMPANY = COMPANY.model_copy(update={"company_id": "TEST4"})
+
+BULK_INVOICE_ITEMS = [
+    INVOICE_ITEM.model_copy(update={"item_sku": "ABCD2"}),
+    INVOICE_ITEM.model_copy(update={"item_sku": "ABCD3"}),
+]
+
+INVOICE = Invoice(
+    invoice_number="TEST-1",
+    supplier=COMPANY,
+    customer=BULK_COMPANIES[1],
+    line_items=[BULK_INVOICE_ITEMS[1], INVOICE_ITEM.model_copy(update={"quantity": 3})],
+)
+
+BULK_INVOICES = [
+    INVOICE.model_copy(update={"invoice_number": "TEST-2", "line_items": [INVOICE_ITEM]}),
+    INVOICE.model_copy(update={"invoice_number": "TEST-3", "customer": BULK_COMPANIES[0]}),
+]
+
 
 @pytest.mark.db
 def test_add_company():
@@ -45,6 +86,69 @@ def test_add_company():
     assert isinstance(company_id, int)
 
 
+@pytest.mark.db
+def test_add_company_duplicate():
+    with get_pool().connection() as conn:
+        addresses = conn.execute("SELECT count(*) FROM postal_addresses").fetchone()[0]
+
+    company_id = add_company(COMPANY)
+    assert company_id is None
+
+    with get_pool().connection() as conn:
+        assert conn.execute("SELECT count(*) FROM postal_addresses").fetchone()[0] == addresses
+
+
+@pytest.mark.db
+def test_purge_orphan_addresses():
+    with get_pool().connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO postal_addresses (address_line1, address_line2, city, province, postal_code, country)
+            VALUES (%(address_line1)s, %(address_line2)s, %(city)s, %(province)s, %(postal_code)s, %(country)s)
+            """,
+            COMPANY.address_billing.model_dump(),
+        )
+
+    assert purge_orphan_addresses(dry_run=True) >= 1
+    assert purge_orphan_addresses(batch_size=1) >= 1
+    assert purge_orphan_addresses(dry_run=True) == 0
+    assert get_company(COMPANY.company_id) is not None
+
+
+@pytest.mark.db
+def test_add_companies():
+    companies = [*BULK_COMPANIES, COMPANY, BULK_COMPANIES[0]]
+    company_ids = add_companies(companies)
+    assert len(company_ids) == len(companies)
+    assert all(isinstance(company_id, int) for company_id in company_ids[:2])
+    assert company_ids[2:] == [None, None]
+
+    company = get_company(BULK_COMPANIES[1].company_id)
+    assert company is not None
+    assert company.address_billing == BULK_COMPANIES[1].address_billing
+    assert company.address_shipping == BULK_COMPANIES[1].address_shipping
+
+
+@pytest.mark.db
+def test_add_companies_retries_failed_batch():
+    # Too long for companies.company_name, so the first batch fails
+    failed = RETRIED_COMPANY.model_copy(update={"company_name": "x" * 256})
+    company_ids = add_companies([failed, RETRIED_COMPANY], batch_size=1)
+    assert company_ids[0] is None
+    assert isinstance(company_ids[1], int)
+
+
+@pytest.mark.db
+def test_get_pool_stats():
+    assert get_company(COMPANY.company_id) is not None
+
+    stats = get_pool_stats()
+    assert stats["pool_min"] == POSTGRES_POOL_MIN_SIZE
+    assert stats["pool_max"] == POSTGRES_POOL_MAX_SIZE
+    assert stats["requests_num"] > 0
+    assert stats["requests_wait_ms_avg"] >= 0
+
+
 @pytest.mark.db
 def test_get_company():
     company = get_company(COMPANY.company_id)
@@ -59,6 +163,13 @@ def test_get_company():
     assert company.address_shipping == COMPANY.address_shipping
 
 
+@pytest.mark.db
+def test_get_company_ids():
+    company_ids = get_company_ids()
+    assert COMPANY.company_id in company_ids
+    assert all(isinstance(company_id, str) for company_id in company_ids)
+
+
 @pytest.mark.db
 def test_get_random_companies():
     limit = 1
@@ -69,6 +180,17 @@ def test_get_random_companies():
     assert isinstance(companies[0], Company)
 
 
+@pytest.mark.db
+def test_get_random_companies_batch():
+    limits = [1, 1, 1]
+    samples = get_random_companies_batch(limits=limits, seed=42)
+    assert len(samples) == len(limits)
+    assert all(len(sample) == 1 for sample in samples)
+    assert isinstance(samples[0][0], Company)
+    assert samples == get_random_companies_batch(limits=limits, seed=42)
+    assert samples[0] == get_random_companies(limit=1, seed=42)
+
+
 @pytest.mark.db
 def test_find_company():
     companies = find_company(COMPANY.company_id)
@@ -78,6 +200,21 @@ def test_find_company():
     assert isinstance(companies[0], Company)
     assert companies[0].company_id == COMPANY.company_id
     assert companies[0].company_name == COMPANY.company_name
+    assert companies[0].address_billing == COMPANY.address_billing
+    assert companies[0].address_shipping == COMPANY.address_shipping
+
+
+@pytest.mark.db
+def test_find_company_paging():
+    companies = find_company("test")
+    assert len(companies) > 1
+    assert find_company("test", limit=1) == companies[:1]
+    assert find_company("test", limit=1, offset=1) == companies[1:2]
+
+
+@pytest.mark.db
+def test_find_company_default_limit():
+    assert len(find_company("")) == min(SEARCH_LIMIT, len(find_company("", limit=None)))
 
 
 @pytest.mark.db
@@ -98,6 +235,11 @@ def test_get_invoice_item():
     assert invoice_item.unit_price == INVOICE_ITEM.unit_price
 
 
+@pytest.mark.db
+def test_get_invoice_item_skus():
+    assert INVOICE_ITEM.item_sku in get_invoice_item_skus()
+
+
 @pytest.mark.db
 def test_get_random_invoice_items():
     limit = 1
@@ -108,6 +250,16 @@ def test_get_random_invoice_items():
     assert isinstance(invoice_items[0], InvoiceItem)
 
 
+@pytest.mark.db
+def test_get_random_invoice_items_batch():
+    limits = [1, 1, 1]
+    samples = get_random_invoice_items_batch(limits=limits, seed=42)
+    assert len(samples) == len(limits)
+    assert all(len(sample) == 1 for sample in samples)
+    assert isinstance(samples[0][0], InvoiceItem)
+    assert samples == get_random_invoice_items_batch(limits=limits, seed=42)
+
+
 @pytest.mark.db
 def test_find_invoice_item():
     invoice_items = find_invoice_item(INVOICE_ITEM.item_sku)
@@ -129,14 +281,107 @@ def test_find_invoice_item():
     assert invoice_items[0].unit_price == INVOICE_ITEM.unit_price
 
 
+@pytest.mark.db
+def test_add_invoice_items():
+    invoice_items = [*BULK_INVOICE_ITEMS, INVOICE_ITEM, BULK_INVOICE_ITEMS[0]]
+    invoice_item_ids = add_invoice_items(invoice_items)
+    assert len(invoice_item_ids) == len(invoice_items)
+    assert all(isinstance(invoice_item_id, int) for invoice_item_id in invoice_item_ids[:2])
+    assert invoice_item_ids[2:] == [None, None]
+
+
+@pytest.mark.db
+def test_add_invoice():
+    assert isinstance(add_invoice(INVOICE), int)
+    assert add_invoice(INVOICE) is None
+
+
+@pytest.mark.db
+def test_add_invoice_missing_references():
+    missing_company = INVOICE.model_copy(
+        update={
+            "invoice_number": "TEST-4",
+            "customer": COMPANY.model_copy(update={"company_id": "MISS1"}),
+        }
+    )
+    missing_item = INVOICE.model_copy(
+        update={
+            "invoice_number": "TEST-5",
+            "line_items": [INVOICE_ITEM.model_copy(update={"item_sku": "MISS1"})],
+        }
+    )
+    assert add_invoice(missing_company) is None
+    assert add_invoice(missing_item) is None
+    assert get_invoice("TEST-5") is None
+
+
+@pytest.mark.db
+def test_get_invoice():
+    invoice = get_invoice(INVOICE.invoice_number)
+    assert isinstance(invoice, Invoice)
+    assert invoice.supplier == INVOICE.supplier
+    assert invoice.customer == INVOICE.customer
+    assert invoice.line_items == INVOICE.line_items
+    assert invoice.issue_date == INVOICE.issue_date
+    assert invoice.total == INVOICE.total
+    assert get_invoice("MISSING") is None
+
+
+@pytest.mark.db
+def test_add_invoices():
+    invoices = [*BULK_INVOICES, INVOICE]
+    invoice_ids = add_invoices(invoices, batch_size=2)
+    assert len(invoice_ids) == len(invoices)
+    assert all(isinstance(invoice_id, int) for invoice_id in invoice_ids[:2])
+    assert invoice_ids[2] is None
+
+    invoices = get_invoices([invoice.invoice_number for invoice in BULK_INVOICES])
+    assert sorted(invoice.invoice_number for invoice in invoices) == ["TEST-2", "TEST-3"]
+
+
+@pytest.mark.db
+def test_get_invoice_totals():
+    pytest.importorskip("numpy")
+
+    # model_copy does not recompute the totals of BULK_INVOICES
+    invoices = [Invoice.model_validate(dict(invoice)) for invoice in [INVOICE, *BULK_INVOICES]]
+    totals = get_invoice_totals([*(invoice.invoice_number for invoice in invoices), "MISSING"])
+
+    assert totals == {
+        invoice.invoice_number: (
+            to_cents(invoice.subtotal),
+            to_cents(invoice.tax_total),
+            to_cents(invoice.total),
+        )
+        for invoice in invoices
+    }
+    assert get_invoice_totals(["MISSING"]) == {}
+
+
+@pytest.mark.db
+def test_reserve_invoice_numbers():
+    first = reserve_invoice_numbers(count=3)
+    second = reserve_invoice_numbers(count=2)
+    assert len(first) == 3  # noqa: PLR2004
+    assert first == sorted(first)
+    assert min(second) > max(first)
+
+
 @pytest.fixture(scope="session", autouse=True)
 def cleanup_database():
     yield
     with (
-        POSTGRES_POOL.connection() as conn,
+        get_pool().connection() as conn,
         conn.cursor() as cur,
     ):
-        cur.execute("DELETE FROM companies WHERE company_id = %s", (COMPANY.company_id,))
+        cur.execute(
+            "DELETE FROM invoice_records WHERE invoice_number = ANY(%s)",
+            ([invoice.invoice_number for invoice in [INVOICE, *BULK_INVOICES]],),
+        )
+        cur.execute(
+            "DELETE FROM companies WHERE company_id = ANY(%s)",
+            ([company.company_id for company in [COMPANY, *BULK_COMPANIES, RETRIED_COMPANY]],),
+        )
         cur.execute(
             "DELETE FROM postal_addresses WHERE address_line1 = %s AND city = %s AND postal_code = %s",
             (
@@ -154,4 +399,7 @@ def cleanup_database():
                     COMPANY.address_shipping.postal_code,
                 ),
             )
-        cur.execute("DELETE FROM invoice_items WHERE item_sku = %s", (INVOICE_ITEM.item_sku,))
+        cur.execute(
+            "DELETE FROM invoice_items WHERE item_sku = ANY(%s)",
+            ([invoice_item.item_sku for invoice_item in [INVOICE_ITEM, *BULK_INVOICE_ITEMS]],),
+        )
@@ -0,0 +1,290 @@
+import asyncio
+
+import pytest
+
+from invoice_ocr.db import get_pool
+from invoice_ocr.db_async import (
+    add_blobs,
+    add_companies,
+    add_company,
+    add_invoice,
+    add_invoice_extraction_failures,
+    add_invoice_extractions,
+    add_invoice_files,
+    add_invoice_item,
+    add_invoice_items,
+    close_pool,
+    find_company,
+    find_invoice_item,
+    get_blob,
+    get_company,
+    get_invoice_extraction,
+    get_invoice_files_without_extraction,
+    get_invoice_files_without_webp,
+    get_invoice_item,
+    get_invoice_totals,
+    get_invoice_webp_sha256,
+    get_random_companies,
+    get_random_companies_batch,
+    get_random_invoice_items,
+    reserve_invoice_numbers,
+    set_invoice_webps,
+)
+from invoice_ocr.db_async import get_pool as get_async_pool
+from invoice_ocr.money import to_cents
+from invoice_ocr.schema import Address, Company, Invoice, InvoiceFile, InvoiceItem
+
+COMPANY = Company(
+    company_id="ASYN1",
+    company_name="Async Company",
+    phone_number="+1-555-123-4567",
+    email="contact@asynccompany.com",
+    website="https://asynccompany.com",
+    address_billing=Address(
+        address_line1="790 Elm St",
+        address_line2="Apt 5C",
+        city="Toronto",
+        province="ON",
+        postal_code="M5A 1A1",
+        country="Canada",
+    ),
+    address_shipping=Address(
+        address_line1="791 Elm St",
+        address_line2="",
+        city="Toronto",
+        province="ON",
+        postal_code="M5A 1A2",
+        country="Canada",
+    ),
+)
+
+BULK_COMPANIES = [COMPANY.model_copy(update={"company_id": "ASYN2"})]
+
+RETRIED_COMPANY = COMPANY.model_copy(update={"company_id": "ASYN3"})
+
+INVOICE_ITEM = InvoiceItem(
+    item_sku="ASYN1",
+    item_info="Async Widget Description",
+    quantity=10,
+    unit_price=10.0,
+)
+
+BULK_INVOICE_ITEMS = [INVOICE_ITEM.model_copy(update={"item_sku": "ASYN2"})]
+
+INVOICE = Invoice(
+    invoice_number="ASYN-1",
+    supplier=COMPANY,
+    customer=BULK_COMPANIES[0],
+    line_items=[INVOICE_ITEM],
+)
+
+INVOICE_FILES = [
+    InvoiceFile(
+        file_origin=f"async/{number}.pdf", file_mime_type="application/pdf", file_sha256=sha256
+    )
+    for number, sha256 in enumerate(["a" * 64, "b" * 64])
+]
+
+WEBP_SHA256 = "c" * 64
+
+CONCURRENT_LOOKUPS = 50
+
+
+def run(coroutine):
+    """Runs a coroutine in a new event loop and closes the async pool afterwards."""
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_pool()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.db
+def test_add_company():
+    company_id = run(add_company(COMPANY))
+    assert company_id is not None
+    assert isinstance(company_id, int)
+
+    assert run(add_company(COMPANY)) is None
+
+
+@pytest.mark.db
+def test_add_companies():
+    company_ids = run(add_companies([*BULK_COMPANIES, COMPANY]))
+    assert isinstance(company_ids[0], int)
+    assert company_ids[1] is None
+
+
+@pytest.mark.db
+def test_add_companies_retries_failed_batch():
+    # Too long for companies.company_name, so the first batch fails
+    failed = RETRIED_COMPANY.model_copy(update={"company_name": "x" * 256})
+    company_ids = run(add_companies([failed, RETRIED_COMPANY], batch_size=1))
+    assert company_ids[0] is None
+    assert isinstance(company_ids[1], int)
+
+
+@pytest.mark.db
+def test_get_company():
+    company = run(get_company(COMPANY.company_id))
+    assert company == COMPANY
+
+
+@pytest.mark.db
+def test_get_company_concurrent():
+    async def lookups():
+        return await asyncio.gather(
+            *(get_company(COMPANY.company_id) for _ in range(CONCURRENT_LOOKUPS))
+        )
+
+    companies = run(lookups())
+    assert len(companies) == CONCURRENT_LOOKUPS
+    assert all(company == COMPANY for company in companies)
+
+
+@pytest.mark.db
+def test_get_pool_concurrent_first_use():
+    async def first_calls():
+        return await asyncio.gather(*(get_async_pool() for _ in range(CONCURRENT_LOOKUPS)))
+
+    pools = run(first_calls())
+    assert all(pool is pools[0] for pool in pools)
+
+
+@pytest.mark.db
+def test_get_random_companies():
+    companies = run(get_random_companies(limit=1, seed=42))
+    assert companies is not None
+    assert len(companies) == 1
+    assert isinstance(companies[0], Company)
+
+    samples = run(get_random_companies_batch(limits=[1, 1], seed=42))
+    assert samples[0] == companies
+
+
+@pytest.mark.db
+def test_find_company():
+    companies = run(find_company(COMPANY.company_id))
+    assert companies == [COMPANY]
+
+
+@pytest.mark.db
+def test_add_invoice_item():
+    invoice_item_id = run(add_invoice_item(INVOICE_ITEM))
+    assert invoice_item_id is not None
+    assert isinstance(invoice_item_id, int)
+
+    invoice_item_ids = run(add_invoice_items([*BULK_INVOICE_ITEMS, INVOICE_ITEM]))
+    assert isinstance(invoice_item_ids[0], int)
+    assert invoice_item_ids[1] is None
+
+
+@pytest.mark.db
+def test_get_invoice_item():
+    invoice_item = run(get_invoice_item(INVOICE_ITEM.item_sku))
+    assert invoice_item == INVOICE_ITEM
+
+
+@pytest.mark.db
+def test_get_random_invoice_items():
+    invoice_items = run(get_random_invoice_items(limit=1))
+    assert len(invoice_items) == 1
+    assert isinstance(invoice_items[0], InvoiceItem)
+
+
+@pytest.mark.db
+def test_find_invoice_item():
+    invoice_items = run(find_invoice_item(INVOICE_ITEM.item_sku))
+    assert invoice_items == [INVOICE_ITEM]
+
+
+@pytest.mark.db
+def test_reserve_invoice_numbers():
+    first = run(reserve_invoice_numbers(count=3))
+    second = run(reserve_invoice_numbers(count=2))
+    assert len(first) == 3  # noqa: PLR2004
+    assert min(second) > max(first)
+
+
+@pytest.mark.db
+def test_get_invoice_totals():
+    pytest.importorskip("numpy")
+
+    assert isinstance(run(add_invoice(INVOICE)), int)
+    assert run(get_invoice_totals([INVOICE.invoice_number, "MISSING"])) == {
+        INVOICE.invoice_number: (
+            to_cents(INVOICE.subtotal),
+            to_cents(INVOICE.tax_total),
+            to_cents(INVOICE.total),
+        )
+    }
+
+
+@pytest.mark.db
+def test_invoice_files():
+    file_ids = run(add_invoice_files([*INVOICE_FILES, INVOICE_FILES[0]]))
+    assert all(isinstance(file_id, int) for file_id in file_ids[:2])
+    assert file_ids[2] is None
+
+    after_id = min(file_ids[:2]) - 1
+    pending = run(get_invoice_files_without_webp(after_id=after_id))
+    assert [row["id"] for row in pending] == file_ids[:2]
+    assert run(set_invoice_webps({file_ids[0]: WEBP_SHA256})) == 1
+    assert run(get_invoice_webp_sha256(file_ids[0])) == WEBP_SHA256
+    assert [row["id"] for row in run(get_invoice_files_without_webp(after_id=after_id))] == [
+        file_ids[1]
+    ]
+
+    pending = run(get_invoice_files_without_extraction(after_id=after_id))
+    assert [row["file_sha256"] for row in pending] == [file.file_sha256 for file in INVOICE_FILES]
+    assert run(add_invoice_extractions({INVOICE_FILES[0].file_sha256: INVOICE}, model="test")) == 1
+    assert run(get_invoice_extraction(INVOICE_FILES[0].file_sha256)) == INVOICE
+    assert run(get_invoice_extraction(INVOICE_FILES[1].file_sha256)) is None
+
+    failures = {INVOICE_FILES[1].file_sha256: ("needs_ocr", None)}
+    assert run(add_invoice_extraction_failures(failures, model="test")) == 1
+    assert run(get_invoice_extraction(INVOICE_FILES[1].file_sha256)) is None
+    assert run(get_invoice_files_without_extraction(after_id=after_id)) == []
+
+
+@pytest.mark.db
+def test_blobs():
+    run(add_blobs({WEBP_SHA256: b"webp"}))
+    assert run(get_blob(WEBP_SHA256)) == b"webp"
+    assert run(get_blob("d" * 64)) is None
+
+
+@pytest.fixture(scope="module", autouse=True)
+def cleanup_database():
+    yield
+    with (
+        get_pool().connection() as conn,
+        conn.cursor() as cur,
+    ):
+        cur.execute(
+            "DELETE FROM invoice_records WHERE invoice_number = %s", (INVOICE.invoice_number,)
+        )
+        cur.execute(
+            "DELETE FROM invoices WHERE file_sha256 = ANY(%s)",
+            ([file.file_sha256 for file in INVOICE_FILES],),
+        )
+        cur.execute("DELETE FROM blobs WHERE sha256 = %s", (WEBP_SHA256,))
+        cur.execute(
+            """
+            WITH deleted AS (
+                DELETE FROM companies WHERE company_id = ANY(%s)
+                RETURNING address_billing, address_shipping
+            )
+            DELETE FROM postal_addresses
+            WHERE id IN (SELECT address_billing FROM deleted)
+               OR id IN (SELECT address_shipping FROM deleted)
+            """,
+            ([company.company_id for company in [COMPANY, *BULK_COMPANIES, RETRIED_COMPANY]],),
+        )
+        cur.execute(
+            "DELETE FROM invoice_items WHERE item_sku = ANY(%s)",
+            ([invoice_item.item_sku for invoice_item in [INVOICE_ITEM, *BULK_INVOICE_ITEMS]],),
+        )
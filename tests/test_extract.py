@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from invoice_ocr.db import get_invoice_extraction, get_pool
+from invoice_ocr.extract import extract_invoices, extract_text, stub_model
+from invoice_ocr.ingest import file_sha256, ingest_files
+
+
+def text_pdf(text: str) -> bytes:
+    """Builds a one page PDF with a text layer. pdfium rebuilds the missing xref table."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    for number, obj in enumerate(objects, start=1):
+        pdf += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    return pdf + b"trailer\n<< /Root 1 0 R >>\n%%EOF\n"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    (tmp_path / "INV-1001.pdf").write_bytes(text_pdf("Invoice #: INV-1001"))
+    (tmp_path / "INV-1002.pdf").write_bytes(text_pdf("Invoice #: INV-1002"))
+    (tmp_path / "scan.png").write_bytes(b"\x89PNG no text layer")
+    return tmp_path
+
+
+def test_extract_text(archive):
+    assert extract_text(archive / "INV-1001.pdf", "application/pdf") == "Invoice #: INV-1001"
+    assert extract_text(archive / "scan.png", "image/png") == ""
+
+
+@pytest.mark.db
+def test_extract_invoices(archive):
+    try:
+        ingest_files(archive)
+        stored, failed = asyncio.run(
+            extract_invoices(batch_size=1, concurrency=2, model=stub_model())
+        )
+        assert stored >= 2  # noqa: PLR2004
+        assert failed >= 1
+
+        for invoice_number in ("INV-1001", "INV-1002"):
+            invoice = get_invoice_extraction(file_sha256(archive / f"{invoice_number}.pdf"))
+            assert invoice.invoice_number == invoice_number
+
+        assert get_invoice_extraction(file_sha256(archive / "scan.png")) is None
+
+        # The scan without a text layer is recorded as needing OCR, so reruns skip it
+        assert asyncio.run(extract_invoices(model=stub_model())) == (0, 0)
+    finally:
+        with get_pool().connection() as conn:
+            conn.execute(
+                "DELETE FROM invoices WHERE file_origin LIKE %s", (f"{archive.resolve()}%",)
+            )
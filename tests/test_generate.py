@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from invoice_ocr import generate as gen
+from invoice_ocr import synthetic
+from invoice_ocr.schema import Address, Company, Invoice, InvoiceItem
+
+ADDRESS = Address(
+    address_line1="789 Elm St",
+    address_line2="Apt 5B",
+    city="Toronto",
+    province="ON",
+    postal_code="M5A 1A1",
+)
+
+TAKEN_COMPANY_ID = "TAKN1"
+
+TAKEN_ITEM_SKU = "TAKN1"
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def company_response(info: AgentInfo, company_id: str) -> ModelResponse:
+    company = Company(
+        company_id=company_id,
+        company_name=f"Company {company_id}",
+        address_billing=ADDRESS,
+        phone_number="+1-555-123-4567",
+        email=f"info@{company_id.lower()}.com",
+        website=f"https://{company_id.lower()}.com",
+    )
+    tool_call = ToolCallPart.from_raw_args(info.result_tools[0].name, company.model_dump())
+    return ModelResponse(parts=[tool_call])
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(gen, "BACKOFF_BASE", 0)
+
+
+def run(model: FunctionModel, quantity: int, concurrency: int) -> list[Company]:
+    deps = gen.CompanyDeps(company_ids={TAKEN_COMPANY_ID})
+    with gen.get_company_agent().override(model=model):
+        return asyncio.run(
+            gen.create_companies(quantity=quantity, concurrency=concurrency, deps=deps)
+        )
+
+
+def test_create_companies_concurrency():
+    quantity = 8
+    concurrency = 3
+    calls = 0
+    in_flight = 0
+    max_in_flight = 0
+
+    async def respond(messages, info: AgentInfo) -> ModelResponse:
+        nonlocal calls, in_flight, max_in_flight
+        calls += 1
+        company_id = f"ABCD{calls % 10}"
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return company_response(info, company_id)
+
+    companies = run(FunctionModel(respond), quantity=quantity, concurrency=concurrency)
+
+    assert len(companies) == quantity
+    assert max_in_flight == concurrency
+
+
+def test_create_companies_unique_ids():
+    company_ids = iter([TAKEN_COMPANY_ID, "ABCD1", "ABCD1", "ABCD1", "ABCD2"])
+    prompts = []
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        prompts.append(messages[-1].parts[-1].content)
+        return company_response(info, next(company_ids))
+
+    companies = run(FunctionModel(respond), quantity=2, concurrency=2)
+
+    assert sorted(company.company_id for company in companies) == ["ABCD1", "ABCD2"]
+    assert TAKEN_COMPANY_ID not in prompts[0]
+    assert any(TAKEN_COMPANY_ID in prompt for prompt in prompts[1:])
+
+
+def test_create_companies_backoff():
+    errors = iter([RateLimitError("rate limited"), RateLimitError("rate limited")])
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        error = next(errors, None)
+        if error:
+            raise error
+        return company_response(info, "ABCD1")
+
+    companies = run(FunctionModel(respond), quantity=1, concurrency=1)
+
+    assert [company.company_id for company in companies] == ["ABCD1"]
+
+
+def test_create_companies_gives_up():
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        raise ValueError("invalid API key")
+
+    assert run(FunctionModel(respond), quantity=2, concurrency=2) == []
+
+
+def test_create_invoice_items_unique_skus():
+    responses = iter([["ABCD1", TAKEN_ITEM_SKU, "ABCD1"], ["ABCD2", "ABCD3"]])
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        invoice_items = [
+            InvoiceItem(item_sku=item_sku, item_info=f"Item {item_sku}", quantity=1, unit_price=1.0)
+            for item_sku in next(responses)
+        ]
+        args = {"response": [invoice_item.model_dump() for invoice_item in invoice_items]}
+        return ModelResponse(parts=[ToolCallPart.from_raw_args(info.result_tools[0].name, args)])
+
+    deps = gen.InvoiceItemsDeps(item_skus={TAKEN_ITEM_SKU})
+    with gen.get_invoice_agent().override(model=FunctionModel(respond)):
+        invoice_items = gen.create_invoice_items(quantity=3, deps=deps)
+
+    assert [invoice_item.item_sku for invoice_item in invoice_items] == ["ABCD1", "ABCD2", "ABCD3"]
+
+
+def test_create_pdf_invoice_shares_stylesheet(monkeypatch):
+    try:
+        weasyprint = pytest.importorskip("weasyprint")
+    except OSError as error:
+        pytest.skip(f"WeasyPrint cannot load its system libraries: {error}")
+
+    calls = []
+    render = weasyprint.HTML.render
+
+    def spy(self, *args, **kwargs):
+        calls.append(kwargs)
+        return render(self, *args, **kwargs)
+
+    monkeypatch.setattr(weasyprint.HTML, "render", spy)
+    supplier, customer = synthetic.generate_companies(quantity=2, seed=1)
+    invoice = Invoice(
+        invoice_number="INV-1000",
+        supplier=supplier,
+        customer=customer,
+        line_items=list(synthetic.generate_invoice_items(quantity=3, seed=1)),
+    )
+
+    pdfs = [gen.create_pdf_invoice(invoice) for _ in range(2)]
+    assert all(pdf.startswith(b"%PDF") for pdf in pdfs)
+    assert [call["stylesheets"] for call in calls] == [[gen.get_invoice_stylesheet()]] * 2
+    assert all(call["font_config"] is gen.get_font_config() for call in calls)
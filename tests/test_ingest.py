@@ -0,0 +1,54 @@
+import hashlib
+
+import pytest
+
+from invoice_ocr.db import get_pool
+from invoice_ocr.ingest import HASH_CHUNK_SIZE, file_sha256, find_files, ingest_files
+
+CONTENTS = {
+    "a.pdf": b"%PDF-1.7 first",
+    "b/c.PNG": b"\x89PNG second",
+    "b/d.pdf": b"%PDF-1.7 first",
+    "b/e.txt": b"not an invoice",
+}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    for name, content in CONTENTS.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return tmp_path
+
+
+def test_file_sha256(tmp_path):
+    content = b"x" * (HASH_CHUNK_SIZE * 2 + 1)
+    path = tmp_path / "large.pdf"
+    path.write_bytes(content)
+    assert file_sha256(path) == hashlib.sha256(content).hexdigest()
+
+
+def test_find_files(archive):
+    files = [path.relative_to(archive).as_posix() for path in find_files(archive)]
+    assert files == ["a.pdf", "b/c.PNG", "b/d.pdf"]
+    assert list(find_files(archive / "a.pdf")) == [archive / "a.pdf"]
+
+
+@pytest.mark.db
+def test_ingest_files(archive):
+    try:
+        file_ids = ingest_files(archive, batch_size=2, workers=2)
+        assert all(isinstance(file_id, int) for file_id in file_ids[:2])
+        assert file_ids[2] is None
+
+        (archive / "f.pdf").write_bytes(b"%PDF-1.7 third")
+        file_ids = ingest_files(archive)
+        assert file_ids[0] is None
+        assert isinstance(file_ids[1], int)
+        assert file_ids[2:] == [None, None]
+    finally:
+        with get_pool().connection() as conn:
+            conn.execute(
+                "DELETE FROM invoices WHERE file_origin LIKE %s", (f"{archive.resolve()}%",)
+            )
@@ -0,0 +1,91 @@
+import json
+import warnings
+from datetime import datetime
+
+import pytest
+
+from invoice_ocr.labels import (
+    JsonlLabelWriter,
+    ParquetLabelWriter,
+    get_label_writer,
+    invoice_row,
+)
+from invoice_ocr.schema import Invoice
+from invoice_ocr.synthetic import generate_companies, generate_invoice_items
+
+SUPPLIER, CUSTOMER = generate_companies(2, seed=1)
+
+INVOICES = [
+    Invoice(
+        invoice_number=f"TEST-{number}",
+        issue_date=datetime(2025, 1, 1),
+        due_date=datetime(2025, 1, 31),
+        supplier=SUPPLIER,
+        customer=CUSTOMER,
+        line_items=list(generate_invoice_items(number + 1, seed=number)),
+    )
+    for number in range(5)
+]
+
+LINE_ITEM_COUNT = sum(len(invoice.line_items) for invoice in INVOICES)
+
+
+def test_invoice_row():
+    row = invoice_row(INVOICES[1], file="TEST-1.pdf", archive=None)
+
+    assert row["line_item_count"] == len(INVOICES[1].line_items)
+    assert row["supplier_company_id"] == SUPPLIER.company_id
+    assert row["customer_city"] == CUSTOMER.address_billing.city
+    assert row["total"] == INVOICES[1].total
+    assert row["payment_terms"] == 30  # noqa: PLR2004
+
+
+def test_invoice_payment_terms_serialize():
+    # payment_terms is a number of days, a datetime field would warn on every dump
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        data = INVOICES[0].model_dump_json()
+    assert Invoice.model_validate_json(data).payment_terms == INVOICES[0].payment_terms
+
+
+def test_jsonl_label_writer(tmp_path):
+    with JsonlLabelWriter(output_dir=tmp_path, batch_size=2) as writer:
+        for invoice in INVOICES:
+            writer.write(invoice, file=f"{invoice.invoice_number}.pdf")
+
+    rows = [json.loads(line) for line in (tmp_path / "invoices.jsonl").read_text().splitlines()]
+    assert [row["invoice_number"] for row in rows] == [
+        invoice.invoice_number for invoice in INVOICES
+    ]
+    assert rows[0]["issue_date"] == "2025-01-01 00:00:00"
+    assert len((tmp_path / "line_items.jsonl").read_text().splitlines()) == LINE_ITEM_COUNT
+
+
+def test_parquet_label_writer(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    with ParquetLabelWriter(output_dir=tmp_path, batch_size=2) as writer:
+        for invoice in INVOICES:
+            writer.write(invoice, file=f"{invoice.invoice_number}.pdf", archive="invoices.tar")
+
+    invoices = pq.ParquetFile(tmp_path / "invoices.parquet")
+    assert invoices.metadata.num_row_groups == len(INVOICES) // 2 + 1
+    table = invoices.read(columns=["invoice_number", "issue_date", "currency", "total"])
+    assert table["invoice_number"].to_pylist() == [invoice.invoice_number for invoice in INVOICES]
+    assert table["issue_date"][0].as_py() == datetime(2025, 1, 1)
+    assert table["total"].to_pylist() == [invoice.total for invoice in INVOICES]
+
+    line_items = pq.read_table(tmp_path / "line_items.parquet")
+    assert line_items.num_rows == LINE_ITEM_COUNT
+    assert line_items["position"].to_pylist()[:3] == [1, 1, 2]
+
+
+def test_get_label_writer_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setitem(__import__("sys").modules, "pyarrow", None)
+    monkeypatch.setitem(__import__("sys").modules, "pyarrow.parquet", None)
+
+    with get_label_writer(output_dir=tmp_path, label_format="parquet") as writer:
+        assert isinstance(writer, JsonlLabelWriter)
+
+    with pytest.raises(ValueError, match="Unknown"):
+        get_label_writer(output_dir=tmp_path, label_format="csv")
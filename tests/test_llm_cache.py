@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from invoice_ocr import generate as gen
+from invoice_ocr.llm_cache import LLMCache, LLMCacheMissError
+from invoice_ocr.schema import Address, Company
+
+KEY_ARGS = {"model": "model", "system_prompt": "system", "user_prompt": "user", "schema": {}}
+
+
+def company_response(info: AgentInfo, company_id: str) -> ModelResponse:
+    company = Company(
+        company_id=company_id,
+        company_name=f"Company {company_id}",
+        address_billing=Address(
+            address_line1="12 Cache St",
+            address_line2="Unit 1",
+            city="Toronto",
+            province="ON",
+            postal_code="M5A 1A1",
+        ),
+        phone_number="+1-555-123-4567",
+        email=f"info@{company_id.lower()}.com",
+        website=f"https://{company_id.lower()}.com",
+    )
+    tool_call = ToolCallPart.from_raw_args(info.result_tools[0].name, company.model_dump())
+    return ModelResponse(parts=[tool_call])
+
+
+@pytest.fixture
+def llm_cache(tmp_path):
+    llm_cache = LLMCache(path=tmp_path / "llm.sqlite", max_bytes=1024)
+    yield llm_cache
+    llm_cache.close()
+
+
+def test_cache_key():
+    key = LLMCache.cache_key(**KEY_ARGS)
+    assert key == LLMCache.cache_key(**KEY_ARGS)
+    assert key != LLMCache.cache_key(**KEY_ARGS, variant="1")
+    assert key != LLMCache.cache_key(**{**KEY_ARGS, "schema": {"type": "object"}})
+
+
+def test_get_put(llm_cache):
+    assert llm_cache.get("key") is None
+    llm_cache.put(key="key", model="model", value='{"a": 1}')
+    assert llm_cache.get("key") == '{"a": 1}'
+    assert (llm_cache.hits, llm_cache.misses) == (1, 1)
+
+
+def test_replay_miss(llm_cache):
+    llm_cache.replay = True
+    with pytest.raises(LLMCacheMissError):
+        llm_cache.get("key")
+
+
+def test_eviction(llm_cache):
+    value = "x" * 400
+    for key in ("a", "b", "c"):
+        llm_cache.put(key=key, model="model", value=value)
+
+    assert llm_cache.get("a") is None
+    assert llm_cache.get("b") == value
+    assert llm_cache.get("c") == value
+
+
+def test_eviction_target(llm_cache):
+    for key in range(10):
+        llm_cache.put(key=str(key), model="model", value="x" * 100)
+    assert llm_cache.size == 1000  # noqa: PLR2004
+
+    # Over the 1024 bytes limit, evicts down to 90% of it, so the next write fits
+    llm_cache.put(key="10", model="model", value="x" * 100)
+    assert llm_cache.size == 900  # noqa: PLR2004
+    assert llm_cache.get("0") is None
+    assert llm_cache.get("1") is None
+    assert llm_cache.get("2") is not None
+
+    llm_cache.put(key="11", model="model", value="x" * 100)
+    assert llm_cache.get("3") is not None
+
+
+def test_create_companies_cached(monkeypatch, llm_cache):
+    calls = 0
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        nonlocal calls
+        calls += 1
+        return company_response(info, f"ABCD{calls}")
+
+    def create_companies() -> list[str]:
+        deps = gen.CompanyDeps(company_ids=set())
+        companies = asyncio.run(gen.create_companies(quantity=2, concurrency=1, deps=deps))
+        return [company.company_id for company in companies]
+
+    monkeypatch.setattr(gen, "get_llm_cache", lambda: llm_cache)
+    llm_cache.max_bytes = 1024 * 1024
+
+    with gen.get_company_agent().override(model=FunctionModel(respond)):
+        company_ids = create_companies()
+        assert calls == len(company_ids)
+
+        llm_cache.replay = True
+        assert create_companies() == company_ids
+        assert calls == len(company_ids)
@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+import pytest
+
+from invoice_ocr.money import batch_totals, from_cents, tax_cents, to_cents, to_money
+from invoice_ocr.schema import Invoice, InvoiceItem
+from invoice_ocr.synthetic import generate_companies, generate_invoice_items
+
+SUPPLIER, CUSTOMER = generate_companies(2, seed=1)
+
+
+def test_to_money():
+    assert to_money(19.99) == Decimal("19.99")
+    assert to_money(0.1 + 0.2) == Decimal("0.30")
+    assert to_money("2.675") == Decimal("2.68")
+    assert to_money(-2.675) == Decimal("-2.68")
+    assert to_money(7) == Decimal("7.00")
+
+
+def test_cents():
+    assert to_cents(Decimal("19.99")) == 1999  # noqa: PLR2004
+    assert from_cents(1999) == Decimal("19.99")
+    assert from_cents(-5) == Decimal("-0.05")
+
+
+def test_tax_cents_rounds_half_up():
+    assert tax_cents(35, 13) == 5  # 4.55 cents  # noqa: PLR2004
+    assert tax_cents(50, 13) == 7  # 6.5 cents  # noqa: PLR2004
+    assert tax_cents(-50, 13) == -7  # noqa: PLR2004
+    assert tax_cents(0, 13) == 0
+
+
+def test_invoice_totals_are_exact():
+    items = [
+        InvoiceItem(item_sku="ABCD1", item_info="Cable", quantity=3, unit_price=0.1),
+        InvoiceItem(item_sku="ABCD2", item_info="Plug", quantity=1, unit_price="0.05"),
+    ]
+    invoice = Invoice(
+        invoice_number="TEST-1", supplier=SUPPLIER, customer=CUSTOMER, line_items=items
+    )
+
+    assert items[0].total_price == Decimal("0.30")
+    assert invoice.subtotal == Decimal("0.35")
+    assert invoice.tax_total == Decimal("0.05")
+    assert invoice.total == Decimal("0.40")
+    assert Invoice.model_validate_json(invoice.model_dump_json()) == invoice
+
+
+def test_batch_totals_match_invoices():
+    np = pytest.importorskip("numpy")
+
+    invoices = [
+        Invoice(
+            invoice_number=f"TEST-{number}",
+            supplier=SUPPLIER,
+            customer=CUSTOMER,
+            line_items=list(generate_invoice_items(number % 4, seed=number)),
+            tax_rate=number % 20,
+        )
+        for number in range(50)
+    ]
+    lines = [(index, item) for index, invoice in enumerate(invoices) for item in invoice.line_items]
+
+    subtotals, taxes, totals = batch_totals(
+        invoice_index=np.array([index for index, _ in lines]),
+        quantities=np.array([item.quantity for _, item in lines]),
+        unit_price_cents=np.array([to_cents(item.unit_price) for _, item in lines]),
+        tax_rates=np.array([invoice.tax_rate for invoice in invoices]),
+    )
+
+    assert subtotals.tolist() == [to_cents(invoice.subtotal) for invoice in invoices]
+    assert taxes.tolist() == [to_cents(invoice.tax_total) for invoice in invoices]
+    assert totals.tolist() == [to_cents(invoice.total) for invoice in invoices]
@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import pypdfium2
+import pytest
+from PIL import Image
+
+from invoice_ocr import db
+from invoice_ocr.blobs import get_invoice_preview
+from invoice_ocr.db import get_pool
+from invoice_ocr.ingest import ingest_files
+from invoice_ocr.rasterize import rasterize_invoices, render_webp
+from invoice_ocr.settings import WEBP_MAX_SIZE
+
+MAX_SIZE = 200
+
+
+@pytest.fixture
+def archive(tmp_path):
+    pdf = pypdfium2.PdfDocument.new()
+    pdf.new_page(612, 792)
+    pdf.save(tmp_path / "letter.pdf")
+    pdf.close()
+
+    Image.new("L", (1000, 500), color=128).save(tmp_path / "scan.png")
+    (tmp_path / "broken.pdf").write_bytes(b"%PDF-1.7 truncated")
+    return tmp_path
+
+
+def webp_size(webp: bytes) -> tuple[int, int]:
+    image = Image.open(BytesIO(webp))
+    assert image.format == "WEBP"
+    return image.size
+
+
+def test_render_webp_pdf(archive):
+    width, height = webp_size(render_webp(archive / "letter.pdf", "application/pdf", MAX_SIZE))
+    assert height == MAX_SIZE
+    assert width < MAX_SIZE
+
+
+def test_render_webp_image(archive):
+    webp = render_webp(archive / "scan.png", "image/png", MAX_SIZE)
+    assert webp_size(webp) == (MAX_SIZE, MAX_SIZE // 2)
+
+
+@pytest.mark.db
+def test_rasterize_invoices(archive):
+    try:
+        ingest_files(archive)
+        stored, failed = rasterize_invoices(batch_size=1)
+        assert stored >= 2  # noqa: PLR2004
+        assert failed >= 1
+
+        with get_pool().connection() as conn:
+            rows = conn.execute(
+                "SELECT file_origin, id FROM invoices WHERE file_origin LIKE %s",
+                (f"{archive.resolve()}%",),
+            ).fetchall()
+        previews = {origin.rsplit("/", 1)[-1]: get_invoice_preview(id_) for origin, id_ in rows}
+        assert previews["broken.pdf"] is None
+        assert webp_size(previews["letter.pdf"])[1] == WEBP_MAX_SIZE
+        assert webp_size(previews["scan.png"]) == (1000, 500)
+    finally:
+        with get_pool().connection() as conn:
+            conn.execute(
+                "DELETE FROM blobs WHERE sha256 IN (SELECT file_webp_sha256 FROM invoices "
+                "WHERE file_origin LIKE %s)",
+                (f"{archive.resolve()}%",),
+            )
+            conn.execute(
+                "DELETE FROM invoices WHERE file_origin LIKE %s", (f"{archive.resolve()}%",)
+            )
+
+
+@pytest.mark.db
+def test_rasterize_invoices_update_fails(archive, monkeypatch):
+    keys = []
+    monkeypatch.setattr(db, "set_invoice_webps", lambda webps: keys.extend(webps.values()) or 0)
+    try:
+        ingest_files(archive)
+        stored, failed = rasterize_invoices(batch_size=1)
+        assert stored == 0
+        assert failed >= 3  # noqa: PLR2004
+    finally:
+        with get_pool().connection() as conn:
+            conn.execute("DELETE FROM blobs WHERE sha256 = ANY(%s)", (keys,))
+            conn.execute(
+                "DELETE FROM invoices WHERE file_origin LIKE %s", (f"{archive.resolve()}%",)
+            )
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+import time
+
+STARTUP_BUDGET = 1.0
+"""Seconds allowed for ``invoice_ocr --help``, including interpreter startup"""
+
+DEFERRED_MODULES = [
+    "google.auth",
+    "invoice_ocr.db",
+    "invoice_ocr.generate",
+    "jinja2",
+    "logfire",
+    "psycopg",
+    "pydantic_ai",
+    "weasyprint",
+]
+
+
+def test_import_defers_heavy_modules():
+    code = f"import sys, invoice_ocr; print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_help_startup_budget():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-m", "invoice_ocr", "--help"], capture_output=True, text=True, check=True
+    )
+    elapsed = time.perf_counter() - start
+
+    assert "invoice" in result.stdout
+    assert elapsed < STARTUP_BUDGET
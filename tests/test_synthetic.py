@@ -0,0 +1,100 @@
+from itertools import islice
+from random import Random
+
+import pytest
+
+from invoice_ocr.db import (
+    add_company_rows,
+    add_invoice_item_rows,
+    company_row,
+    get_company,
+    get_company_ids,
+    get_invoice_item,
+    get_invoice_item_skus,
+    get_pool,
+    invoice_item_row,
+)
+from invoice_ocr.schema import Company, InvoiceItem
+from invoice_ocr.synthetic import (
+    ID_SPACE,
+    company_rows,
+    generate_companies,
+    generate_invoice_items,
+    invoice_item_rows,
+    unique_ids,
+)
+
+QUANTITY = 1000
+
+
+def test_generate_companies():
+    companies = list(generate_companies(quantity=QUANTITY, seed=42))
+    assert len(companies) == QUANTITY
+    assert len({company.company_id for company in companies}) == QUANTITY
+    assert all(Company.model_validate(company.model_dump()) == company for company in companies)
+    assert companies == list(generate_companies(quantity=QUANTITY, seed=42))
+    assert companies != list(generate_companies(quantity=QUANTITY, seed=43))
+
+
+def test_generate_companies_taken_ids():
+    company_ids = [company.company_id for company in generate_companies(quantity=10, seed=42)]
+    companies = generate_companies(quantity=10, seed=42, taken_ids=set(company_ids[:5]))
+    assert [company.company_id for company in companies][:5] == company_ids[5:]
+
+
+def test_generate_invoice_items():
+    invoice_items = list(generate_invoice_items(quantity=QUANTITY, seed=42))
+    assert len({invoice_item.item_sku for invoice_item in invoice_items}) == QUANTITY
+    assert all(
+        InvoiceItem.model_validate(invoice_item.model_dump()) == invoice_item
+        for invoice_item in invoice_items
+    )
+    assert invoice_items == list(generate_invoice_items(quantity=QUANTITY, seed=42))
+
+
+def test_rows_match_models():
+    companies = generate_companies(quantity=QUANTITY, seed=42)
+    assert list(company_rows(quantity=QUANTITY, seed=42)) == list(map(company_row, companies))
+
+    invoice_items = generate_invoice_items(quantity=QUANTITY, seed=42)
+    assert list(invoice_item_rows(quantity=QUANTITY, seed=42)) == list(
+        map(invoice_item_row, invoice_items)
+    )
+
+
+@pytest.mark.db
+def test_add_rows_round_trip():
+    taken_ids = get_company_ids()
+    companies = list(generate_companies(quantity=3, seed=7, taken_ids=taken_ids))
+    taken_skus = get_invoice_item_skus()
+    invoice_items = list(generate_invoice_items(quantity=3, seed=7, taken_skus=taken_skus))
+    try:
+        company_ids = add_company_rows(company_rows(quantity=3, seed=7, taken_ids=taken_ids))
+        assert all(isinstance(company_id, int) for company_id in company_ids)
+        assert [get_company(company.company_id) for company in companies] == companies
+
+        item_ids = add_invoice_item_rows(
+            invoice_item_rows(quantity=3, seed=7, taken_skus=taken_skus)
+        )
+        assert all(isinstance(item_id, int) for item_id in item_ids)
+        assert [get_invoice_item(item.item_sku) for item in invoice_items] == invoice_items
+    finally:
+        with get_pool().connection() as conn:
+            addresses = conn.execute(
+                "DELETE FROM companies WHERE company_id = ANY(%s) "
+                "RETURNING address_billing, address_shipping",
+                ([company.company_id for company in companies],),
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM postal_addresses WHERE id = ANY(%s)",
+                ([address_id for row in addresses for address_id in row],),
+            )
+            conn.execute(
+                "DELETE FROM invoice_items WHERE item_sku = ANY(%s)",
+                ([item.item_sku for item in invoice_items],),
+            )
+
+
+def test_unique_ids():
+    ids = list(islice(unique_ids(Random(42)), ID_SPACE // 100))
+    assert len(set(ids)) == len(ids)
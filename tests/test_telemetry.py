@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from invoice_ocr import telemetry
+
+
+@pytest.fixture(autouse=True)
+def no_profile():
+    yield
+    telemetry.enable_profile(False)
+
+
+def test_stage_noop_when_disabled(monkeypatch):
+    monkeypatch.setattr(telemetry, "TELEMETRY", False)
+
+    with telemetry.stage("render.layout", table="companies") as span:
+        span.add(items=1, nbytes=10)
+
+    assert span is telemetry.NOOP_STAGE
+
+
+def test_stage_profile(monkeypatch):
+    monkeypatch.setattr(telemetry, "TELEMETRY", False)
+    telemetry.enable_profile()
+
+    for _ in range(3):
+        with telemetry.stage("pdf.write") as span:
+            span.add(items=1, nbytes=1000)
+
+    async def sample():
+        async with telemetry.stage("db.sample", table="companies") as span:
+            span.add(items=200)
+
+    asyncio.run(sample())
+
+    profile = telemetry.take_profile()
+    assert [profile["pdf.write"][0], *profile["pdf.write"][2:]] == [3, 3, 3000]
+    assert [profile["db.sample"][0], profile["db.sample"][2]] == [1, 200]
+    assert telemetry.take_profile() == {}
+
+
+def test_stage_span_and_metrics():
+    telemetry.enable_profile()
+
+    with telemetry.stage("llm.call", model="test") as span:
+        span.add(items=1, tokens=42)
+
+    assert telemetry.take_profile()["llm.call"][0] == 1
+
+
+def test_merge_and_format_profile():
+    telemetry.enable_profile()
+    telemetry.merge_profile({"render.layout": [2, 0.5, 2, 0]})
+    telemetry.merge_profile({"render.layout": [1, 0.25, 1, 0], "render.pdf": [3, 0.1, 3, 3e6]})
+    telemetry.record_pool_stats({"requests_num": 4, "requests_wait_ms": 20})
+
+    lines = telemetry.format_profile().splitlines()
+
+    assert [line.split()[0] for line in lines] == [
+        "Stage",
+        "render.layout",
+        "render.pdf",
+        "db.pool_wait",
+    ]
+    assert lines[1].split()[1:4] == ["3", "0.750", "250.000"]
+    assert lines[2].split()[-1] == "3.00"